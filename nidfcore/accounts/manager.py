@@ -1,4 +1,10 @@
+import unicodedata
+
 from django.contrib.auth.models import BaseUserManager
+from django.db import models
+from django.db.models import Count, F, OuterRef, Subquery
+
+from nidfcore.utils.constants import ApplicationStatus
 
 
 class AccountManager(BaseUserManager):
@@ -43,3 +49,59 @@ class AccountManager(BaseUserManager):
         user.is_superuser = True
         user.save(using=self._db)
         return user
+
+
+def make_search_key(value: str) -> str:
+    '''Case-folds a name for prefix matching (accents dropped, whitespace collapsed)'''
+    decomposed = unicodedata.normalize('NFKD', value or '')
+    return ' '.join(''.join(char for char in decomposed if not unicodedata.combining(char)).casefold().split())
+
+
+class PrefixQuerySetMixin:
+    '''Prefix lookups on the indexed `search_key` column'''
+
+    def prefix(self, text: str):
+        '''Filters the rows whose name starts with a text, as a range scan of the search_key index'''
+        key = make_search_key(text)
+        return self.filter(search_key__gte=key, search_key__lt=key + '\U0010ffff')
+
+
+class ChurchQuerySet(PrefixQuerySetMixin, models.QuerySet):
+    '''Queryset helpers for churches'''
+
+    def with_repayment_status(self):
+        '''
+        Annotates the fields read by Church.get_repayment_status (no extra query per church).
+        Each date is a correlated subquery: joining repayments and installments in one GROUP BY
+        would scan repayments x installments rows per church.
+        '''
+        from apis.models import Application, Repayment, RepaymentInstallment
+        payments = Repayment.objects.filter(
+            application__church=OuterRef('pk'), application__status=ApplicationStatus.APPROVED.value,
+        ).exclude(status=ApplicationStatus.REJECTED.value)
+        applications = Application.objects.filter(church=OuterRef('pk'))
+        installments = RepaymentInstallment.objects.filter(application__church=OuterRef('pk'), amount_allocated__lt=F('amount_due'))
+        return self.annotate(
+            last_payment_date=Subquery(payments.order_by('-date_paid').values('date_paid')[:1]),
+            last_application_date=Subquery(applications.order_by('-created_at').values('created_at')[:1]),
+            next_installment_date=Subquery(installments.order_by('due_date').values('due_date')[:1]),
+        )
+
+
+class RegionQuerySet(PrefixQuerySetMixin, models.QuerySet):
+    '''Queryset helpers for regions'''
+
+    def with_counts(self):
+        '''Annotates the counts read by Region.districts and Region.churches (no extra query per region)'''
+        return self.annotate(
+            districts_count=Count('district', distinct=True),
+            churches_count=Count('district__church', distinct=True),
+        )
+
+
+class DistrictQuerySet(PrefixQuerySetMixin, models.QuerySet):
+    '''Queryset helpers for districts'''
+
+    def with_counts(self):
+        '''Annotates the count read by District.churches (no extra query per district)'''
+        return self.annotate(churches_count=Count('church'))
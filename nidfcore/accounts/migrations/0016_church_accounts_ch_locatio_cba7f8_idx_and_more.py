@@ -0,0 +1,22 @@
+# Generated by Django 5.1.5 on 2026-10-18 12:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0015_alter_district_email_alter_district_overseer_email_and_more'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='church',
+            index=models.Index(fields=['location_name', 'id'], name='accounts_ch_locatio_cba7f8_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['created_at', 'id'], name='accounts_us_created_0cb2a9_idx'),
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 5.1.5 on 2026-10-18 13:09
+
+import unicodedata
+
+from django.db import migrations, models
+
+
+def make_search_key(value: str) -> str:
+    '''Frozen copy of accounts.manager.make_search_key as of this migration'''
+    decomposed = unicodedata.normalize('NFKD', value or '')
+    return ' '.join(''.join(char for char in decomposed if not unicodedata.combining(char)).casefold().split())
+
+
+def populate_search_keys(apps, schema_editor):
+    '''Fill the search keys of the existing churches, districts and regions'''
+    for model_name, source in (('Church', 'location_name'), ('District', 'name'), ('Region', 'name')):
+        Model = apps.get_model('accounts', model_name)
+        rows = list(Model.objects.only('pk', source))
+        for row in rows:
+            row.search_key = make_search_key(getattr(row, source))
+        Model.objects.bulk_update(rows, ['search_key'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0016_church_accounts_ch_locatio_cba7f8_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='church',
+            name='search_key',
+            field=models.CharField(default='', editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='district',
+            name='search_key',
+            field=models.CharField(default='', editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='region',
+            name='search_key',
+            field=models.CharField(default='', editable=False, max_length=255),
+        ),
+        migrations.RunPython(populate_search_keys, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='church',
+            index=models.Index(fields=['search_key', 'id'], name='accounts_ch_search__c03cfc_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='district',
+            index=models.Index(fields=['search_key', 'id'], name='accounts_di_search__90497d_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='region',
+            index=models.Index(fields=['search_key', 'id'], name='accounts_re_search__dddcf0_idx'),
+        ),
+    ]
@@ -12,9 +12,10 @@ from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin
 from django.db import models
 from django.utils import timezone
 
-from nidfcore.utils.constants import ApplicationStatus, ChurchType, UserType
+from nidfcore.utils.constants import ChurchType, UserType
 
-from .manager import AccountManager
+from .manager import (AccountManager, ChurchQuerySet, DistrictQuerySet,
+                      RegionQuerySet, make_search_key)
 
 
 class User(AbstractBaseUser, PermissionsMixin):
@@ -42,6 +43,12 @@ class User(AbstractBaseUser, PermissionsMixin):
     USERNAME_FIELD = 'phone'
     REQUIRED_FIELDS = ['name', 'email']
 
+    class Meta:
+        indexes = [
+            # keyset pagination
+            models.Index(fields=['created_at', 'id']),
+        ]
+
     def get_church_logo(self) -> str:
         '''Returns the church logo'''
         if self.church_profile and self.church_profile.church_logo:
@@ -64,16 +71,32 @@ class OTP(models.Model):
     
     def send_otp(self) -> None:
         '''Send the OTP to the user'''
-        from nidfcore.utils.services import send_sms
+        from apis.models import SmsOutbox
         message = f"Welcome to the DL NIDF Ghana platform.\n\nYour OTP is {self.otp}.\n\nPlease do not share this with anyone."
-        send_sms(message, [self.phone])
+        SmsOutbox.queue(message, [self.phone])
 
 
     def __str__(self):
         return self.phone + ' - ' + str(self.otp)
 
 
-class Church(models.Model):
+class SearchKeyModel(models.Model):
+    '''Keeps a case-folded copy of a name column in `search_key` for prefix autocomplete'''
+    search_key = models.CharField(max_length=255, default='', editable=False)
+
+    search_key_source = 'name'
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        self.search_key = make_search_key(getattr(self, self.search_key_source))
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'search_key'}
+        super().save(*args, **kwargs)
+
+
+class Church(SearchKeyModel):
     '''Church profile model'''
     location_name = models.CharField(max_length=255) # location/name of the church
     location_address = models.TextField() # physical location address of the church
@@ -103,54 +126,87 @@ class Church(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     created_by = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
 
+    objects = ChurchQuerySet.as_manager()
+
+    search_key_source = 'location_name'
+
+    class Meta:
+        indexes = [
+            # keyset pagination
+            models.Index(fields=['location_name', 'id']),
+            # autocomplete
+            models.Index(fields=['search_key', 'id']),
+        ]
+
+
+    def get_ledger(self) -> any:
+        '''Returns the ledger row of the church (None if nothing was disbursed or repaid yet)'''
+        from apis.models import ChurchLedger
+        return ChurchLedger.objects.filter(church=self).first()
 
     def get_amount_received(self) -> float:
         '''Returns the total amount received by the church in the form of disbursements'''
-        return sum([app.get_disbursed_amount() for app in self.application_set.all()])
+        ledger = self.get_ledger()
+        return ledger.disbursed if ledger else 0
     
     def get_amount_repaid(self) -> float:
-        '''Returns the total amount repaid by the church in the form of repayments'''
-        return sum([app.get_repayment_amount() for app in self.application_set.all() if app.status == ApplicationStatus.APPROVED.value])
+        '''Returns the total amount repaid by the church in the form of verified repayments'''
+        ledger = self.get_ledger()
+        return ledger.repaid if ledger else 0
     
     def get_arrears(self) -> float:
         '''Returns the total arrears of the church'''
-        return self.get_amount_received() - self.get_amount_repaid()
+        ledger = self.get_ledger()
+        return ledger.outstanding if ledger else 0
     
     def get_repaid_percentage(self) -> float:
         '''Returns the percentage of the total amount received that has been repaid'''
-        total_received = self.get_amount_received()
-        total_repaid = self.get_amount_repaid()
-        if total_received == 0:
+        ledger = self.get_ledger()
+        if ledger is None or ledger.disbursed == 0:
             return 0
-        return (total_repaid / total_received) * 100
+        return (ledger.repaid / ledger.disbursed) * 100
     
+    def get_repayment_status(self) -> dict:
+        '''
+        Returns the last payment and next due dates of the church across all its approved applications.
+        The next due date is the earliest unpaid installment, or a month after the last payment.
+        Uses the annotations of Church.objects.with_repayment_status() when present,
+        otherwise a single query for them memoized on the instance.
+        '''
+        if not hasattr(self, 'last_payment_date'):
+            dates = Church.objects.with_repayment_status().filter(pk=self.pk).values(
+                'last_payment_date', 'last_application_date', 'next_installment_date',
+            ).first() or {}
+            self.last_payment_date = dates.get('last_payment_date')
+            self.last_application_date = dates.get('last_application_date')
+            self.next_installment_date = dates.get('next_installment_date')
+
+        if self.next_installment_date:
+            # revolving funds are due on their earliest unpaid installment
+            last_payment = self.last_payment_date.strftime('%d/%m/%Y') if self.last_payment_date else "None"
+            next_due_date = self.next_installment_date
+        elif self.last_payment_date:
+            # it should be a month from the last repayment date
+            last_payment = self.last_payment_date.strftime('%d/%m/%Y') # dd/mm/yyyy
+            next_due_date = self.last_payment_date + timedelta(days=30)
+        else:
+            last_payment = "None"
+            next_due_date = (self.last_application_date or timezone.now()) + timedelta(days=30)
+        return {'last_payment': last_payment, 'next_due_date': next_due_date}
+
     def get_last_repayment_date(self) -> any:
         '''Returns the last repayment date'''
-        last_application = self.application_set.all().order_by('-updated_at').first()
-        last_payment = last_application.repayment_set.all().order_by('-date_paid').first() if last_application else None
-        if last_payment:
-            last_payment_date = last_payment.date_paid
-            # convert to string format: dd/mm/yyyy
-            last_payment_date = last_payment_date.strftime('%d/%m/%Y')
-            return last_payment_date
-        return "None"
+        return self.get_repayment_status()['last_payment']
     
     def get_next_due_date(self) -> str:
         '''Returns the next due date for repayment'''
-        # it should be a month from the last repayment date
-        last_application = self.application_set.all().order_by('-updated_at').first()
-        last_payment = last_application.repayment_set.all().order_by('-date_paid').first() if last_application else None
-        if last_payment:
-            last_repayment_date = last_payment.date_paid
-        else:
-            last_repayment_date = last_application.created_at if last_application else timezone.now()
-        return last_repayment_date + timedelta(days=30)
+        return self.get_repayment_status()['next_due_date']
 
     def __str__(self):
         return self.location_name
     
 
-class Region(models.Model):
+class Region(SearchKeyModel):
     '''Region model'''
     name = models.CharField(max_length=255, unique=True)
     location = models.TextField()
@@ -169,15 +225,27 @@ class Region(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     created_by = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
 
+    objects = RegionQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # autocomplete
+            models.Index(fields=['search_key', 'id']),
+        ]
+
     @property
     def districts(self) -> int:
-        '''Returns the districts in the region'''
+        '''Returns the districts in the region (annotated by RegionQuerySet.with_counts when available)'''
+        if hasattr(self, 'districts_count'):
+            return self.districts_count
         districts = District.objects.filter(region=self).count()
         return districts
     
     @property
     def churches(self) -> int:
-        '''Returns the churches in the region'''
+        '''Returns the churches in the region (annotated by RegionQuerySet.with_counts when available)'''
+        if hasattr(self, 'churches_count'):
+            return self.churches_count
         churches = Church.objects.filter(district__region=self).count()
         return churches
     
@@ -192,7 +260,7 @@ class Region(models.Model):
         return self.name
 
 
-class District(models.Model):
+class District(SearchKeyModel):
     '''District model'''
     name = models.CharField(max_length=255)
     location = models.TextField()
@@ -213,9 +281,19 @@ class District(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = DistrictQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # autocomplete
+            models.Index(fields=['search_key', 'id']),
+        ]
+
     @property
     def churches(self) -> int:
-        '''Returns the churches in the district'''
+        '''Returns the churches in the district (annotated by DistrictQuerySet.with_counts when available)'''
+        if hasattr(self, 'churches_count'):
+            return self.churches_count
         churches = Church.objects.filter(district=self).count()
         return churches
     
@@ -35,4 +35,52 @@ class ProgressReportAdmin(admin.ModelAdmin):
 class NotificationAdmin(admin.ModelAdmin):
     list_display = ('title', 'target', 'created_at',)
     list_filter = ('target',)
-    search_fields = ('title',)
\ No newline at end of file
+    search_fields = ('title',)
+
+# sms outbox
+@admin.register(SmsOutbox)
+class SmsOutboxAdmin(admin.ModelAdmin):
+    list_display = ('status', 'attempts', 'next_attempt_at', 'sent_at', 'created_at',)
+    list_filter = ('status',)
+    readonly_fields = ('claimed_by', 'locked_until', 'provider_response', 'last_error',)
+
+@admin.register(SmsDelivery)
+class SmsDeliveryAdmin(admin.ModelAdmin):
+    list_display = ('phone', 'status', 'sent_at', 'delivered_at', 'updated_at',)
+    list_filter = ('status',)
+    search_fields = ('phone', 'provider_id',)
+    raw_id_fields = ('outbox',)
+
+# ledgers
+@admin.register(ApplicationLedger)
+class ApplicationLedgerAdmin(admin.ModelAdmin):
+    list_display = ('application', 'disbursed', 'repaid', 'outstanding', 'updated_at',)
+    search_fields = ('application__application_id',)
+
+@admin.register(ChurchLedger)
+class ChurchLedgerAdmin(admin.ModelAdmin):
+    list_display = ('church', 'disbursed', 'repaid', 'outstanding', 'updated_at',)
+    search_fields = ('church__location_name',)
+
+# rollups
+@admin.register(DistrictRollup)
+class DistrictRollupAdmin(admin.ModelAdmin):
+    list_display = ('district', 'churches', 'approved_applications', 'disbursed', 'repaid', 'arrears', 'updated_at',)
+    search_fields = ('district__name',)
+
+@admin.register(RegionRollup)
+class RegionRollupAdmin(admin.ModelAdmin):
+    list_display = ('region', 'churches', 'approved_applications', 'disbursed', 'repaid', 'arrears', 'updated_at',)
+    search_fields = ('region__name',)
+
+# snapshots
+@admin.register(PortfolioSnapshot)
+class PortfolioSnapshotAdmin(admin.ModelAdmin):
+    list_display = ('date', 'region', 'churches', 'disbursed', 'repaid', 'arrears',)
+    list_filter = ('region',)
+
+# repayment installments
+@admin.register(RepaymentInstallment)
+class RepaymentInstallmentAdmin(admin.ModelAdmin):
+    list_display = ('application', 'number', 'due_date', 'amount_due', 'amount_allocated',)
+    search_fields = ('application__application_id',)
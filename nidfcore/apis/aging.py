@@ -0,0 +1,129 @@
+'''
+This module computes the arrears aging report (current / 30 / 60 / 90+ days).
+Disbursement and repayment facts (paid up to the report date) are loaded once
+as columnar NumPy arrays.
+Verified repayments settle each church's oldest disbursements first (FIFO).
+The unpaid remainder of every disbursement is aged from its payment date and
+summed into buckets per church, district and region with vectorized operations.
+Amounts are handled in integer pesewas to stay exact.
+
+'''
+
+from datetime import date
+
+import numpy as np
+from django.db.models import Sum
+
+from accounts.models import Church, District, Region
+from apis.models import Disbursement, Repayment
+from nidfcore.utils.constants import ApplicationStatus
+
+BUCKETS = ['current', 'days_30', 'days_60', 'days_90_plus']
+BUCKET_EDGES = np.array([30, 60, 90])
+LEVELS = ['church', 'district', 'region']
+
+
+def _pesewas(values) -> np.ndarray:
+    '''Converts a column of decimal amounts to integer pesewas'''
+    return np.rint(np.array(values, dtype=np.float64) * 100).astype(np.int64)
+
+
+def _money(pesewas: int) -> str:
+    '''Formats integer pesewas as a decimal string (e.g. 1234 -> "12.34")'''
+    sign = '-' if pesewas < 0 else ''
+    cedis, rest = divmod(abs(int(pesewas)), 100)
+    return f"{sign}{cedis}.{rest:02d}"
+
+
+def _group(keys: np.ndarray, matrix: np.ndarray, size: int) -> np.ndarray:
+    '''Sums the rows of a (churches x buckets) matrix into `size` groups (keys of -1 are dropped)'''
+    grouped = np.zeros((size, matrix.shape[1]), dtype=np.int64)
+    mask = keys >= 0
+    np.add.at(grouped, keys[mask], matrix[mask])
+    return grouped
+
+
+def compute_aging(as_of: date, region_id: int = None) -> dict:
+    '''Returns the aging buckets (in pesewas) per church, district and region as of a date'''
+    churches = Church.objects.all()
+    districts = District.objects.all()
+    regions = Region.objects.all()
+    # money moved after the report date is left out, as it was not known on that date
+    disbursements = Disbursement.objects.filter(application__church__isnull=False, date_paid__lte=as_of)
+    repayments = Repayment.objects.filter(application__church__isnull=False, status=ApplicationStatus.APPROVED.value, date_paid__lte=as_of)
+    if region_id:
+        churches = churches.filter(district__region_id=region_id)
+        districts = districts.filter(region_id=region_id)
+        regions = regions.filter(pk=region_id)
+        disbursements = disbursements.filter(application__church__district__region_id=region_id)
+        repayments = repayments.filter(application__church__district__region_id=region_id)
+
+    # church dimension
+    church_rows = list(churches.order_by('pk').values_list('pk', 'location_name', 'district_id', 'district__region_id'))
+    church_ids = np.array([row[0] for row in church_rows], dtype=np.int64)
+    districts = dict(districts.values_list('pk', 'name'))
+    regions = dict(regions.values_list('pk', 'name'))
+    district_ids = np.array(sorted(districts), dtype=np.int64)
+    region_ids = np.array(sorted(regions), dtype=np.int64)
+    church_district = np.array([row[2] or -1 for row in church_rows], dtype=np.int64)
+    church_region = np.array([row[3] or -1 for row in church_rows], dtype=np.int64)
+    church_district = np.where(church_district >= 0, np.searchsorted(district_ids, church_district), -1)
+    church_region = np.where(church_region >= 0, np.searchsorted(region_ids, church_region), -1)
+
+    # facts: disbursements ordered oldest first within each church
+    facts = list(disbursements.order_by('application__church_id', 'date_paid', 'pk').values_list('application__church_id', 'date_paid', 'amount'))
+    repaid_rows = list(repayments.values('application__church_id').annotate(total=Sum('amount')).values_list('application__church_id', 'total'))
+
+    matrix = np.zeros((len(church_rows), len(BUCKETS)), dtype=np.int64)
+    if facts and len(church_rows):
+        fact_church_ids, fact_dates, fact_amounts = zip(*facts)
+        fact_church = np.searchsorted(church_ids, np.array(fact_church_ids, dtype=np.int64))
+        age = (np.datetime64(as_of, 'D') - np.array(fact_dates, dtype='datetime64[D]')).astype(np.int64)
+        amount = _pesewas(fact_amounts)
+
+        repaid = np.zeros(len(church_rows), dtype=np.int64)
+        if repaid_rows:
+            repaid_church_ids, repaid_amounts = zip(*repaid_rows)
+            np.add.at(repaid, np.searchsorted(church_ids, np.array(repaid_church_ids, dtype=np.int64)), _pesewas(repaid_amounts))
+
+        # amount disbursed to the church before each disbursement (cumulative sum restarted per church)
+        cumulative = np.cumsum(amount)
+        _, group_start = np.unique(fact_church, return_index=True)
+        group_base = (cumulative - amount)[group_start]
+        group_number = np.cumsum(np.r_[0, np.diff(fact_church) != 0])
+        disbursed_before = cumulative - amount - group_base[group_number]
+
+        # repayments settle the oldest disbursements first
+        settled = np.clip(repaid[fact_church] - disbursed_before, 0, amount)
+        unpaid = amount - settled
+
+        bucket = np.digitize(age, BUCKET_EDGES)
+        np.add.at(matrix, (fact_church, bucket), unpaid)
+
+    return {
+        'church': (church_rows, matrix),
+        'district': ([(pk, districts[pk]) for pk in district_ids.tolist()], _group(church_district, matrix, len(district_ids))),
+        'region': ([(pk, regions[pk]) for pk in region_ids.tolist()], _group(church_region, matrix, len(region_ids))),
+    }
+
+
+def aging_rows(report: dict, level: str, start: int = 0, stop: int = None) -> list:
+    '''Returns a slice of the rows of a level, largest outstanding balance first, with formatted amounts'''
+    rows, matrix = report[level]
+    outstanding = matrix.sum(axis=1)
+    rows_out = []
+    for index in np.argsort(-outstanding, kind='stable')[start:stop].tolist():
+        row = {'id': rows[index][0], 'name': rows[index][1]}
+        if level == 'church':
+            row.update(district=rows[index][2], region=rows[index][3])
+        row.update({bucket: _money(matrix[index, column]) for column, bucket in enumerate(BUCKETS)})
+        row['outstanding'] = _money(outstanding[index])
+        rows_out.append(row)
+    return rows_out
+
+
+def aging_totals(report: dict) -> dict:
+    '''Returns the overall buckets of a report'''
+    _, matrix = report['church']
+    totals = matrix.sum(axis=0)
+    return {**{bucket: _money(totals[column]) for column, bucket in enumerate(BUCKETS)}, 'outstanding': _money(totals.sum())}
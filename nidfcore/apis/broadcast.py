@@ -0,0 +1,141 @@
+'''
+This module fans a notification out to its audience through the SMS outbox.
+Phone numbers are streamed from the database with `values_list(...).iterator()`,
+normalized, deduplicated and cut into SMS_BATCH_SIZE recipient batches. Each batch
+is one SmsOutbox row linked to the notification, so the outbox workers send the
+batches concurrently and keep the gateway response of every batch. The delivery to
+every recipient is recorded (SmsDelivery), so the failed ones can be queued again.
+Rows are inserted in bulk, a few batches at a time, so memory stays flat however
+large the audience is (only the set of numbers already seen grows).
+The audience of a selection target (regions, districts and churches) is resolved
+by audience_phones, a single UNION query that returns distinct numbers, and its
+size is previewed (count_recipients) by counting the very numbers the broadcast
+would queue, once normalized and deduplicated.
+
+'''
+
+from itertools import groupby, islice
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from accounts.models import Church, District, Region, User
+from apis.models import SmsDelivery, SmsOutbox
+from nidfcore.utils.constants import DeliveryStatus, Target
+from nidfcore.utils.services import normalize_phone
+
+CHUNK_SIZE = 2000
+# outbox rows inserted per bulk insert
+FLUSH_EVERY = 20
+
+
+def _phones(queryset, field: str):
+    '''The non-blank values of a phone column'''
+    return queryset.exclude(**{f'{field}__isnull': True}).exclude(**{field: ''}).order_by().values_list(field, flat=True)
+
+
+def audience_phones(regions=(), districts=(), churches=(), church_users=True, pastors=True, managers=False, overseers=False):
+    '''
+    Returns the distinct phone numbers of a selection as one UNION query (stream it with .iterator()).
+    Numbers are distinct as stored: 0244... and 233244... are only merged once normalized (unique_phones).
+    A church is in the selection when it, its district or its region is selected; overseers are those of the selected
+    regions and of the districts in the selection. Selections are ids or querysets (used as subqueries).
+    '''
+    churches_in = Church.objects.filter(
+        Q(pk__in=churches) | Q(district__in=districts) | Q(district__region__in=regions) | Q(region__in=regions)
+    )
+    parts = []
+    if church_users:
+        parts.append(_phones(User.objects.filter(church_profile__in=churches_in, is_active=True, deleted=False).exclude(phone__contains='@'), 'phone'))
+    if pastors:
+        parts.append(_phones(churches_in, 'pastor_phone'))
+    if managers:
+        parts.append(_phones(churches_in, 'manager_phone'))
+    if overseers:
+        parts.append(_phones(District.objects.filter(Q(pk__in=districts) | Q(region__in=regions)), 'overseer_phone'))
+        parts.append(_phones(Region.objects.filter(pk__in=regions), 'overseer_phone'))
+    if not parts:
+        return User.objects.none().values_list('phone', flat=True)
+    first, *rest = parts
+    # UNION (not UNION ALL) removes the duplicates in the database
+    return first.union(*rest) if rest else first.distinct()
+
+
+def target_phones(notification, user=None):
+    '''Streams the raw phone numbers of the audience of a notification (duplicates and blanks included)'''
+    if notification.target == Target.SELECTION.value:
+        yield from notification.audience().iterator(chunk_size=CHUNK_SIZE)
+        return
+    if notification.target == Target.ALL.value:
+        yield from User.objects.values_list('phone', flat=True).iterator(chunk_size=CHUNK_SIZE)
+        return
+    columns = {
+        Target.CHURCH.value: (Church, ('pastor_phone', 'church_phone')),
+        Target.REGION.value: (Region, ('phone', 'overseer_phone')),
+        Target.DISTRICT.value: (District, ('phone', 'overseer_phone')),
+    }
+    if notification.target in columns:
+        model, fields = columns[notification.target]
+        for phones in model.objects.values_list(*fields).iterator(chunk_size=CHUNK_SIZE):
+            yield from phones
+    elif user is not None:
+        yield user.phone
+
+
+def unique_phones(phones):
+    '''Normalizes phone numbers, dropping invalid numbers and repeats'''
+    seen = set()
+    for phone in phones:
+        phone = normalize_phone(phone)
+        if phone and phone not in seen:
+            seen.add(phone)
+            yield phone
+
+
+def count_recipients(phones) -> int:
+    '''Counts the numbers a broadcast to these phones is sent to (valid ones, once normalized and deduplicated)'''
+    return sum(1 for _ in unique_phones(phones))
+
+
+def batches(iterable, size: int):
+    '''Splits an iterable into lists of at most `size` items'''
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def queue_broadcast(notification, message: str, phones) -> dict:
+    '''Queues a message to the given phones in provider-sized outbox batches; returns the recipient and batch counts'''
+    recipients = queued = 0
+    pending = []
+    for batch in batches(unique_phones(phones), settings.SMS_BATCH_SIZE):
+        pending.append(SmsOutbox(notification=notification, message=message, recipients=batch, sender=settings.SENDER_ID))
+        recipients += len(batch)
+        if len(pending) == FLUSH_EVERY:
+            SmsOutbox.objects.bulk_create(pending)
+            queued += len(pending)
+            pending = []
+    if pending:
+        SmsOutbox.objects.bulk_create(pending)
+        queued += len(pending)
+    return {"recipients": recipients, "batches": queued}
+
+
+def retry_failed(notification) -> dict:
+    '''Queues the broadcast messages of a notification again, only to the recipients they failed to reach'''
+    started = timezone.now()
+    # failures reported while retrying are left for the next retry
+    failed = SmsDelivery.objects.filter(
+        outbox__notification=notification, status=DeliveryStatus.FAILED.value, updated_at__lte=started,
+    )
+    totals = {"recipients": 0, "batches": 0}
+    with transaction.atomic():
+        rows = failed.order_by('outbox__message', 'phone').values_list('outbox__message', 'phone').iterator(chunk_size=CHUNK_SIZE)
+        # the message as it was sent (a scheduled notification may have been edited between broadcasts)
+        for message, group in groupby(rows, key=lambda row: row[0]):
+            queued = queue_broadcast(notification, message, (phone for _, phone in group))
+            totals = {key: totals[key] + queued[key] for key in totals}
+        failed.update(status=DeliveryStatus.RETRIED.value, updated_at=timezone.now())
+    return totals
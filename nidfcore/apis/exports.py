@@ -0,0 +1,108 @@
+'''
+This module streams the finance exports (applications, repayments and disbursements).
+Rows are read as flat tuples with `.values_list().iterator()` (joined church,
+district and region names instead of nested serializers) and encoded one at a time
+as CSV or JSON Lines, so memory stays constant whatever the number of rows.
+
+'''
+
+import csv
+from datetime import date
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from apis.models import Application, Disbursement, Repayment
+
+CHUNK_SIZE = 2000
+FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'jsonl': ('application/x-ndjson', 'jsonl'),
+}
+
+HIERARCHY_COLUMNS = {
+    'church': 'church__location_name',
+    'district': 'church__district__name',
+    'region': 'church__district__region__name',
+}
+
+# model, date field used by the date range filter, and the exported columns (header -> lookup)
+EXPORTS = {
+    'applications': (Application, 'created_at__date', {
+        'application_id': 'application_id',
+        'status': 'status',
+        'support_type': 'support_type',
+        'project_type': 'type_of_church_project',
+        'amount': 'amount',
+        'monthly_repayment_amount': 'monthly_repayment_amount',
+        'is_emergency': 'is_emergency',
+        **HIERARCHY_COLUMNS,
+        'created_at': 'created_at',
+    }),
+    'repayments': (Repayment, 'date_paid', {
+        'repayment_id': 'repayment_id',
+        'application_id': 'application__application_id',
+        'amount': 'amount',
+        'payment_reference': 'payment_reference',
+        'date_paid': 'date_paid',
+        'status': 'status',
+        **{header: f'application__{lookup}' for header, lookup in HIERARCHY_COLUMNS.items()},
+        'created_at': 'created_at',
+    }),
+    'disbursements': (Disbursement, 'date_paid', {
+        'disbursement_id': 'disbursement_id',
+        'application_id': 'application__application_id',
+        'amount': 'amount',
+        'payment_reference': 'payment_reference',
+        'date_paid': 'date_paid',
+        'status': 'status',
+        'bank_name': 'bank_name',
+        **{header: f'application__{lookup}' for header, lookup in HIERARCHY_COLUMNS.items()},
+        'created_at': 'created_at',
+    }),
+}
+
+
+def export_rows(kind: str, start: date = None, end: date = None, status: str = None, church=None):
+    '''Returns the column headers and a lazy iterator over the flat rows of an export'''
+    model, date_field, columns = EXPORTS[kind]
+    queryset = model.objects.all()
+    if church is not None:
+        church_lookup = 'church' if model is Application else 'application__church'
+        queryset = queryset.filter(**{church_lookup: church})
+    if start:
+        queryset = queryset.filter(**{f'{date_field}__gte': start})
+    if end:
+        queryset = queryset.filter(**{f'{date_field}__lte': end})
+    if status:
+        queryset = queryset.filter(status=status)
+    rows = queryset.order_by('pk').values_list(*columns.values()).iterator(chunk_size=CHUNK_SIZE)
+    return list(columns), rows
+
+
+class _Echo:
+    '''File-like object returning what is written, so csv.writer can encode one row at a time'''
+
+    def write(self, value):
+        return value
+
+
+def stream_csv(headers: list, rows):
+    '''Yields the export as CSV lines'''
+    writer = csv.writer(_Echo())
+    yield writer.writerow(headers)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def stream_jsonl(headers: list, rows):
+    '''Yields the export as JSON Lines (one object per row)'''
+    encoder = DjangoJSONEncoder()
+    for row in rows:
+        yield encoder.encode(dict(zip(headers, row))) + '\n'
+
+
+def stream_export(export_format: str, headers: list, rows):
+    '''Yields the export encoded in the given format (csv or jsonl)'''
+    if export_format == 'jsonl':
+        return stream_jsonl(headers, rows)
+    return stream_csv(headers, rows)
@@ -0,0 +1,73 @@
+'''
+This module holds the query-parameter filters of the list endpoints.
+Filters are applied to the scoped queryset before it is paginated or serialized,
+so they run as SQL against the composite indexes declared on the models.
+
+'''
+
+from datetime import datetime, time, timedelta
+
+import django_filters
+from django.utils import timezone
+
+from apis.models import Application, Disbursement, Repayment
+from nidfcore.utils.constants import ConstLists
+
+
+class CreatedRangeFilter(django_filters.FilterSet):
+    '''Creation date range, compared on the raw created_at column so its indexes apply'''
+    created_after = django_filters.DateFilter(method='filter_created_after')
+    created_before = django_filters.DateFilter(method='filter_created_before')
+
+    def filter_created_after(self, queryset, name, value):
+        return queryset.filter(created_at__gte=timezone.make_aware(datetime.combine(value, time.min)))
+
+    def filter_created_before(self, queryset, name, value):
+        return queryset.filter(created_at__lt=timezone.make_aware(datetime.combine(value + timedelta(days=1), time.min)))
+
+
+class ApplicationFilter(CreatedRangeFilter):
+    '''Filters for the applications list'''
+    status = django_filters.MultipleChoiceFilter(choices=ConstLists.application_statuses, distinct=False)
+    support_type = django_filters.CharFilter()
+    is_emergency = django_filters.BooleanFilter()
+    church = django_filters.NumberFilter(field_name='church_id')
+    district = django_filters.NumberFilter(field_name='church__district_id')
+    region = django_filters.NumberFilter(field_name='church__district__region_id')
+    amount_min = django_filters.NumberFilter(field_name='amount', lookup_expr='gte')
+    amount_max = django_filters.NumberFilter(field_name='amount', lookup_expr='lte')
+
+    class Meta:
+        model = Application
+        fields = []
+
+
+class PaymentFilter(CreatedRangeFilter):
+    '''Filters shared by the repayments and disbursements lists'''
+    status = django_filters.CharFilter()
+    support_type = django_filters.CharFilter(field_name='application__support_type')
+    is_emergency = django_filters.BooleanFilter(field_name='application__is_emergency')
+    application = django_filters.CharFilter(field_name='application__application_id')
+    church = django_filters.NumberFilter(field_name='application__church_id')
+    district = django_filters.NumberFilter(field_name='application__church__district_id')
+    region = django_filters.NumberFilter(field_name='application__church__district__region_id')
+    paid_after = django_filters.DateFilter(field_name='date_paid', lookup_expr='gte')
+    paid_before = django_filters.DateFilter(field_name='date_paid', lookup_expr='lte')
+    amount_min = django_filters.NumberFilter(field_name='amount', lookup_expr='gte')
+    amount_max = django_filters.NumberFilter(field_name='amount', lookup_expr='lte')
+
+
+class RepaymentFilter(PaymentFilter):
+    '''Filters for the repayments list'''
+
+    class Meta:
+        model = Repayment
+        fields = []
+
+
+class DisbursementFilter(PaymentFilter):
+    '''Filters for the disbursements list'''
+
+    class Meta:
+        model = Disbursement
+        fields = []
@@ -0,0 +1,49 @@
+'''
+This module contains the finance aggregations used by the dashboards.
+Every figure is computed in the database with a fixed number of aggregate
+queries, no matter how many applications, disbursements or repayments exist.
+Money totals are read from the ledgers maintained by apis.ledger.
+
+'''
+
+from decimal import Decimal
+
+from django.db.models import Count, DecimalField, Q, Sum, Value
+from django.db.models.functions import Coalesce
+
+from apis.models import Application, ApplicationLedger, ChurchLedger
+from nidfcore.utils.constants import ApplicationStatus
+
+
+def _coalesced_sum(field: str) -> Coalesce:
+    '''Returns a Sum() of a decimal field that yields 0 instead of NULL'''
+    zero = Value(Decimal('0.00'), output_field=DecimalField(max_digits=15, decimal_places=2))
+    return Coalesce(Sum(field), zero)
+
+
+def get_portfolio_summary() -> dict:
+    '''Returns the national figures shown on the admin/finance dashboard (2 queries)'''
+    counts = Application.objects.aggregate(
+        total_pending=Count('pk', filter=Q(status=ApplicationStatus.PENDING.value)),
+        total_approved=Count('pk', filter=Q(status=ApplicationStatus.APPROVED.value)),
+        total_rejected=Count('pk', filter=Q(status=ApplicationStatus.REJECTED.value)),
+    )
+    totals = ApplicationLedger.objects.aggregate(
+        total_disbursed=_coalesced_sum('disbursed'),
+        total_repaid=_coalesced_sum('repaid'),
+        outstanding_balance=_coalesced_sum('outstanding'),
+    )
+    return {**counts, **totals}
+
+
+def get_church_summary(church) -> dict:
+    '''Returns the finance figures shown on a church's dashboard (1 query)'''
+    ledger = ChurchLedger.objects.filter(church=church).first()
+    if ledger is None:
+        ledger = ChurchLedger(church=church)
+    return {
+        'amount_received': ledger.disbursed,
+        'amount_repaid': ledger.repaid,
+        'arrears': ledger.outstanding,
+        'repayment_percentage': (ledger.repaid / ledger.disbursed) * 100 if ledger.disbursed else 0,
+    }
@@ -0,0 +1,98 @@
+'''
+This module keeps the Region -> District -> Church tree in process memory.
+The tree (ids, names and counts) is loaded with three column-only queries and
+reused by every request of the process until the data version of regions,
+districts or churches changes (bumped by the signals on every write), so
+hierarchy reads only check the cached versions and run no database query.
+Versions only reach every process through a shared cache (REDIS_URL): the
+tree is also reloaded once it is HIERARCHY_MAX_AGE seconds old, so a process
+with its own local-memory cache never serves writes of the others later than that.
+
+'''
+
+import hashlib
+import json
+import threading
+import time
+
+from django.conf import settings
+
+from accounts.models import Church, District, Region
+from nidfcore.utils.cache import get_data_versions
+
+MODELS = [Region, District, Church]
+DEPTHS = ['region', 'district', 'church']
+
+
+class HierarchyTree:
+    '''An immutable snapshot of the hierarchy, indexed by region and district id'''
+
+    def __init__(self, version: str):
+        self.version = version
+        self.loaded_at = time.monotonic()
+        districts = {}
+        for pk, name, region_id in District.objects.order_by('name', 'pk').values_list('pk', 'name', 'region_id'):
+            districts[pk] = {"id": pk, "name": name, "region": region_id, "churches_count": 0, "churches": []}
+        for pk, name, district_id in Church.objects.order_by('location_name', 'pk').values_list('pk', 'location_name', 'district_id'):
+            if district_id in districts:
+                districts[district_id]["churches"].append({"id": pk, "name": name})
+        regions = {}
+        for pk, name in Region.objects.order_by('name', 'pk').values_list('pk', 'name'):
+            regions[pk] = {"id": pk, "name": name, "districts_count": 0, "churches_count": 0, "districts": []}
+        for district in districts.values():
+            district["churches_count"] = len(district["churches"])
+            region = regions.get(district["region"])
+            if region is not None:
+                region["districts"].append(district)
+                region["districts_count"] += 1
+                region["churches_count"] += district["churches_count"]
+        self.regions = regions
+        self.districts = districts
+        # identifies the content (a reload of an expired tree may keep the same version)
+        self.digest = hashlib.md5(json.dumps(list(regions.values()), sort_keys=True).encode()).hexdigest()
+
+    def is_current(self, version: str) -> bool:
+        '''Checks if the tree was loaded at a data version and is not older than HIERARCHY_MAX_AGE'''
+        return self.version == version and time.monotonic() - self.loaded_at < settings.HIERARCHY_MAX_AGE
+
+    def tree(self, depth: str = 'church') -> list:
+        '''Returns every region with its districts and churches, down to `depth`'''
+        return [self.trim(region, 'region', depth) for region in self.regions.values()]
+
+    def region(self, pk: int, depth: str = 'church') -> dict:
+        '''Returns a region subtree (None if it does not exist)'''
+        region = self.regions.get(pk)
+        return self.trim(region, 'region', depth) if region else None
+
+    def district(self, pk: int, depth: str = 'church') -> dict:
+        '''Returns a district subtree (None if it does not exist)'''
+        district = self.districts.get(pk)
+        return self.trim(district, 'district', depth) if district else None
+
+    @staticmethod
+    def trim(node: dict, level: str, depth: str) -> dict:
+        '''Returns a node without the levels below `depth` (the node itself when nothing is cut)'''
+        if depth == 'church':
+            return node
+        if level == 'region':
+            if depth == 'region':
+                return {key: value for key, value in node.items() if key != "districts"}
+            return {**node, "districts": [HierarchyTree.trim(district, 'district', depth) for district in node["districts"]]}
+        return {key: value for key, value in node.items() if key != "churches"}
+
+
+_tree = None
+_lock = threading.Lock()
+
+
+def get_hierarchy() -> HierarchyTree:
+    '''Returns the in-memory tree, reloading it (3 queries) when regions, districts or churches changed or it expired'''
+    global _tree
+    version = get_data_versions(MODELS)
+    tree = _tree
+    if tree is not None and tree.is_current(version):
+        return tree
+    with _lock:
+        if _tree is None or not _tree.is_current(version):
+            _tree = HierarchyTree(version)
+        return _tree
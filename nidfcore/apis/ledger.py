@@ -0,0 +1,110 @@
+'''
+This module maintains the denormalized ledgers (ApplicationLedger and ChurchLedger).
+Disbursements always count towards the disbursed total while repayments only count
+towards the repaid total once they have been verified (APPROVED), whatever the
+status of their application: the disbursed total never looked at the application
+status, so filtering the repaid total by it would overstate the arrears of a
+church whose application changes status after money moved.
+The ledgers are moved with F() increments from the model signals so that
+concurrent writers never overwrite each other, and can be rebuilt from the
+source rows with the `rebuild_ledgers` management command.
+
+'''
+
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from apis.models import Application, ApplicationLedger, ChurchLedger, Disbursement, Repayment
+from nidfcore.utils.constants import ApplicationStatus
+
+ZERO = Decimal('0.00')
+
+
+def get_contribution(record) -> tuple:
+    '''Returns the (disbursed, repaid) amounts a disbursement/repayment adds to its ledgers'''
+    if isinstance(record, Disbursement):
+        return record.amount, ZERO
+    if isinstance(record, Repayment) and record.status == ApplicationStatus.APPROVED.value:
+        return ZERO, record.amount
+    return ZERO, ZERO
+
+
+def _increment(model, lookup: dict, disbursed: Decimal, repaid: Decimal) -> None:
+    '''Moves the totals of a ledger row with F() increments, creating the row if needed'''
+    changes = {
+        'disbursed': F('disbursed') + disbursed,
+        'repaid': F('repaid') + repaid,
+        'outstanding': F('outstanding') + (disbursed - repaid),
+        'updated_at': timezone.now(),
+    }
+    if not model.objects.filter(**lookup).update(**changes):
+        model.objects.get_or_create(**lookup)
+        model.objects.filter(**lookup).update(**changes)
+
+
+def post_to_ledgers(application_id: int, disbursed: Decimal = ZERO, repaid: Decimal = ZERO) -> None:
+    '''Applies a change in disbursed/repaid amounts to an application and its church'''
+    if not application_id or (disbursed == 0 and repaid == 0):
+        return
+    church_id = Application.objects.filter(pk=application_id).values_list('church_id', flat=True).first()
+    with transaction.atomic():
+        _increment(ApplicationLedger, {'application_id': application_id}, disbursed, repaid)
+        if church_id:
+            _increment(ChurchLedger, {'church_id': church_id}, disbursed, repaid)
+
+
+def remember_previous(record) -> None:
+    '''Stores the persisted state of a record before it is saved (used by pre_save)'''
+    previous = None
+    if record.pk:
+        previous = type(record).objects.filter(pk=record.pk).first()
+    record._ledger_previous = previous
+
+
+def record_saved(record) -> None:
+    '''Posts the difference between the previous and the new state of a record'''
+    previous = getattr(record, '_ledger_previous', None)
+    record._ledger_previous = None
+    if previous is not None:
+        old_disbursed, old_repaid = get_contribution(previous)
+        if previous.application_id != record.application_id:
+            post_to_ledgers(previous.application_id, -old_disbursed, -old_repaid)
+            old_disbursed, old_repaid = ZERO, ZERO
+    else:
+        old_disbursed, old_repaid = ZERO, ZERO
+    disbursed, repaid = get_contribution(record)
+    post_to_ledgers(record.application_id, disbursed - old_disbursed, repaid - old_repaid)
+
+
+def remember_church(application) -> None:
+    '''Stores the persisted church of an application before it is saved (used by pre_save)'''
+    previous = None
+    if application.pk:
+        previous = Application.objects.filter(pk=application.pk).values('church_id').first()
+    application._ledger_previous = previous
+
+
+def application_saved(application) -> None:
+    '''Moves the balance of an application from the ledger of its previous church to the new one'''
+    previous = getattr(application, '_ledger_previous', None)
+    application._ledger_previous = None
+    if previous is None or previous['church_id'] == application.church_id:
+        return
+    with transaction.atomic():
+        totals = ApplicationLedger.objects.select_for_update().filter(application_id=application.pk).values_list('disbursed', 'repaid').first()
+        if not totals:
+            return
+        disbursed, repaid = totals
+        if previous['church_id']:
+            _increment(ChurchLedger, {'church_id': previous['church_id']}, -disbursed, -repaid)
+        if application.church_id:
+            _increment(ChurchLedger, {'church_id': application.church_id}, disbursed, repaid)
+
+
+def record_deleted(record) -> None:
+    '''Removes a deleted record's contribution from the ledgers'''
+    disbursed, repaid = get_contribution(record)
+    post_to_ledgers(record.application_id, -disbursed, -repaid)
@@ -0,0 +1,34 @@
+import csv
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from apis.aging import BUCKETS, LEVELS, aging_rows, aging_totals, compute_aging
+
+
+class Command(BaseCommand):
+    help = 'Print the arrears aging report (current / 30 / 60 / 90+ days) as CSV'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--level', choices=LEVELS, default='church', help='Group the report by church, district or region')
+        parser.add_argument('--region', type=int, help='Only report on the churches of a region (id)')
+        parser.add_argument('--as-of', help='Age the balances as of a date (YYYY-MM-DD), defaults to today')
+
+    def handle(self, *args, **options):
+        as_of = timezone.localdate()
+        if options['as_of']:
+            try:
+                as_of = parse_date(options['as_of'])
+            except ValueError:
+                as_of = None
+            if as_of is None:
+                raise CommandError(f"Invalid date: {options['as_of']}")
+
+        report = compute_aging(as_of, region_id=options['region'])
+        rows = aging_rows(report, options['level'])
+        columns = ['id', 'name', *(['district', 'region'] if options['level'] == 'church' else []), *BUCKETS, 'outstanding']
+        writer = csv.DictWriter(self.stdout, fieldnames=columns)
+        writer.writeheader()
+        writer.writerows(rows)
+        writer.writerow({'name': 'TOTAL', **aging_totals(report)})
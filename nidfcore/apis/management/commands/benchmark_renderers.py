@@ -0,0 +1,55 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+
+from accounts.models import Church
+from apis.models import Application, Disbursement, ProgressReport, Repayment
+from apis.serializers import (ApplicationSerializers, ChurchListSerializer,
+                              GetDisbursementSerializer,
+                              GetProgressReportSerializer,
+                              GetRepaymentSerializer)
+from nidfcore.utils.renderers import MessagePackRenderer, ORJSONRenderer, msgpack
+
+# list endpoint -> (queryset, serializer)
+ENDPOINTS = {
+    'applications': (lambda: Application.objects.order_by('-created_at', '-id'), ApplicationSerializers),
+    'repayments': (lambda: Repayment.objects.order_by('-date_paid', '-id'), GetRepaymentSerializer),
+    'disbursements': (lambda: Disbursement.objects.order_by('-created_at', '-id'), GetDisbursementSerializer),
+    'progressreports': (lambda: ProgressReport.objects.order_by('-created_at', '-id'), GetProgressReportSerializer),
+    'churches': (lambda: Church.objects.with_repayment_status().order_by('location_name', 'id'), ChurchListSerializer),
+}
+
+
+class Command(BaseCommand):
+    help = 'Compare the render time and payload size of the response renderers on the list endpoints'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000, help='Rows serialized per endpoint')
+        parser.add_argument('--repeat', type=int, default=20, help='Renders timed per renderer (the median is reported)')
+        parser.add_argument('--endpoint', choices=ENDPOINTS, action='append', help='Only benchmark these endpoints')
+
+    def handle(self, *args, **options):
+        renderers = {'json (drf)': JSONRenderer(), 'orjson': ORJSONRenderer()}
+        if msgpack is not None:
+            renderers['msgpack'] = MessagePackRenderer()
+        else:
+            self.stdout.write(self.style.WARNING("msgpack is not installed, skipping the MessagePack renderer"))
+
+        self.stdout.write(f"{'endpoint':<16}{'rows':>6}  {'renderer':<12}{'median ms':>10}{'size KB':>10}{'vs json':>9}")
+        for name in options['endpoint'] or ENDPOINTS:
+            queryset, serializer_class = ENDPOINTS[name]
+            rows = serializer_class.eager_load(queryset())[:options['rows']]
+            data = serializer_class(rows, many=True).data
+            baseline = None
+            for label, renderer in renderers.items():
+                timings = []
+                for _ in range(options['repeat']):
+                    start = time.perf_counter()
+                    body = renderer.render(data, renderer.media_type, {})
+                    timings.append(time.perf_counter() - start)
+                median = statistics.median(timings) * 1000
+                baseline = baseline or median
+                self.stdout.write(f"{name:<16}{len(data):>6}  {label:<12}{median:>10.2f}{len(body) / 1024:>10.1f}{baseline / median if median else 1:>8.1f}x")
+        self.stdout.write(self.style.SUCCESS("Benchmark complete"))
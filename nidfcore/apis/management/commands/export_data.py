@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from apis.exports import EXPORTS, FORMATS, export_rows, stream_export
+
+
+class Command(BaseCommand):
+    help = 'Stream applications, repayments or disbursements as CSV or JSON Lines'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=list(EXPORTS), help='Records to export')
+        parser.add_argument('--format', dest='export_format', choices=list(FORMATS), default='csv', help='Output format')
+        parser.add_argument('--start', help='First day to export (YYYY-MM-DD)')
+        parser.add_argument('--end', help='Last day to export (YYYY-MM-DD)')
+        parser.add_argument('--status', help='Only export records with this status')
+        parser.add_argument('--output', help='File to write to, defaults to stdout')
+
+    def handle(self, *args, **options):
+        headers, rows = export_rows(
+            options['kind'], start=self.parse(options['start']), end=self.parse(options['end']), status=options['status'],
+        )
+        chunks = stream_export(options['export_format'], headers, rows)
+        if not options['output']:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
+            return
+
+        with open(options['output'], 'w', newline='', encoding='utf-8') as output:
+            output.writelines(chunks)
+        self.stderr.write(self.style.SUCCESS(f"{options['kind'].capitalize()} exported to {options['output']}"))
+
+    def parse(self, value):
+        '''Parses an optional YYYY-MM-DD argument'''
+        if value is None:
+            return None
+        try:
+            parsed = parse_date(value)
+        except ValueError:
+            parsed = None
+        if parsed is None:
+            raise CommandError(f"Invalid date: {value}")
+        return parsed
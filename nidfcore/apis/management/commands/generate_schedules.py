@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Min
+
+from apis.models import Application
+from apis.schedules import add_months, allocate_repayments, ensure_schedule
+from nidfcore.utils.constants import ApplicationStatus, SupportType
+
+
+class Command(BaseCommand):
+    help = 'Create the missing repayment schedules of approved and disbursed revolving fund applications and re-allocate repayments'
+
+    def handle(self, *args, **kwargs):
+        applications = Application.objects.filter(
+            support_type=SupportType.REVOLVING_FUND.value, status=ApplicationStatus.APPROVED.value,
+        ).annotate(
+            first_disbursement=Min('disbursement__date_paid'), first_due=Min('installments__due_date'),
+        ).filter(first_disbursement__isnull=False)
+
+        created = rebuilt = 0
+        for application in applications.iterator(chunk_size=500):
+            # the same start as the live schedules (apis.schedules.schedule_start)
+            if application.first_due and application.first_due != add_months(application.first_disbursement, 1):
+                # made from another start (the approval date, before schedules followed disbursements)
+                application.installments.all().delete()
+                rebuilt += 1
+            if ensure_schedule(application, start=application.first_disbursement):
+                created += 1
+            else:
+                allocate_repayments(application.pk)
+        self.stdout.write(self.style.SUCCESS(f"Repayment schedules created for {created} application(s), {rebuilt} of them rebuilt"))
@@ -0,0 +1,88 @@
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q, Sum
+
+from apis.ledger import ZERO
+from apis.models import Application, ApplicationLedger, ChurchLedger, Disbursement, Repayment
+from nidfcore.utils.constants import ApplicationStatus
+
+
+def _batches(values: list, size: int):
+    '''Yields consecutive slices of a list'''
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+class Command(BaseCommand):
+    help = 'Rebuild (or verify) the application and church ledgers from disbursements and repayments'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Number of ledgers handled per batch')
+        parser.add_argument('--verify', action='store_true', help='Only report ledgers that differ from the source rows')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        verify = options['verify']
+
+        mismatches = 0
+        church_totals = defaultdict(lambda: [ZERO, ZERO])
+        applications = list(Application.objects.order_by('pk').values_list('pk', 'church_id'))
+
+        for batch in _batches(applications, batch_size):
+            ids = [pk for pk, _ in batch]
+            disbursed = dict(
+                Disbursement.objects.filter(application_id__in=ids)
+                .values('application_id').annotate(total=Sum('amount'))
+                .values_list('application_id', 'total')
+            )
+            repaid = dict(
+                Repayment.objects.filter(application_id__in=ids, status=ApplicationStatus.APPROVED.value)
+                .values('application_id').annotate(total=Sum('amount'))
+                .values_list('application_id', 'total')
+            )
+            expected = {}
+            for pk, church_id in batch:
+                totals = (disbursed.get(pk) or ZERO, repaid.get(pk) or ZERO)
+                expected[pk] = totals
+                if church_id:
+                    church_totals[church_id][0] += totals[0]
+                    church_totals[church_id][1] += totals[1]
+            mismatches += self.sync(ApplicationLedger, 'application_id', expected, verify)
+
+        churches = sorted(set(church_totals) | set(ChurchLedger.objects.values_list('church_id', flat=True)))
+        for batch in _batches(churches, batch_size):
+            expected = {pk: tuple(church_totals.get(pk, (ZERO, ZERO))) for pk in batch}
+            mismatches += self.sync(ChurchLedger, 'church_id', expected, verify)
+
+        if verify and mismatches:
+            self.stderr.write(self.style.ERROR(f"{mismatches} ledger(s) differ from the source rows"))
+        elif verify:
+            self.stdout.write(self.style.SUCCESS("All ledgers match the source rows"))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Ledgers rebuilt: {len(applications)} applications, {len(churches)} churches ({mismatches} corrected)"))
+
+    def sync(self, model, key: str, expected: dict, verify: bool) -> int:
+        '''Compares a batch of ledgers with the expected totals and writes the differences'''
+        existing = {getattr(row, key): row for row in model.objects.filter(**{f'{key}__in': list(expected)})}
+        to_create, to_update = [], []
+        for pk, (disbursed, repaid) in expected.items():
+            row = existing.get(pk)
+            if row is None:
+                if disbursed or repaid:
+                    to_create.append(model(**{key: pk}, disbursed=disbursed, repaid=repaid, outstanding=disbursed - repaid))
+                continue
+            if row.disbursed != disbursed or row.repaid != repaid or row.outstanding != disbursed - repaid:
+                if verify:
+                    self.stdout.write(f"{model.__name__} {pk}: stored {row.disbursed}/{row.repaid}, expected {disbursed}/{repaid}")
+                row.disbursed, row.repaid, row.outstanding = disbursed, repaid, disbursed - repaid
+                to_update.append(row)
+        if verify:
+            for row in to_create:
+                self.stdout.write(f"{model.__name__} {getattr(row, key)}: missing, expected {row.disbursed}/{row.repaid}")
+            return len(to_create) + len(to_update)
+        with transaction.atomic():
+            model.objects.bulk_create(to_create)
+            model.objects.bulk_update(to_update, ['disbursed', 'repaid', 'outstanding'])
+        return len(to_create) + len(to_update)
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from apis.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the district and region portfolio rollups from churches, applications and ledgers'
+
+    def handle(self, *args, **kwargs):
+        districts, regions = rebuild_rollups()
+        self.stdout.write(self.style.SUCCESS(f"Rollups rebuilt: {districts} districts, {regions} regions"))
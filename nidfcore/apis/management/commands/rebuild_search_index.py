@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from apis.search import is_available, rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index of applications, churches and progress reports'
+
+    def handle(self, *args, **kwargs):
+        if not is_available():
+            self.stdout.write(self.style.WARNING("Full-text search is not supported on this database"))
+            return
+        counts = rebuild_index()
+        self.stdout.write(self.style.SUCCESS(f"Search index rebuilt: {', '.join(f'{count} {kind}' for kind, count in counts.items())}"))
@@ -0,0 +1,50 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from apis.outbox import claim_batch, dispatch, publish_metrics
+from nidfcore.utils.services import get_gateway
+
+
+class Command(BaseCommand):
+    help = 'Send the queued SMS messages of the outbox, retrying failures with backoff'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=settings.SMS_WORKERS, help='Messages sent concurrently')
+        parser.add_argument('--batch-size', type=int, default=50, help='Messages claimed at a time')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds to wait when the outbox is empty')
+        parser.add_argument('--once', action='store_true', help='Exit once no message is due instead of polling')
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS(f"SMS worker started with {options['workers']} senders"))
+        totals = {}
+        gateway = get_gateway()
+        with ThreadPoolExecutor(max_workers=options['workers'], thread_name_prefix='sms') as executor:
+            try:
+                while True:
+                    publish_metrics()
+                    circuit = gateway.breaker.state
+                    if circuit == 'open':
+                        # the gateway is down: leave the messages queued instead of burning their attempts
+                        if options['once']:
+                            break
+                        time.sleep(options['poll_interval'])
+                        continue
+                    # half-open: only the trial call goes through, so only one message is claimed
+                    batch = claim_batch(1 if circuit == 'half-open' else options['batch_size'])
+                    if not batch:
+                        if options['once']:
+                            break
+                        time.sleep(options['poll_interval'])
+                        continue
+                    counts = dispatch(batch, executor)
+                    for status, count in counts.items():
+                        totals[status] = totals.get(status, 0) + count
+                    self.stdout.write(f"Batch of {len(batch)}: {', '.join(f'{count} {status.lower()}' for status, count in counts.items())}")
+            except KeyboardInterrupt:
+                self.stdout.write("Stopping, messages being sent are finished first")
+        publish_metrics()
+        summary = ', '.join(f'{count} {status.lower()}' for status, count in totals.items()) or 'nothing to send'
+        self.stdout.write(self.style.SUCCESS(f"SMS worker stopped: {summary}"))
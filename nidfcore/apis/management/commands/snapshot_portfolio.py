@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from apis.snapshots import backfill_snapshots, take_snapshot
+
+
+class Command(BaseCommand):
+    help = "Record today's portfolio snapshot, or backfill the snapshot history"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--backfill', action='store_true', help='Rebuild the history from disbursements and repayments')
+        parser.add_argument('--start', help='First day to backfill (YYYY-MM-DD), defaults to the first recorded activity')
+        parser.add_argument('--end', help='Last day to backfill (YYYY-MM-DD), defaults to today')
+
+    def handle(self, *args, **options):
+        if not options['backfill']:
+            count = take_snapshot()
+            self.stdout.write(self.style.SUCCESS(f"Snapshot recorded ({count} rows)"))
+            return
+
+        start = self.parse(options['start'])
+        end = self.parse(options['end'])
+        count = backfill_snapshots(start=start, end=end)
+        self.stdout.write(self.style.SUCCESS(f"Snapshot history backfilled ({count} rows)"))
+
+    def parse(self, value):
+        '''Parses an optional YYYY-MM-DD argument'''
+        if value is None:
+            return None
+        parsed = parse_date(value)
+        if parsed is None:
+            raise CommandError(f"Invalid date: {value}")
+        return parsed
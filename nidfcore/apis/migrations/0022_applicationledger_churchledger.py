@@ -0,0 +1,67 @@
+# Generated by Django 5.1.5 on 2026-10-18 12:47
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def populate_ledgers(apps, schema_editor):
+    '''Fill the new ledgers from the existing disbursements and verified repayments'''
+    Application = apps.get_model('apis', 'Application')
+    ApplicationLedger = apps.get_model('apis', 'ApplicationLedger')
+    ChurchLedger = apps.get_model('apis', 'ChurchLedger')
+    Disbursement = apps.get_model('apis', 'Disbursement')
+    Repayment = apps.get_model('apis', 'Repayment')
+
+    disbursed = dict(Disbursement.objects.values('application_id').annotate(total=Sum('amount')).values_list('application_id', 'total'))
+    repaid = dict(
+        Repayment.objects.filter(status='APPROVED').values('application_id')
+        .annotate(total=Sum('amount')).values_list('application_id', 'total')
+    )
+    application_ledgers, church_totals = [], {}
+    for pk, church_id in Application.objects.filter(pk__in=set(disbursed) | set(repaid)).values_list('pk', 'church_id'):
+        d, r = disbursed.get(pk) or 0, repaid.get(pk) or 0
+        application_ledgers.append(ApplicationLedger(application_id=pk, disbursed=d, repaid=r, outstanding=d - r))
+        if church_id:
+            totals = church_totals.setdefault(church_id, [0, 0])
+            totals[0] += d
+            totals[1] += r
+    ApplicationLedger.objects.bulk_create(application_ledgers, batch_size=500)
+    ChurchLedger.objects.bulk_create(
+        [ChurchLedger(church_id=pk, disbursed=d, repaid=r, outstanding=d - r) for pk, (d, r) in church_totals.items()],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0015_alter_district_email_alter_district_overseer_email_and_more'),
+        ('apis', '0021_rename_purpose_application_justification_for_aid_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ApplicationLedger',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('disbursed', models.DecimalField(decimal_places=2, default=0.0, max_digits=15)),
+                ('repaid', models.DecimalField(decimal_places=2, default=0.0, max_digits=15)),
+                ('outstanding', models.DecimalField(decimal_places=2, default=0.0, max_digits=15)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('application', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='ledger', to='apis.application')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ChurchLedger',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('disbursed', models.DecimalField(decimal_places=2, default=0.0, max_digits=15)),
+                ('repaid', models.DecimalField(decimal_places=2, default=0.0, max_digits=15)),
+                ('outstanding', models.DecimalField(decimal_places=2, default=0.0, max_digits=15)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('church', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='ledger', to='accounts.church')),
+            ],
+        ),
+        migrations.RunPython(populate_ledgers, migrations.RunPython.noop),
+    ]
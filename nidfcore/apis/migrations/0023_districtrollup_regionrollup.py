@@ -0,0 +1,97 @@
+# Generated by Django 5.1.5 on 2026-10-18 12:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+STATUS_FIELDS = {
+    'DRAFT': 'draft_applications',
+    'PENDING REVIEW': 'pending_applications',
+    'UNDER REVIEW': 'under_review_applications',
+    "WAITING NO'S APPROVAL": 'waiting_approval_applications',
+    'APPROVED': 'approved_applications',
+    'REJECTED': 'rejected_applications',
+}
+
+
+def populate_rollups(apps, schema_editor):
+    '''Fill the new rollups from the existing churches, applications and ledgers'''
+    Application = apps.get_model('apis', 'Application')
+    Church = apps.get_model('accounts', 'Church')
+    ChurchLedger = apps.get_model('apis', 'ChurchLedger')
+    District = apps.get_model('accounts', 'District')
+    DistrictRollup = apps.get_model('apis', 'DistrictRollup')
+    Region = apps.get_model('accounts', 'Region')
+    RegionRollup = apps.get_model('apis', 'RegionRollup')
+
+    figures = {pk: {} for pk in District.objects.values_list('pk', flat=True)}
+    for row in Church.objects.filter(district__isnull=False).values('district_id').annotate(total=Count('pk')):
+        figures[row['district_id']]['churches'] = row['total']
+    status_counts = {field: Count('pk', filter=Q(status=value)) for value, field in STATUS_FIELDS.items()}
+    for row in Application.objects.filter(church__district__isnull=False).values('church__district_id').annotate(**status_counts):
+        figures[row['church__district_id']].update({field: row[field] for field in STATUS_FIELDS.values()})
+    ledgers = ChurchLedger.objects.filter(church__district__isnull=False).values('church__district_id')
+    for row in ledgers.annotate(d=Sum('disbursed'), r=Sum('repaid'), a=Sum('outstanding')):
+        figures[row['church__district_id']].update(disbursed=row['d'], repaid=row['r'], arrears=row['a'])
+    DistrictRollup.objects.bulk_create([DistrictRollup(district_id=pk, **values) for pk, values in figures.items()], batch_size=500)
+
+    fields = ['churches', *STATUS_FIELDS.values(), 'disbursed', 'repaid', 'arrears']
+    regions = {pk: {} for pk in Region.objects.values_list('pk', flat=True)}
+    rows = DistrictRollup.objects.filter(district__region__isnull=False).values('district__region_id')
+    for row in rows.annotate(**{field: Sum(field) for field in fields}):
+        regions[row['district__region_id']].update({field: row[field] for field in fields})
+    RegionRollup.objects.bulk_create([RegionRollup(region_id=pk, **values) for pk, values in regions.items()], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0015_alter_district_email_alter_district_overseer_email_and_more'),
+        ('apis', '0022_applicationledger_churchledger'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DistrictRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('churches', models.IntegerField(default=0)),
+                ('draft_applications', models.IntegerField(default=0)),
+                ('pending_applications', models.IntegerField(default=0)),
+                ('under_review_applications', models.IntegerField(default=0)),
+                ('waiting_approval_applications', models.IntegerField(default=0)),
+                ('approved_applications', models.IntegerField(default=0)),
+                ('rejected_applications', models.IntegerField(default=0)),
+                ('disbursed', models.DecimalField(decimal_places=2, default=0.0, max_digits=15)),
+                ('repaid', models.DecimalField(decimal_places=2, default=0.0, max_digits=15)),
+                ('arrears', models.DecimalField(decimal_places=2, default=0.0, max_digits=15)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('district', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='rollup', to='accounts.district')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='RegionRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('churches', models.IntegerField(default=0)),
+                ('draft_applications', models.IntegerField(default=0)),
+                ('pending_applications', models.IntegerField(default=0)),
+                ('under_review_applications', models.IntegerField(default=0)),
+                ('waiting_approval_applications', models.IntegerField(default=0)),
+                ('approved_applications', models.IntegerField(default=0)),
+                ('rejected_applications', models.IntegerField(default=0)),
+                ('disbursed', models.DecimalField(decimal_places=2, default=0.0, max_digits=15)),
+                ('repaid', models.DecimalField(decimal_places=2, default=0.0, max_digits=15)),
+                ('arrears', models.DecimalField(decimal_places=2, default=0.0, max_digits=15)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('region', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='rollup', to='accounts.region')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.RunPython(populate_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.1.5 on 2026-10-18 12:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0015_alter_district_email_alter_district_overseer_email_and_more'),
+        ('apis', '0023_districtrollup_regionrollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PortfolioSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('churches', models.IntegerField(default=0)),
+                ('draft_applications', models.IntegerField(default=0)),
+                ('pending_applications', models.IntegerField(default=0)),
+                ('under_review_applications', models.IntegerField(default=0)),
+                ('waiting_approval_applications', models.IntegerField(default=0)),
+                ('approved_applications', models.IntegerField(default=0)),
+                ('rejected_applications', models.IntegerField(default=0)),
+                ('disbursed', models.DecimalField(decimal_places=2, default=0.0, max_digits=15)),
+                ('repaid', models.DecimalField(decimal_places=2, default=0.0, max_digits=15)),
+                ('arrears', models.DecimalField(decimal_places=2, default=0.0, max_digits=15)),
+                ('date', models.DateField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('region', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to='accounts.region')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['region', 'date'], name='apis_portfo_region__360f04_idx')],
+                'constraints': [models.UniqueConstraint(fields=('date', 'region'), name='unique_region_snapshot_per_day'), models.UniqueConstraint(condition=models.Q(('region__isnull', True)), fields=('date',), name='unique_national_snapshot_per_day')],
+            },
+        ),
+    ]
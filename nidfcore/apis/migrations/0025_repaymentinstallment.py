@@ -0,0 +1,31 @@
+# Generated by Django 5.1.5 on 2026-10-18 12:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apis', '0024_portfoliosnapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RepaymentInstallment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('number', models.PositiveIntegerField()),
+                ('due_date', models.DateField()),
+                ('amount_due', models.DecimalField(decimal_places=2, default=0.0, max_digits=15)),
+                ('amount_allocated', models.DecimalField(decimal_places=2, default=0.0, max_digits=15)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('application', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='installments', to='apis.application')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['due_date'], name='apis_repaym_due_dat_7fa967_idx')],
+                'constraints': [models.UniqueConstraint(fields=('application', 'number'), name='unique_installment_number')],
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.1.5 on 2026-10-18 12:58
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0016_church_accounts_ch_locatio_cba7f8_idx_and_more'),
+        ('apis', '0025_repaymentinstallment'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='application',
+            index=models.Index(fields=['created_at', 'id'], name='apis_applic_created_c57d26_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='disbursement',
+            index=models.Index(fields=['created_at', 'id'], name='apis_disbur_created_c18a8c_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['created_at', 'id'], name='apis_notifi_created_08fdb6_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='progressreport',
+            index=models.Index(fields=['created_at', 'id'], name='apis_progre_created_9a641f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='repayment',
+            index=models.Index(fields=['date_paid', 'id'], name='apis_repaym_date_pa_54e850_idx'),
+        ),
+    ]
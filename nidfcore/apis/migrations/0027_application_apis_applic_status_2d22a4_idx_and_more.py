@@ -0,0 +1,48 @@
+# Generated by Django 5.1.5 on 2026-10-18 13:05
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0016_church_accounts_ch_locatio_cba7f8_idx_and_more'),
+        ('apis', '0026_application_apis_applic_created_c57d26_idx_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='application',
+            index=models.Index(fields=['status', 'created_at', 'id'], name='apis_applic_status_2d22a4_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='application',
+            index=models.Index(fields=['church', 'created_at', 'id'], name='apis_applic_church__ff7100_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='application',
+            index=models.Index(fields=['support_type', 'status', 'created_at'], name='apis_applic_support_722681_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='disbursement',
+            index=models.Index(fields=['status', 'created_at', 'id'], name='apis_disbur_status_a9820e_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='disbursement',
+            index=models.Index(fields=['application', 'created_at', 'id'], name='apis_disbur_applica_f3ec57_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='disbursement',
+            index=models.Index(fields=['date_paid'], name='apis_disbur_date_pa_6b17fa_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='repayment',
+            index=models.Index(fields=['status', 'date_paid', 'id'], name='apis_repaym_status_57a045_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='repayment',
+            index=models.Index(fields=['application', 'date_paid', 'id'], name='apis_repaym_applica_7a9127_idx'),
+        ),
+    ]
@@ -0,0 +1,93 @@
+# Generated by Django 5.1.5 on 2026-10-18 13:20
+
+from django.db import migrations
+
+# frozen copy of the index of apis.search as it was created: later changes to that
+# module (or to the models) must not change what this migration does
+INDEX_TABLE = 'apis_search_index'
+BATCH_SIZE = 1000
+
+CREATE_INDEX = {
+    'sqlite': [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {INDEX_TABLE} USING fts5("
+        "kind UNINDEXED, object_id UNINDEXED, title, body, tokenize = 'unicode61 remove_diacritics 2')",
+    ],
+    'postgresql': [
+        f"CREATE TABLE IF NOT EXISTS {INDEX_TABLE} ("
+        "doc_id bigint PRIMARY KEY, kind varchar(20) NOT NULL, object_id integer NOT NULL, title text NOT NULL, body text NOT NULL, "
+        "document tsvector GENERATED ALWAYS AS ("
+        "setweight(to_tsvector('simple', title), 'A') || setweight(to_tsvector('simple', body), 'B')) STORED)",
+        f"CREATE INDEX IF NOT EXISTS {INDEX_TABLE}_document ON {INDEX_TABLE} USING GIN (document)",
+    ],
+}
+
+
+def application_documents(apps):
+    rows = apps.get_model('apis', 'Application').objects.values_list(
+        'pk', 'application_id', 'church__location_name', 'church__pastor_name', 'project_location',
+        'type_of_church_project', 'phase', 'justification_for_aid',
+    )
+    for pk, reference, church, pastor, *body in rows.iterator(chunk_size=BATCH_SIZE):
+        yield pk, ' '.join(filter(None, [reference, church])), ' '.join(filter(None, [pastor, *body]))
+
+
+def church_documents(apps):
+    rows = apps.get_model('accounts', 'Church').objects.values_list(
+        'pk', 'location_name', 'pastor_name', 'manager_name', 'location_address', 'district__name',
+    )
+    for pk, name, *body in rows.iterator(chunk_size=BATCH_SIZE):
+        yield pk, name or '', ' '.join(filter(None, body))
+
+
+def progress_report_documents(apps):
+    rows = apps.get_model('apis', 'ProgressReport').objects.values_list(
+        'pk', 'report_id', 'application__application_id', 'application__church__location_name', 'progress_description',
+    )
+    for pk, reference, application, church, description in rows.iterator(chunk_size=BATCH_SIZE):
+        yield pk, ' '.join(filter(None, [reference, application, church])), description or ''
+
+
+# kind -> (doc_id code, document builder)
+KINDS = {
+    'application': (1, application_documents),
+    'church': (2, church_documents),
+    'progress_report': (3, progress_report_documents),
+}
+
+
+def create_search_index(apps, schema_editor):
+    '''Create the full-text search table and index the existing records'''
+    connection = schema_editor.connection
+    if connection.vendor not in CREATE_INDEX:
+        return
+    column = 'rowid' if connection.vendor == 'sqlite' else 'doc_id'
+    insert = f"INSERT INTO {INDEX_TABLE} ({column}, kind, object_id, title, body) VALUES (%s, %s, %s, %s, %s)"
+    with connection.cursor() as cursor:
+        for statement in CREATE_INDEX[connection.vendor]:
+            cursor.execute(statement)
+        for kind, (code, documents) in KINDS.items():
+            batch = []
+            for pk, title, body in documents(apps):
+                batch.append((pk * 8 + code, kind, pk, title, body))
+                if len(batch) == BATCH_SIZE:
+                    cursor.executemany(insert, batch)
+                    batch = []
+            if batch:
+                cursor.executemany(insert, batch)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor in CREATE_INDEX:
+        schema_editor.execute(f"DROP TABLE IF EXISTS {INDEX_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0016_church_accounts_ch_locatio_cba7f8_idx_and_more'),
+        ('apis', '0027_application_apis_applic_status_2d22a4_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
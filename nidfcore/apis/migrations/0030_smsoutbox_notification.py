@@ -0,0 +1,19 @@
+# Generated by Django 5.1.5 on 2026-10-18 13:22
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apis', '0029_smsoutbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='smsoutbox',
+            name='notification',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='sms_batches', to='apis.notification'),
+        ),
+    ]
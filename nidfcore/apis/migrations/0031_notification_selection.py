@@ -0,0 +1,54 @@
+# Generated by Django 5.1.5 on 2026-10-18 13:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0017_search_key'),
+        ('apis', '0030_smsoutbox_notification'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='churches',
+            field=models.ManyToManyField(blank=True, related_name='notifications', to='accounts.church'),
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='districts',
+            field=models.ManyToManyField(blank=True, related_name='notifications', to='accounts.district'),
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='include_church_users',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='include_managers',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='include_overseers',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='include_pastors',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='regions',
+            field=models.ManyToManyField(blank=True, related_name='notifications', to='accounts.region'),
+        ),
+        migrations.AlterField(
+            model_name='notification',
+            name='target',
+            field=models.CharField(choices=[('CHURCH', 'CHURCH'), ('DISTRICT', 'DISTRICT'), ('REGION', 'REGION'), ('ALL', 'ALL'), ('SELECTION', 'SELECTION')], default='ALL', max_length=20),
+        ),
+    ]
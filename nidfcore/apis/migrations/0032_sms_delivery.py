@@ -0,0 +1,32 @@
+# Generated by Django 5.1.5 on 2026-10-18 13:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apis', '0031_notification_selection'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SmsDelivery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('phone', models.CharField(max_length=15)),
+                ('status', models.CharField(choices=[('SENT', 'SENT'), ('DELIVERED', 'DELIVERED'), ('FAILED', 'FAILED'), ('RETRIED', 'RETRIED')], default='SENT', max_length=10)),
+                ('provider_id', models.CharField(blank=True, max_length=64, null=True)),
+                ('error', models.CharField(blank=True, default='', max_length=255)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('sent_at', models.DateTimeField(blank=True, null=True)),
+                ('delivered_at', models.DateTimeField(blank=True, null=True)),
+                ('outbox', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='deliveries', to='apis.smsoutbox')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['provider_id'], name='apis_smsdel_provide_70d95e_idx'), models.Index(fields=['outbox', 'status'], name='apis_smsdel_outbox__7c330c_idx')],
+            },
+        ),
+    ]
@@ -3,12 +3,14 @@ import string
 from django.utils import timezone
 from datetime import timedelta
 
+from django.conf import settings
 from django.db import models
 
 from accounts.models import Church, District, Region, User
 from nidfcore.utils.constants import (ApplicationStatus, ConstLists as CL, Frequency,
-                                      NotificationChannel, ReportStatus, SupportType, Target)
-from nidfcore.utils.services import send_sms
+                                      DeliveryStatus, NotificationChannel, ReportStatus, SmsStatus,
+                                      SupportType, Target)
+from nidfcore.utils.services import normalize_phone
 
 
 class Application(models.Model):
@@ -71,14 +73,26 @@ class Application(models.Model):
     created_by = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
     updated_by = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, related_name='updated_by')
 
+    class Meta:
+        indexes = [
+            # keyset pagination
+            models.Index(fields=['created_at', 'id']),
+            # list filters (apis.filters), in the order of the keyset pagination
+            models.Index(fields=['status', 'created_at', 'id']),
+            models.Index(fields=['church', 'created_at', 'id']),
+            models.Index(fields=['support_type', 'status', 'created_at']),
+        ]
+
 
     def get_disbursed_amount(self) -> float:
         '''Returns the total amount disbursed for the application'''
-        return sum([disb.amount for disb in self.disbursement_set.all()])
+        ledger = ApplicationLedger.objects.filter(application=self).first()
+        return ledger.disbursed if ledger else 0
     
     def get_repayment_amount(self) -> float:
-        '''Returns the total amount repaid for the application'''
-        return sum([rep.amount for rep in self.repayment_set.all()])
+        '''Returns the total amount repaid (verified repayments) for the application'''
+        ledger = ApplicationLedger.objects.filter(application=self).first()
+        return ledger.repaid if ledger else 0
     
     def notify_applicant(self, started=False, submitted=False, approved=False, rejected=False):
         '''Notify the applicant that the application is received|approved|rejected'''
@@ -99,7 +113,7 @@ class Application(models.Model):
         else:
             # message defaults to started message
             msg = started_msg
-        send_sms(msg, [phone, phone2])
+        SmsOutbox.queue(msg, [phone, phone2])
 
     def __str__(self):
         return self.application_id
@@ -133,6 +147,15 @@ class Repayment(models.Model):
     created_by = models.ForeignKey(User, on_delete=models.PROTECT, null=True, blank=True, related_name='creator')
     updated_by = models.ForeignKey(User, on_delete=models.PROTECT, null=True, blank=True, related_name='updator')
 
+    class Meta:
+        indexes = [
+            # keyset pagination
+            models.Index(fields=['date_paid', 'id']),
+            # list filters (apis.filters), in the order of the keyset pagination
+            models.Index(fields=['status', 'date_paid', 'id']),
+            models.Index(fields=['application', 'date_paid', 'id']),
+        ]
+
     def __str__(self):
         return f"{self.repayment_id} - {self.amount}"
     
@@ -156,6 +179,12 @@ class ProgressReport(models.Model):
     created_by = models.ForeignKey(User, on_delete=models.PROTECT, null=True, blank=True)
     updated_by = models.ForeignKey(User, on_delete=models.PROTECT, null=True, blank=True, related_name='progress')
 
+    class Meta:
+        indexes = [
+            # keyset pagination
+            models.Index(fields=['created_at', 'id']),
+        ]
+
     def __str__(self):
         return self.report_id
     
@@ -186,16 +215,147 @@ class Disbursement(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     created_by = models.ForeignKey(User, on_delete=models.PROTECT, null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            # keyset pagination
+            models.Index(fields=['created_at', 'id']),
+            # list filters (apis.filters)
+            models.Index(fields=['status', 'created_at', 'id']),
+            models.Index(fields=['application', 'created_at', 'id']),
+            models.Index(fields=['date_paid']),
+        ]
+
     def notify_applicant_church(self):
         '''notify the church that disbursement has been made'''
         msg = f"Greetings from the NIDF Team.\n\nWe just disbursed {self.amount} to your church. Your application ID is {self.application.application_id}. Thank you.\n\nThe NIDF Team."
         phone = self.application.church.pastor_phone
-        send_sms(msg, [phone])
+        SmsOutbox.queue(msg, [phone])
 
     def __str__(self):
         return f"{self.disbursement_id} - {self.amount}"
     
 
+class RepaymentInstallment(models.Model):
+    '''Monthly installment of a revolving fund application, maintained by apis.schedules'''
+    application = models.ForeignKey(Application, on_delete=models.CASCADE, related_name='installments')
+    number = models.PositiveIntegerField()
+    due_date = models.DateField()
+    amount_due = models.DecimalField(max_digits=15, decimal_places=2, default=0.00)
+    amount_allocated = models.DecimalField(max_digits=15, decimal_places=2, default=0.00)
+
+    # stamps
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['application', 'number'], name='unique_installment_number'),
+        ]
+        indexes = [
+            models.Index(fields=['due_date']),
+        ]
+
+    @property
+    def balance(self) -> float:
+        '''Returns the amount still owed on the installment'''
+        return self.amount_due - self.amount_allocated
+
+    def __str__(self):
+        return f"{self.application} - {self.number}"
+
+
+class ApplicationLedger(models.Model):
+    '''Running disbursed/repaid totals of an application, maintained by apis.ledger'''
+    application = models.OneToOneField(Application, on_delete=models.CASCADE, related_name='ledger')
+    disbursed = models.DecimalField(max_digits=15, decimal_places=2, default=0.00)
+    repaid = models.DecimalField(max_digits=15, decimal_places=2, default=0.00)
+    outstanding = models.DecimalField(max_digits=15, decimal_places=2, default=0.00)
+
+    # stamps
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.application} - {self.outstanding}"
+
+
+class ChurchLedger(models.Model):
+    '''Running disbursed/repaid totals of a church, maintained by apis.ledger'''
+    church = models.OneToOneField(Church, on_delete=models.CASCADE, related_name='ledger')
+    disbursed = models.DecimalField(max_digits=15, decimal_places=2, default=0.00)
+    repaid = models.DecimalField(max_digits=15, decimal_places=2, default=0.00)
+    outstanding = models.DecimalField(max_digits=15, decimal_places=2, default=0.00)
+
+    # stamps
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.church} - {self.outstanding}"
+
+
+class PortfolioFigures(models.Model):
+    '''Portfolio figures shared by the rollup and snapshot models'''
+    churches = models.IntegerField(default=0)
+
+    # applications by status
+    draft_applications = models.IntegerField(default=0)
+    pending_applications = models.IntegerField(default=0)
+    under_review_applications = models.IntegerField(default=0)
+    waiting_approval_applications = models.IntegerField(default=0)
+    approved_applications = models.IntegerField(default=0)
+    rejected_applications = models.IntegerField(default=0)
+
+    # money
+    disbursed = models.DecimalField(max_digits=15, decimal_places=2, default=0.00)
+    repaid = models.DecimalField(max_digits=15, decimal_places=2, default=0.00)
+    arrears = models.DecimalField(max_digits=15, decimal_places=2, default=0.00)
+
+    class Meta:
+        abstract = True
+
+
+class DistrictRollup(PortfolioFigures):
+    '''Portfolio figures of a district, maintained by apis.rollups'''
+    district = models.OneToOneField(District, on_delete=models.CASCADE, related_name='rollup')
+
+    # stamps
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.district} rollup"
+
+
+class RegionRollup(PortfolioFigures):
+    '''Portfolio figures of a region, maintained by apis.rollups'''
+    region = models.OneToOneField(Region, on_delete=models.CASCADE, related_name='rollup')
+
+    # stamps
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.region} rollup"
+
+
+class PortfolioSnapshot(PortfolioFigures):
+    '''Daily portfolio figures of a region (or of the whole nation when region is empty)'''
+    date = models.DateField()
+    region = models.ForeignKey(Region, on_delete=models.CASCADE, null=True, blank=True, related_name='snapshots')
+
+    # stamps
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'region'], name='unique_region_snapshot_per_day'),
+            models.UniqueConstraint(fields=['date'], condition=models.Q(region__isnull=True), name='unique_national_snapshot_per_day'),
+        ]
+        indexes = [
+            models.Index(fields=['region', 'date']),
+        ]
+
+    def __str__(self):
+        return f"{self.region or 'National'} - {self.date}"
+
+
 class Notification(models.Model):
     '''Notification model'''
     title = models.CharField(max_length=255, null=False, blank=False)
@@ -206,6 +366,16 @@ class Notification(models.Model):
     schedule_frequency = models.CharField(max_length=20, default=Frequency.WEEKLY.value)
     target = models.CharField(max_length=20, choices=CL().notification_targets, default=Target.ALL.value)
     attachment = models.FileField(upload_to='notifications/', null=True, blank=True)
+
+    # selection target: who to reach in the selected regions, districts and churches
+    regions = models.ManyToManyField(Region, blank=True, related_name='notifications')
+    districts = models.ManyToManyField(District, blank=True, related_name='notifications')
+    churches = models.ManyToManyField(Church, blank=True, related_name='notifications')
+    include_church_users = models.BooleanField(default=True)
+    include_pastors = models.BooleanField(default=True)
+    include_managers = models.BooleanField(default=False)
+    include_overseers = models.BooleanField(default=False)
+
     # stamps
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -213,6 +383,12 @@ class Notification(models.Model):
     broadcasted_by = models.ForeignKey(User, on_delete=models.PROTECT, null=True, blank=True)
     created_by = models.ForeignKey(User, on_delete=models.PROTECT, null=True, blank=True, related_name='created_by')
 
+    class Meta:
+        indexes = [
+            # keyset pagination
+            models.Index(fields=['created_at', 'id']),
+        ]
+
     def can_broadcast(self) -> bool:
         '''Checks if the notification can be broadcasted'''
         if not self.is_scheduled:
@@ -260,31 +436,14 @@ class Notification(models.Model):
     
     
     def broadcast(self, user: User = None, channel: str = NotificationChannel.SMS.value):
-        '''Broadcasts the notification to a user'''
-        if self.target == Target.ALL.value:
-            # get all the phones for the users
-            phones = [u.phone for u in User.objects.all()]
-        elif self.target == Target.CHURCH.value:
-            # get all the phones for the church and the pastor
-            churches = Church.objects.all()
-            phones = [u.pastor_phone for u in churches].extend([u.church_phone for u in churches])
-        elif self.target == Target.REGION.value:
-            # get all the phones for the region and the overseer
-            regions = Region.objects.all()
-            phones = [u.phone for u in regions].extend([u.overseer_phone for u in regions])
-        elif self.target == Target.DISTRICT.value:
-            # get all the phones for the district and the overseer
-            districts = District.objects.all()
-            phones = [u.phone for u in districts].extend([u.overseer_phone for u in districts])
-        else:
-            # get the phone for the user
-            if not user:
-                return
-            phones = [user.phone]
+        '''Broadcasts the notification to its target audience (or to a user) in outbox batches (see apis.broadcast)'''
+        from apis.broadcast import queue_broadcast, target_phones
+        if self.target not in (target.value for target in Target) and not user:
+            return
 
         # send the notification to the phones
         msg = f"{self.title}\n\n{self.message}"
-        send_sms(recipients=phones, message=msg)
+        queue_broadcast(self, msg, target_phones(self, user))
 
         self.broadcasted_by = user
         self.broadcasted_at = timezone.now()
@@ -292,5 +451,99 @@ class Notification(models.Model):
 
         return True
 
+    def audience(self):
+        '''Returns the distinct phones of the selection target (one query, see apis.broadcast.audience_phones)'''
+        from apis.broadcast import audience_phones
+        return audience_phones(
+            self.regions.all(), self.districts.all(), self.churches.all(),
+            church_users=self.include_church_users, pastors=self.include_pastors,
+            managers=self.include_managers, overseers=self.include_overseers,
+        )
+
+    def __str__(self):
+        return self.title
+
+
+class SmsOutbox(models.Model):
+    '''An SMS waiting to be (or already) sent by the outbox worker (see apis.outbox)'''
+    sender = models.CharField(max_length=11, null=True, blank=True)
+    message = models.TextField()
+    recipients = models.JSONField(default=list)
+    notification = models.ForeignKey(Notification, on_delete=models.SET_NULL, null=True, blank=True, related_name='sms_batches')
+
+    # delivery
+    status = models.CharField(max_length=10, choices=CL.sms_statuses, default=SmsStatus.PENDING.value)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    claimed_by = models.CharField(max_length=36, null=True, blank=True) # batch of the worker sending it
+    locked_until = models.DateTimeField(null=True, blank=True) # retried by another worker after this
+    provider_response = models.JSONField(null=True, blank=True)
+    last_error = models.TextField(blank=True, default='')
+
+    # stamps
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # outbox worker polling
+            models.Index(fields=['status', 'next_attempt_at']),
+        ]
+
+    @classmethod
+    def queue(cls, message: str, recipients: list, sender: str = None):
+        '''
+        Queues an SMS for the outbox worker instead of calling the gateway in the request.
+        The row is written in the caller's transaction, so it is only sent once that commits.
+        '''
+        recipients = [phone for phone in dict.fromkeys(map(normalize_phone, recipients or [])) if phone]
+        if not recipients:
+            return None
+        return cls.objects.create(message=message, recipients=recipients, sender=sender or settings.SENDER_ID)
+
+    def __str__(self):
+        return f"{self.status} - {', '.join(self.recipients)}"
+
+
+class SmsDelivery(models.Model):
+    '''
+    The delivery of an outbox message to one of its recipients, recorded once the gateway
+    accepted (or finally refused) the message and updated from the gateway delivery reports
+    '''
+    outbox = models.ForeignKey(SmsOutbox, on_delete=models.CASCADE, related_name='deliveries')
+    phone = models.CharField(max_length=15)
+    status = models.CharField(max_length=10, choices=CL.delivery_statuses, default=DeliveryStatus.SENT.value)
+    provider_id = models.CharField(max_length=64, null=True, blank=True) # message id given by the gateway
+    error = models.CharField(max_length=255, blank=True, default='')
+
+    # stamps
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    delivered_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # delivery reports
+            models.Index(fields=['provider_id']),
+            # failed recipients of a message
+            models.Index(fields=['outbox', 'status']),
+        ]
+
+    @classmethod
+    def record(cls, sms: SmsOutbox, status: str, provider_ids: dict = None, error: str = '', batch_size: int = 1000) -> None:
+        '''Records the delivery of every recipient of an outbox message in bulk (`provider_ids`: gateway id per phone)'''
+        now = timezone.now()
+        provider_ids = provider_ids or {}
+        sent_at = now if status == DeliveryStatus.SENT.value else None
+        cls.objects.bulk_create(
+            (
+                cls(outbox=sms, phone=phone, status=status, provider_id=provider_ids.get(phone), error=error[:255], sent_at=sent_at)
+                for phone in sms.recipients
+            ),
+            batch_size=batch_size,
+        )
+
     def __str__(self):
-        return self.title
\ No newline at end of file
+        return f"{self.phone} - {self.status}"
@@ -0,0 +1,212 @@
+'''
+This module delivers the SMS outbox. Request handlers only insert SmsOutbox rows
+(SmsOutbox.queue); workers (`manage.py run_sms_worker`) claim due messages in batches,
+send them concurrently and record the outcome. Failed messages are retried with
+exponential backoff, and dead-lettered when the gateway rejects them or after
+SMS_MAX_ATTEMPTS attempts. Claims are leased, so messages held by a crashed
+worker are picked up again once SMS_LEASE seconds have passed.
+The delivery to every recipient is recorded (SmsDelivery, inserted in bulk with the
+gateway message ids) and updated from the gateway delivery reports, which are
+applied REPORT_BATCH_SIZE at a time with one UPDATE per status (and reason).
+
+'''
+
+import os
+import random
+import socket
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, F, Q
+from django.utils import timezone
+
+from apis.models import SmsDelivery, SmsOutbox
+from nidfcore.utils.constants import DeliveryStatus, SmsStatus
+from nidfcore.utils.services import get_gateway, send_sms
+
+METRICS_KEY = 'sms-gateway-metrics'
+# snapshots of workers that stopped reporting for this long are dropped
+METRICS_STALE_AFTER = 5 * 60
+REPORT_BATCH_SIZE = 1000
+# gateway delivery report statuses
+REPORT_STATUSES = {
+    'DELIVERED': DeliveryStatus.DELIVERED.value,
+    'DELIVRD': DeliveryStatus.DELIVERED.value,
+    'SENT': DeliveryStatus.SENT.value,
+    'SUBMITTED': DeliveryStatus.SENT.value,
+    'ACCEPTED': DeliveryStatus.SENT.value,
+    'PENDING': DeliveryStatus.SENT.value,
+    'FAILED': DeliveryStatus.FAILED.value,
+    'UNDELIVERED': DeliveryStatus.FAILED.value,
+    'UNDELIV': DeliveryStatus.FAILED.value,
+    'REJECTED': DeliveryStatus.FAILED.value,
+    'EXPIRED': DeliveryStatus.FAILED.value,
+}
+# order of the delivery statuses
+STATUS_RANK = {
+    DeliveryStatus.SENT.value: 0,
+    DeliveryStatus.FAILED.value: 1,
+    DeliveryStatus.DELIVERED.value: 1,
+}
+
+
+def _due(now) -> Q:
+    '''Messages waiting for an attempt, or held by a worker whose lease expired'''
+    return (
+        Q(status=SmsStatus.PENDING.value, next_attempt_at__lte=now)
+        | Q(status=SmsStatus.SENDING.value, locked_until__lt=now)
+    )
+
+
+def claim_batch(size: int) -> list:
+    '''Claims up to `size` due messages for this worker (safe with concurrent workers)'''
+    now = timezone.now()
+    ids = list(SmsOutbox.objects.filter(_due(now)).order_by('next_attempt_at', 'id').values_list('id', flat=True)[:size])
+    if not ids:
+        return []
+    claim = str(uuid.uuid4())
+    # only rows still due are taken: a row claimed by another worker in between is skipped
+    SmsOutbox.objects.filter(_due(now), pk__in=ids).update(
+        status=SmsStatus.SENDING.value, claimed_by=claim, attempts=F('attempts') + 1,
+        locked_until=now + timedelta(seconds=settings.SMS_LEASE), updated_at=now,
+    )
+    return list(SmsOutbox.objects.filter(claimed_by=claim, status=SmsStatus.SENDING.value).order_by('id'))
+
+
+def record_sent(sms: SmsOutbox, response: dict) -> None:
+    '''Marks a message as sent with the gateway response, and records the delivery to its recipients'''
+    now = timezone.now()
+    claimed = SmsOutbox.objects.filter(pk=sms.pk, claimed_by=sms.claimed_by).update(
+        status=SmsStatus.SENT.value, provider_response=response, last_error='',
+        sent_at=now, locked_until=None, updated_at=now,
+    )
+    # not recorded twice when the lease expired and another worker sent it too
+    if claimed:
+        SmsDelivery.record(sms, DeliveryStatus.SENT.value, _provider_ids(response))
+
+
+def _provider_ids(response) -> dict:
+    '''The gateway message id of every recipient of a send response ({"data": [{"recipient", "id"}]})'''
+    data = response.get('data') if isinstance(response, dict) else None
+    if not isinstance(data, list):
+        return {}
+    return {
+        str(item['recipient']): str(item['id'])
+        for item in data if isinstance(item, dict) and item.get('recipient') and item.get('id')
+    }
+
+
+def retry_delay(attempts: int) -> float:
+    '''Seconds before the next attempt: doubled on every attempt, capped, with jitter'''
+    delay = min(settings.SMS_RETRY_DELAY * 2 ** (attempts - 1), settings.SMS_RETRY_MAX_DELAY)
+    return delay * random.uniform(0.8, 1.2)
+
+
+def record_failure(sms: SmsOutbox, error: Exception) -> str:
+    '''Schedules a retry of a failed message, or dead-letters it; returns the new status'''
+    now = timezone.now()
+    if getattr(error, 'short_circuited', False):
+        # the gateway was not called: released for the next claim without using up an attempt
+        SmsOutbox.objects.filter(pk=sms.pk, claimed_by=sms.claimed_by).update(
+            status=SmsStatus.PENDING.value, attempts=F('attempts') - 1, last_error=str(error),
+            next_attempt_at=now, locked_until=None, updated_at=now,
+        )
+        return SmsStatus.PENDING.value
+    permanent = getattr(error, 'permanent', False)
+    dead = permanent or sms.attempts >= settings.SMS_MAX_ATTEMPTS
+    status = SmsStatus.DEAD.value if dead else SmsStatus.PENDING.value
+    claimed = SmsOutbox.objects.filter(pk=sms.pk, claimed_by=sms.claimed_by).update(
+        status=status, last_error=str(error)[:1000], provider_response=getattr(error, 'response', None),
+        next_attempt_at=now if dead else now + timedelta(seconds=retry_delay(sms.attempts)),
+        locked_until=None, updated_at=now,
+    )
+    if dead and claimed:
+        SmsDelivery.record(sms, DeliveryStatus.FAILED.value, error=str(error))
+    return status
+
+
+def dispatch(batch: list, executor: ThreadPoolExecutor) -> dict:
+    '''Sends a claimed batch concurrently and records every outcome; returns the count per status'''
+    # the senders only talk to the gateway, the outcomes are written from this thread
+    futures = {executor.submit(send_sms, sms.message, sms.recipients, sms.sender): sms for sms in batch}
+    counts = {}
+    for future in as_completed(futures):
+        sms = futures[future]
+        try:
+            response = future.result()
+        except Exception as error:
+            # SmsDeliveryError says if the failure is permanent, anything else is retried
+            status = record_failure(sms, error)
+        else:
+            record_sent(sms, response)
+            status = SmsStatus.SENT.value
+        counts[status] = counts.get(status, 0) + 1
+    return counts
+
+
+def apply_delivery_reports(reports: list) -> dict:
+    '''
+    Applies gateway delivery reports ({"id": gateway message id, "status", "reason"?}) in bulk:
+    per REPORT_BATCH_SIZE reports, one SELECT and one UPDATE per distinct status and reason.
+    Returns the counts of updated, ignored (stale or repeated) and unknown (no such message or status) reports.
+    '''
+    latest = {}
+    valid = 0
+    for report in reports:
+        status = REPORT_STATUSES.get(str(report.get('status', '')).upper()) if isinstance(report, dict) else None
+        if status and report.get('id'):
+            valid += 1
+            # the last report of a message wins
+            latest[str(report['id'])] = (status, str(report.get('reason') or '')[:255])
+    counts = {"updated": 0, "ignored": valid - len(latest), "unknown": len(reports) - valid}
+    ids = list(latest)
+    now = timezone.now()
+    with transaction.atomic():
+        for start in range(0, len(ids), REPORT_BATCH_SIZE):
+            chunk = ids[start:start + REPORT_BATCH_SIZE]
+            found = 0
+            changes = {}
+            for pk, provider_id, current in SmsDelivery.objects.filter(provider_id__in=chunk).values_list('pk', 'provider_id', 'status'):
+                found += 1
+                status, reason = latest[provider_id]
+                # a late report never moves a delivery back (and retried deliveries are left alone)
+                if STATUS_RANK[status] > STATUS_RANK.get(current, len(STATUS_RANK)):
+                    changes.setdefault((status, reason), []).append(pk)
+            updated = 0
+            for (status, reason), pks in changes.items():
+                updated += SmsDelivery.objects.filter(pk__in=pks).update(
+                    status=status, error=reason if status == DeliveryStatus.FAILED.value else '',
+                    delivered_at=now if status == DeliveryStatus.DELIVERED.value else None, updated_at=now,
+                )
+            counts["updated"] += updated
+            counts["ignored"] += found - updated
+            counts["unknown"] += len(chunk) - found
+    return counts
+
+
+def publish_metrics() -> None:
+    '''Shares the gateway counters of this worker process through the cache (read by the metrics endpoint)'''
+    gateway = get_gateway()
+    now = time.time()
+    workers = {
+        name: snapshot for name, snapshot in cache.get(METRICS_KEY, {}).items()
+        if now - snapshot["reported_at"] < METRICS_STALE_AFTER
+    }
+    workers[f"{socket.gethostname()}:{os.getpid()}"] = {
+        **gateway.metrics.snapshot(), "circuit": gateway.breaker.state, "reported_at": now,
+    }
+    cache.set(METRICS_KEY, workers, None)
+
+
+def outbox_metrics() -> dict:
+    '''Returns the outbox size per status and the gateway counters of the running workers'''
+    return {
+        "outbox": dict(SmsOutbox.objects.values_list('status').annotate(count=Count('id')).order_by()),
+        "workers": cache.get(METRICS_KEY, {}),
+    }
+
@@ -0,0 +1,114 @@
+'''
+This module holds the projection read path of the hot list endpoints.
+Rows are read with `.values()` over the joined columns their serializer renders
+and turned into response dicts directly, without a model or serializer per row.
+Each column goes through the serializer field that would have rendered it, and
+shared relations (the church hierarchy) are serialized once per distinct object,
+so the JSON is the same as the serializer's (see the contract tests in apis/tests.py).
+
+'''
+
+from rest_framework import serializers
+
+from apis.serializers import GetChurchSerializer
+
+# serializer fields that render a column value as is
+PLAIN_FIELDS = (
+    serializers.CharField, serializers.IntegerField, serializers.BooleanField,
+    serializers.FloatField, serializers.ChoiceField, serializers.PrimaryKeyRelatedField,
+)
+
+COLUMN, NESTED, SHARED = 'column', 'nested', 'shared'
+
+
+class Projection:
+    '''
+    Reads and renders the rows of a ModelSerializer (fields = "__all__" style: model
+    columns, nested serializers and their foreign keys). Nested serializers listed in
+    `shared_serializers` are serialized once per distinct primary key.
+    '''
+
+    def __init__(self, serializer_class, shared_serializers: tuple = ()):
+        self.serializer_class = serializer_class
+        self.shared_serializers = shared_serializers
+        self.columns = []
+        self.shared = []
+        self.layout = self._layout(serializer_class(), '')
+
+    def _layout(self, serializer, prefix: str) -> list:
+        '''Returns the (name, kind, values() path, converter or nested layout) entries of a serializer'''
+        layout = []
+        model = serializer.Meta.model
+        for name, field in serializer.fields.items():
+            path = f'{prefix}{field.source}'
+            self.columns.append(path)
+            if isinstance(field, self.shared_serializers):
+                layout.append((name, SHARED, path, type(field)))
+                self.shared.append((path, type(field)))
+            elif isinstance(field, serializers.BaseSerializer):
+                layout.append((name, NESTED, path, self._layout(field, f'{path}__')))
+            else:
+                # raises FieldDoesNotExist for fields that are not model columns
+                model_field = model._meta.get_field(field.source)
+                layout.append((name, COLUMN, path, self._converter(field, model_field)))
+        return layout
+
+    @staticmethod
+    def _converter(field, model_field):
+        '''Returns the function rendering a column value like `field` (None: as is)'''
+        if isinstance(field, serializers.FileField):
+            # serializers render files as their storage url (relative without a request in the context)
+            storage = model_field.storage
+            return lambda name: storage.url(name) if name else None
+        if isinstance(field, PLAIN_FIELDS):
+            return None
+        return field.to_representation
+
+    def values(self, queryset):
+        '''Restricts a queryset to the rows as dicts of the projected columns'''
+        return queryset.values(*self.columns)
+
+    def load_shared(self, rows) -> dict:
+        '''Serializes the shared relations of the rows, once per object (3 queries for churches)'''
+        ids = {}
+        for path, serializer_class in self.shared:
+            ids.setdefault(serializer_class, set()).update(row[path] for row in rows)
+        shared = {}
+        for serializer_class, pks in ids.items():
+            model = serializer_class.Meta.model
+            queryset = model.objects.filter(pk__in=pks - {None})
+            if hasattr(serializer_class, 'eager_load'):
+                queryset = serializer_class.eager_load(queryset)
+            pk_name = model._meta.pk.name
+            shared[serializer_class] = {item[pk_name]: item for item in serializer_class(queryset, many=True).data}
+        return shared
+
+    def render(self, rows) -> list:
+        '''Renders rows read with `values` as the serializer would render their objects'''
+        rows = list(rows)
+        shared = self.load_shared(rows)
+        return [self._render_row(row, self.layout, shared) for row in rows]
+
+    def _render_row(self, row: dict, layout: list, shared: dict) -> dict:
+        data = {}
+        for name, kind, path, spec in layout:
+            value = row[path]
+            if value is None:
+                data[name] = None
+            elif kind == COLUMN:
+                data[name] = value if spec is None else spec(value)
+            elif kind == NESTED:
+                data[name] = self._render_row(row, spec, shared)
+            else:
+                data[name] = shared[spec].get(value)
+        return data
+
+
+_projections = {}
+
+
+def get_projection(serializer_class) -> Projection:
+    '''Returns the projection of a serializer, built on first use'''
+    if serializer_class not in _projections:
+        _projections[serializer_class] = Projection(serializer_class, shared_serializers=(GetChurchSerializer,))
+    return _projections[serializer_class]
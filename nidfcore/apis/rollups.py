@@ -0,0 +1,194 @@
+'''
+This module maintains the portfolio rollups (DistrictRollup and RegionRollup).
+A district rollup is recomputed from grouped aggregates over its churches,
+applications and church ledgers whenever one of them is written, and the region
+rollups are then summed from their district rollups. National figures are the
+sum of the region rollups, so every dashboard read is a constant-size query.
+A refresh locks the rollup rows it rewrites before reading the figures, so
+concurrent writes to a district are recomputed one after the other and the last
+one stored always includes the others.
+
+'''
+
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+
+from accounts.models import Church, District, Region
+from apis.models import Application, ChurchLedger, DistrictRollup, RegionRollup
+from nidfcore.utils.constants import ApplicationStatus
+
+STATUS_FIELDS = {
+    ApplicationStatus.DRAFT.value: 'draft_applications',
+    ApplicationStatus.PENDING.value: 'pending_applications',
+    ApplicationStatus.UNDER_REVIEW.value: 'under_review_applications',
+    ApplicationStatus.WAITING_NO_APPROVAL.value: 'waiting_approval_applications',
+    ApplicationStatus.APPROVED.value: 'approved_applications',
+    ApplicationStatus.REJECTED.value: 'rejected_applications',
+}
+MONEY_FIELDS = ['disbursed', 'repaid', 'arrears']
+FIGURE_FIELDS = ['churches', *STATUS_FIELDS.values(), *MONEY_FIELDS]
+
+
+def empty_figures() -> dict:
+    '''Returns a set of figures with every value at zero'''
+    figures = {field: 0 for field in FIGURE_FIELDS}
+    figures.update({field: Decimal('0.00') for field in MONEY_FIELDS})
+    return figures
+
+
+def compute_district_figures(district_ids: set = None) -> dict:
+    '''Computes the figures of the given districts (all districts if None) in 3 grouped queries'''
+    churches = Church.objects.filter(district__isnull=False)
+    applications = Application.objects.filter(church__district__isnull=False)
+    ledgers = ChurchLedger.objects.filter(church__district__isnull=False)
+    if district_ids is not None:
+        churches = churches.filter(district_id__in=district_ids)
+        applications = applications.filter(church__district_id__in=district_ids)
+        ledgers = ledgers.filter(church__district_id__in=district_ids)
+
+    figures = {}
+    for row in churches.values('district_id').annotate(total=Count('pk')):
+        figures.setdefault(row['district_id'], empty_figures())['churches'] = row['total']
+
+    status_counts = {field: Count('pk', filter=Q(status=value)) for value, field in STATUS_FIELDS.items()}
+    for row in applications.values('church__district_id').annotate(**status_counts):
+        district_figures = figures.setdefault(row['church__district_id'], empty_figures())
+        district_figures.update({field: row[field] for field in STATUS_FIELDS.values()})
+
+    for row in ledgers.values('church__district_id').annotate(total_disbursed=Sum('disbursed'), total_repaid=Sum('repaid'), total_arrears=Sum('outstanding')):
+        district_figures = figures.setdefault(row['church__district_id'], empty_figures())
+        district_figures.update(disbursed=row['total_disbursed'], repaid=row['total_repaid'], arrears=row['total_arrears'])
+    return figures
+
+
+def _lock(model, key: str, ids) -> dict:
+    '''
+    Locks the rollup rows of a model keyed by `key` (e.g. district_id), creating the missing ones;
+    rows are locked in key order, so concurrent refreshes cannot deadlock
+    '''
+    ids = set(ids)
+    existing = set(model.objects.filter(**{f'{key}__in': ids}).values_list(key, flat=True))
+    model.objects.bulk_create([model(**{key: pk}) for pk in ids - existing], ignore_conflicts=True)
+    rows = model.objects.select_for_update().filter(**{f'{key}__in': ids}).order_by(key)
+    return {getattr(row, key): row for row in rows}
+
+
+def _store(model, rows: dict, figures: dict) -> None:
+    '''Updates the locked rollup rows (see _lock) with their figures'''
+    now = timezone.now()
+    for pk, values in figures.items():
+        row = rows[pk]
+        for field, value in values.items():
+            setattr(row, field, value)
+        row.updated_at = now
+    model.objects.bulk_update(rows.values(), [*FIGURE_FIELDS, 'updated_at'])
+
+
+def refresh_regions(region_ids) -> None:
+    '''Recomputes the region rollups from their district rollups'''
+    region_ids = {pk for pk in region_ids if pk}
+    if not region_ids:
+        return
+    with transaction.atomic():
+        region_ids = set(Region.objects.filter(pk__in=region_ids).values_list('pk', flat=True))
+        rows = _lock(RegionRollup, 'region_id', region_ids)
+        figures = {pk: empty_figures() for pk in region_ids}
+        sums = {field: Sum(field) for field in FIGURE_FIELDS}
+        districts = DistrictRollup.objects.filter(district__region_id__in=region_ids).values('district__region_id').annotate(**sums)
+        for row in districts:
+            figures[row['district__region_id']].update({field: row[field] for field in FIGURE_FIELDS})
+        _store(RegionRollup, rows, figures)
+
+
+def refresh_districts(district_ids, region_ids=()) -> None:
+    '''Recomputes the rollups of the given districts and of their regions'''
+    district_ids = {pk for pk in district_ids if pk}
+    region_ids = set(region_ids)
+    with transaction.atomic():
+        if district_ids:
+            districts = dict(District.objects.filter(pk__in=district_ids).values_list('pk', 'region_id'))
+            # locked before reading: a concurrent write waits, then reads the figures stored here
+            rows = _lock(DistrictRollup, 'district_id', districts)
+            computed = compute_district_figures(set(districts))
+            _store(DistrictRollup, rows, {pk: computed.get(pk, empty_figures()) for pk in districts})
+            region_ids.update(districts.values())
+        refresh_regions(region_ids)
+
+
+def refresh_for_churches(church_ids) -> None:
+    '''Recomputes the rollups of the districts the given churches belong to'''
+    church_ids = {pk for pk in church_ids if pk}
+    if church_ids:
+        refresh_districts(Church.objects.filter(pk__in=church_ids).values_list('district_id', flat=True))
+
+
+def refresh_for_applications(application_ids) -> None:
+    '''Recomputes the rollups of the districts the given applications belong to'''
+    application_ids = {pk for pk in application_ids if pk}
+    if application_ids:
+        refresh_districts(Application.objects.filter(pk__in=application_ids).values_list('church__district_id', flat=True))
+
+
+# the columns whose changes move a rollup, per model
+TRACKED_FIELDS = {
+    Application: ('status', 'church_id'),
+    Church: ('district_id',),
+    District: ('region_id',),
+}
+
+
+def remember_previous(instance) -> None:
+    '''Stores the persisted hierarchy/status columns of an instance before it is saved'''
+    fields = TRACKED_FIELDS[type(instance)]
+    previous = None
+    if instance.pk:
+        previous = type(instance).objects.filter(pk=instance.pk).values(*fields).first()
+    instance._rollup_previous = previous
+
+
+def instance_saved(instance, created: bool) -> None:
+    '''Refreshes the rollups affected by a saved application, church or district'''
+    fields = TRACKED_FIELDS[type(instance)]
+    previous = getattr(instance, '_rollup_previous', None)
+    instance._rollup_previous = None
+    if not created and previous is not None and all(previous[f] == getattr(instance, f) for f in fields):
+        return
+    previous = previous or {}
+    if isinstance(instance, Application):
+        refresh_for_churches({instance.church_id, previous.get('church_id')})
+    elif isinstance(instance, Church):
+        refresh_districts({instance.district_id, previous.get('district_id')})
+    elif isinstance(instance, District):
+        refresh_districts({instance.pk}, region_ids={previous.get('region_id')})
+
+
+def instance_deleted(instance) -> None:
+    '''Refreshes the rollups affected by a deleted application, church or district'''
+    if isinstance(instance, Application):
+        refresh_for_churches({instance.church_id})
+    elif isinstance(instance, Church):
+        refresh_districts({instance.district_id})
+    elif isinstance(instance, District):
+        refresh_regions({instance.region_id})
+
+
+def rebuild_rollups() -> tuple:
+    '''Rebuilds every district and region rollup in one pass'''
+    with transaction.atomic():
+        districts = list(District.objects.values_list('pk', flat=True))
+        rows = _lock(DistrictRollup, 'district_id', districts)
+        computed = compute_district_figures()
+        _store(DistrictRollup, rows, {pk: computed.get(pk, empty_figures()) for pk in districts})
+        region_ids = list(Region.objects.values_list('pk', flat=True))
+        refresh_regions(region_ids)
+    return len(districts), len(region_ids)
+
+
+def get_national_figures() -> dict:
+    '''Returns the national figures summed from the region rollups (1 query)'''
+    figures = RegionRollup.objects.aggregate(**{field: Sum(field) for field in FIGURE_FIELDS})
+    defaults = empty_figures()
+    return {field: value if value is not None else defaults[field] for field, value in figures.items()}
@@ -0,0 +1,86 @@
+'''
+This module materializes the repayment schedules of revolving fund applications.
+An approved application gets one RepaymentInstallment per month until its amount is
+covered by `monthly_repayment_amount`, the first one due a month after its first
+disbursement (whether it was approved before or after being disbursed, and whether
+the schedule is made live or backfilled by generate_schedules). Verified repayments are
+allocated to the installments oldest first, so overdue installments can be found
+with a single range query on the indexed due dates.
+
+'''
+
+import calendar
+from datetime import date
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F, Min
+
+from apis.models import Application, ApplicationLedger, RepaymentInstallment
+from nidfcore.utils.constants import ApplicationStatus, SupportType
+
+ZERO = Decimal('0.00')
+
+
+def add_months(day: date, months: int) -> date:
+    '''Returns the same day `months` later, clamped to the end of shorter months'''
+    month_index = day.month - 1 + months
+    year, month = day.year + month_index // 12, month_index % 12 + 1
+    return date(year, month, min(day.day, calendar.monthrange(year, month)[1]))
+
+
+def needs_schedule(application: Application) -> bool:
+    '''Checks if the application is a revolving fund that should be repaid in installments'''
+    return (
+        application.support_type == SupportType.REVOLVING_FUND.value
+        and application.status == ApplicationStatus.APPROVED.value
+        and application.amount > 0
+        and application.monthly_repayment_amount > 0
+    )
+
+
+def schedule_start(application: Application) -> date:
+    '''Returns the date the schedule of an application starts from: its first disbursement (None until disbursed)'''
+    return application.disbursement_set.aggregate(first=Min('date_paid'))['first']
+
+
+def ensure_schedule(application: Application, start: date) -> int:
+    '''Creates the installments of an application (first one due a month after `start`) if it has none'''
+    if not needs_schedule(application) or application.installments.exists():
+        return 0
+    amount = Decimal(application.amount)
+    monthly = Decimal(application.monthly_repayment_amount)
+    installments = []
+    number = 1
+    while amount > 0:
+        amount_due = min(monthly, amount)
+        installments.append(RepaymentInstallment(
+            application=application, number=number, due_date=add_months(start, number), amount_due=amount_due,
+        ))
+        amount -= amount_due
+        number += 1
+    with transaction.atomic():
+        RepaymentInstallment.objects.bulk_create(installments)
+        allocate_repayments(application.pk)
+    return len(installments)
+
+
+def allocate_repayments(application_id: int) -> None:
+    '''Spreads the verified repayments of an application over its installments, oldest first'''
+    installments = list(RepaymentInstallment.objects.filter(application_id=application_id).order_by('number'))
+    if not installments:
+        return
+    remaining = ApplicationLedger.objects.filter(application_id=application_id).values_list('repaid', flat=True).first() or ZERO
+    changed = []
+    for installment in installments:
+        allocated = max(min(installment.amount_due, remaining), ZERO)
+        remaining -= allocated
+        if installment.amount_allocated != allocated:
+            installment.amount_allocated = allocated
+            changed.append(installment)
+    RepaymentInstallment.objects.bulk_update(changed, ['amount_allocated'])
+
+
+def overdue_installments(as_of: date):
+    '''Returns the installments due before `as_of` that are not fully paid (one indexed range query)'''
+    return RepaymentInstallment.objects.filter(due_date__lt=as_of, amount_allocated__lt=F('amount_due'))
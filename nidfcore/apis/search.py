@@ -0,0 +1,226 @@
+'''
+This module maintains the full-text search index of applications, churches and
+progress reports. Every document is one row of `apis_search_index`, keyed by
+`doc_id` (object id * 8 + kind code) so it can be replaced or removed by key.
+SQLite uses an FTS5 virtual table ranked with bm25; PostgreSQL uses a table with a
+weighted, generated tsvector column behind a GIN index, ranked with ts_rank.
+Titles weigh more than bodies, and every search word matches as a prefix.
+
+'''
+
+import re
+
+from django.db import connection
+
+from accounts.models import Church, District
+from apis.models import Application, ProgressReport
+
+INDEX_TABLE = 'apis_search_index'
+BATCH_SIZE = 1000
+
+CREATE_INDEX = {
+    'sqlite': [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {INDEX_TABLE} USING fts5("
+        "kind UNINDEXED, object_id UNINDEXED, title, body, tokenize = 'unicode61 remove_diacritics 2')",
+    ],
+    'postgresql': [
+        f"CREATE TABLE IF NOT EXISTS {INDEX_TABLE} ("
+        "doc_id bigint PRIMARY KEY, kind varchar(20) NOT NULL, object_id integer NOT NULL, title text NOT NULL, body text NOT NULL, "
+        "document tsvector GENERATED ALWAYS AS ("
+        "setweight(to_tsvector('simple', title), 'A') || setweight(to_tsvector('simple', body), 'B')) STORED)",
+        f"CREATE INDEX IF NOT EXISTS {INDEX_TABLE}_document ON {INDEX_TABLE} USING GIN (document)",
+    ],
+}
+
+
+def application_documents(queryset):
+    '''Yields the (object id, title, body) documents of applications'''
+    rows = queryset.values_list(
+        'pk', 'application_id', 'church__location_name', 'church__pastor_name', 'project_location',
+        'type_of_church_project', 'phase', 'justification_for_aid',
+    )
+    for pk, reference, church, pastor, *body in rows.iterator(chunk_size=BATCH_SIZE):
+        yield pk, ' '.join(filter(None, [reference, church])), ' '.join(filter(None, [pastor, *body]))
+
+
+def church_documents(queryset):
+    '''Yields the (object id, title, body) documents of churches'''
+    rows = queryset.values_list('pk', 'location_name', 'pastor_name', 'manager_name', 'location_address', 'district__name')
+    for pk, name, *body in rows.iterator(chunk_size=BATCH_SIZE):
+        yield pk, name or '', ' '.join(filter(None, body))
+
+
+def progress_report_documents(queryset):
+    '''Yields the (object id, title, body) documents of progress reports'''
+    rows = queryset.values_list('pk', 'report_id', 'application__application_id', 'application__church__location_name', 'progress_description')
+    for pk, reference, application, church, description in rows.iterator(chunk_size=BATCH_SIZE):
+        yield pk, ' '.join(filter(None, [reference, application, church])), description or ''
+
+
+# kind -> (doc_id code, document builder)
+KINDS = {
+    'application': (1, application_documents),
+    'church': (2, church_documents),
+    'progress_report': (3, progress_report_documents),
+}
+
+
+def is_available() -> bool:
+    '''Checks if the database supports the search index'''
+    return connection.vendor in CREATE_INDEX
+
+
+def create_index() -> None:
+    '''Creates the search index table (no-op on unsupported databases)'''
+    for statement in CREATE_INDEX.get(connection.vendor, []):
+        with connection.cursor() as cursor:
+            cursor.execute(statement)
+
+
+def drop_index() -> None:
+    '''Drops the search index table'''
+    if is_available():
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {INDEX_TABLE}")
+
+
+def _doc_id(kind: str, object_id: int) -> int:
+    return object_id * 8 + KINDS[kind][0]
+
+
+def remove_documents(kind: str, object_ids) -> None:
+    '''Removes the documents of the given objects from the index'''
+    doc_ids = [_doc_id(kind, pk) for pk in object_ids]
+    if not doc_ids or not is_available():
+        return
+    column = 'rowid' if connection.vendor == 'sqlite' else 'doc_id'
+    with connection.cursor() as cursor:
+        for start in range(0, len(doc_ids), BATCH_SIZE):
+            batch = doc_ids[start:start + BATCH_SIZE]
+            cursor.execute(f"DELETE FROM {INDEX_TABLE} WHERE {column} IN ({', '.join(['%s'] * len(batch))})", batch)
+
+
+def _write(kind: str, documents: list) -> None:
+    '''Replaces a batch of (object id, title, body) documents'''
+    remove_documents(kind, [pk for pk, _, _ in documents])
+    column = 'rowid' if connection.vendor == 'sqlite' else 'doc_id'
+    rows = [(_doc_id(kind, pk), kind, pk, title, body) for pk, title, body in documents]
+    with connection.cursor() as cursor:
+        cursor.executemany(f"INSERT INTO {INDEX_TABLE} ({column}, kind, object_id, title, body) VALUES (%s, %s, %s, %s, %s)", rows)
+
+
+def index_queryset(kind: str, queryset) -> int:
+    '''(Re)indexes the objects of a queryset, in batches'''
+    if not is_available():
+        return 0
+    count = 0
+    batch = []
+    for document in KINDS[kind][1](queryset):
+        batch.append(document)
+        if len(batch) == BATCH_SIZE:
+            _write(kind, batch)
+            count += len(batch)
+            batch = []
+    if batch:
+        _write(kind, batch)
+        count += len(batch)
+    return count
+
+
+def rebuild_index(querysets: dict = None) -> dict:
+    '''Recreates the index from scratch; `querysets` maps kinds to their querysets (all objects by default)'''
+    querysets = querysets or {
+        'application': Application.objects.all(),
+        'church': Church.objects.all(),
+        'progress_report': ProgressReport.objects.all(),
+    }
+    drop_index()
+    create_index()
+    return {kind: index_queryset(kind, queryset) for kind, queryset in querysets.items()}
+
+
+# columns of the documents of other kinds: (kind, queryset of the documents of an instance) to reindex when one changes
+DEPENDENT_DOCUMENTS = {
+    Application: {
+        'application_id': [('progress_report', 'application')],
+        'church_id': [('progress_report', 'application')],
+    },
+    Church: {
+        'location_name': [('church', 'pk'), ('application', 'church'), ('progress_report', 'application__church')],
+        'pastor_name': [('church', 'pk'), ('application', 'church')],
+        'manager_name': [('church', 'pk')],
+        'location_address': [('church', 'pk')],
+        'district_id': [('church', 'pk')],
+    },
+    District: {
+        'name': [('church', 'district')],
+    },
+}
+MODELS = {'application': Application, 'church': Church, 'progress_report': ProgressReport}
+
+
+def remember_previous(instance) -> None:
+    '''Stores the persisted indexed columns of an application, church or district before it is saved (used by pre_save)'''
+    previous = None
+    if instance.pk:
+        previous = type(instance).objects.filter(pk=instance.pk).values(*DEPENDENT_DOCUMENTS[type(instance)]).first()
+    instance._search_previous = previous
+
+
+def instance_saved(instance) -> None:
+    '''Reindexes a saved application or progress report, and the documents showing a changed application, church or district'''
+    if isinstance(instance, Application):
+        index_queryset('application', Application.objects.filter(pk=instance.pk))
+    elif isinstance(instance, ProgressReport):
+        index_queryset('progress_report', ProgressReport.objects.filter(pk=instance.pk))
+    if type(instance) in DEPENDENT_DOCUMENTS:
+        columns = DEPENDENT_DOCUMENTS[type(instance)]
+        previous = getattr(instance, '_search_previous', None)
+        instance._search_previous = None
+        # without a previous state (new or not remembered) every document is refreshed
+        changed = [column for column in columns if previous is None or previous[column] != getattr(instance, column)]
+        targets = {target for column in changed for target in columns[column]}
+        for kind, lookup in sorted(targets):
+            index_queryset(kind, MODELS[kind].objects.filter(**{lookup: instance.pk}))
+
+
+def instance_deleted(instance) -> None:
+    '''Removes a deleted application, church or progress report from the index'''
+    kind = {Application: 'application', Church: 'church', ProgressReport: 'progress_report'}[type(instance)]
+    remove_documents(kind, [instance.pk])
+
+
+def _match_expression(text: str) -> str:
+    '''Turns user input into a prefix query (every word must match), escaping the search syntax'''
+    words = re.findall(r'\w+', text.lower())
+    if connection.vendor == 'sqlite':
+        return ' '.join(f'"{word}"*' for word in words)
+    return ' & '.join(f'{word}:*' for word in words)
+
+
+def search(text: str, kinds=None, limit: int = 20) -> list:
+    '''Returns the best ranked documents matching a text as dicts (kind, id, title, snippet, rank)'''
+    expression = _match_expression(text)
+    if not expression or not is_available():
+        return []
+    kinds = [kind for kind in (kinds or KINDS) if kind in KINDS]
+    kind_filter = f"AND kind IN ({', '.join(['%s'] * len(kinds))})"
+    if connection.vendor == 'sqlite':
+        sql = (
+            f"SELECT kind, object_id, title, snippet({INDEX_TABLE}, 3, '[', ']', '...', 12), "
+            f"bm25({INDEX_TABLE}, 0, 0, 5.0, 1.0) AS rank "
+            f"FROM {INDEX_TABLE} WHERE {INDEX_TABLE} MATCH %s {kind_filter} ORDER BY rank LIMIT %s"
+        )
+    else:
+        sql = (
+            f"SELECT kind, object_id, title, ts_headline('simple', body, query, 'StartSel=[, StopSel=], MaxWords=24, MinWords=8'), "
+            f"-ts_rank(document, query) AS rank "
+            f"FROM {INDEX_TABLE}, to_tsquery('simple', %s) query WHERE document @@ query {kind_filter} ORDER BY rank LIMIT %s"
+        )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [expression, *kinds, limit])
+        rows = cursor.fetchall()
+    return [
+        {"kind": kind, "id": object_id, "title": title, "snippet": snippet, "rank": round(-rank, 4)}
+        for kind, object_id, title, snippet, rank in rows
+    ]
@@ -1,12 +1,168 @@
+from operator import attrgetter
+
+from django.conf import settings
 from django.contrib.auth import authenticate
+from django.core.exceptions import FieldDoesNotExist
 from rest_framework import serializers
-from django.db.models import Q
+from rest_framework.utils.mediatypes import _MediaType
+from django.db.models import Prefetch, Q
 
 from accounts.models import Church, District, Region, User
-from apis.models import Application, Disbursement, Notification, ProgressReport, Repayment
-
-
-class UserSerializer(serializers.ModelSerializer):
+from apis.models import (Application, Disbursement, DistrictRollup, Notification, PortfolioSnapshot, ProgressReport,
+                         RegionRollup, Repayment, RepaymentInstallment)
+
+
+def _split_param(value: str) -> set:
+    '''Splits a comma separated query param into a set of names'''
+    return {name.strip() for name in value.split(',') if name.strip()}
+
+
+def wants_normalized(request) -> bool:
+    '''Checks if a request asked for the normalized shape (?shape=normalized or Accept: application/json; shape=normalized)'''
+    if request.query_params.get('shape') == 'normalized':
+        return True
+    media_type = getattr(request, 'accepted_media_type', None)
+    return bool(media_type) and _MediaType(media_type).params.get('shape') == 'normalized'
+
+
+class DynamicFieldsMixin:
+    '''
+    Lets a response pick its columns with `?fields=application_id,status,amount` and opt
+    into nested relations with `?expand=church,church.district`. When either param is
+    given, relations that are not expanded are returned as primary keys and the queryset
+    only loads the selected columns and joins (see `optimize`). Without them the
+    serializer renders as before.
+    '''
+    # the queryset expanded relations are prefetched with (None: a plain join)
+    related_queryset = None
+    # normalized shape: attribute path to the church of a row (None if not supported)
+    # and the relations still rendered inline (the church hierarchy goes to `included`)
+    church_path = None
+    normalized_expand = set()
+    # list endpoints render the default shape through apis.projections (no serializer per row)
+    projected = False
+
+    def __init__(self, *args, **kwargs):
+        self.requested_fields = kwargs.pop('fields', None)
+        self.requested_expand = kwargs.pop('expand', None)
+        self.normalized = kwargs.pop('normalized', False)
+        super().__init__(*args, **kwargs)
+        self.sparse = self.requested_fields is not None or self.requested_expand is not None
+        if self.sparse:
+            self.trim_fields()
+
+    @classmethod
+    def from_request(cls, request, *args, **kwargs):
+        '''Instantiates the serializer with the ?fields= and ?expand= of a request'''
+        params = request.query_params
+        if 'fields' in params:
+            kwargs['fields'] = _split_param(params['fields'])
+        if 'expand' in params:
+            kwargs['expand'] = _split_param(params['expand'])
+        if cls.church_path and wants_normalized(request):
+            kwargs['normalized'] = True
+            kwargs['expand'] = set(cls.normalized_expand)
+            if 'fields' in kwargs:
+                # keep the field the church is reached through (e.g. church_id -> church)
+                kwargs['fields'].add(cls.church_path.split('.', 1)[0].removesuffix('_id'))
+        return cls(*args, **kwargs)
+
+    def projection(self):
+        '''Returns the projection rendering this serializer's rows, None when it is not used'''
+        if not self.projected or self.sparse or self.normalized or not settings.PROJECTED_LISTS:
+            return None
+        from apis.projections import get_projection
+        return get_projection(type(self))
+
+    def trim_fields(self) -> None:
+        '''Drops the fields that were not requested and collapses the relations that were not expanded'''
+        expand = self.requested_expand or set()
+        top_level = {path.split('.', 1)[0] for path in expand}
+        for name, field in list(self.fields.items()):
+            if self.requested_fields is not None and name not in self.requested_fields and name not in top_level:
+                self.fields.pop(name)
+            elif isinstance(field, serializers.BaseSerializer) and name not in top_level:
+                self.fields[name] = serializers.PrimaryKeyRelatedField(read_only=True)
+            elif isinstance(field, DynamicFieldsMixin):
+                nested = {path.split('.', 1)[1] for path in expand if path.startswith(f'{name}.')}
+                self.fields[name] = type(field)(*field._args, **field._kwargs, expand=nested)
+
+    def load_plan(self, prefix: str = '', prefetching: bool = False) -> tuple:
+        '''Returns the select_related paths and prefetches of the expanded relations'''
+        select_related, prefetches = [], []
+        for field in self.fields.values():
+            if not isinstance(field, DynamicFieldsMixin):
+                continue
+            path = f'{prefix}{field.source}'
+            # below a prefetched relation every level is prefetched too
+            prefetched = prefetching or field.related_queryset is not None
+            if prefetched:
+                queryset = field.related_queryset() if field.related_queryset else field.Meta.model.objects.all()
+                prefetches.append(Prefetch(path, queryset=queryset))
+            else:
+                select_related.append(path)
+            nested_select, nested_prefetches = field.load_plan(f'{path}__', prefetched)
+            select_related += nested_select
+            prefetches += nested_prefetches
+        return select_related, prefetches
+
+    def selected_columns(self) -> list:
+        '''Returns the model columns read by the selected fields (None if a field needs more than columns)'''
+        model = self.Meta.model
+        columns = []
+        for field in self.fields.values():
+            try:
+                model_field = model._meta.get_field(field.source)
+            except FieldDoesNotExist:
+                return None
+            if not model_field.concrete or model_field.many_to_many:
+                return None
+            columns.append(model_field.name)
+        return columns
+
+    def optimize(self, queryset, keep=()):
+        '''Restricts a queryset to the columns and joins this serializer reads'''
+        if not self.sparse:
+            return self.eager_load(queryset) if hasattr(self, 'eager_load') else queryset
+        select_related, prefetches = self.load_plan()
+        queryset = queryset.select_related(*select_related).prefetch_related(*prefetches)
+        columns = self.selected_columns()
+        if columns is not None:
+            queryset = queryset.only('pk', *keep, *columns)
+        return queryset
+
+    def related_models(self) -> list:
+        '''Returns the models rendered by the expanded relations and the `included` section'''
+        models = set()
+        for field in self.fields.values():
+            if isinstance(field, DynamicFieldsMixin):
+                models.add(field.Meta.model)
+                models.update(field.related_models())
+        if self.normalized:
+            models.update([Church, District, Region])
+        return sorted(models, key=lambda model: model._meta.label)
+
+    def included(self, rows) -> dict:
+        '''Returns the `included` section of the normalized shape for the given rows'''
+        get_church = attrgetter(self.church_path)
+        return included_hierarchy({get_church(row) for row in rows} - {None})
+
+
+def included_hierarchy(church_ids) -> dict:
+    '''Serializes each of the given churches, and their districts and regions, exactly once (3 queries)'''
+    churches = list(Church.objects.filter(pk__in=church_ids).order_by('pk'))
+    district_ids = {church.district_id for church in churches} - {None}
+    districts = list(District.objects.with_counts().filter(pk__in=district_ids).order_by('pk'))
+    region_ids = {district.region_id for district in districts} - {None}
+    regions = Region.objects.with_counts().select_related('created_by').filter(pk__in=region_ids).order_by('pk')
+    return {
+        "churches": GetChurchSerializer(churches, many=True, expand=set()).data,
+        "districts": GetDistrictSerializer(districts, many=True, expand=set()).data,
+        "regions": RegionSerializer(regions, many=True).data,
+    }
+
+
+class UserSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = User
         exclude = ['password', 'groups', 'user_permissions']
@@ -76,7 +232,19 @@ class AddApplicationSerializers(serializers.ModelSerializer):
         model = Application
         fields = "__all__"
 
-class RegionSerializer(serializers.ModelSerializer):
+
+def church_hierarchy(prefix: str = '') -> list:
+    '''
+    Returns the prefetches loading the district and region (with their counts) of
+    the churches reached through `prefix`: 2 queries whatever the number of rows
+    '''
+    return [
+        Prefetch(f'{prefix}district', queryset=District.objects.with_counts()),
+        Prefetch(f'{prefix}district__region', queryset=Region.objects.with_counts().select_related('created_by')),
+    ]
+
+
+class RegionSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     '''Serializer for regions'''
     districts = serializers.ReadOnlyField()
     churches = serializers.ReadOnlyField()
@@ -85,8 +253,18 @@ class RegionSerializer(serializers.ModelSerializer):
         model = Region
         fields = "__all__"
 
+    @staticmethod
+    def related_queryset():
+        '''Regions are prefetched with the counts and creator they render'''
+        return Region.objects.with_counts().select_related('created_by')
+
+    @staticmethod
+    def eager_load(queryset):
+        '''Loads the counts and creator of the regions (1 query)'''
+        return queryset.with_counts().select_related('created_by')
 
-class GetDistrictSerializer(serializers.ModelSerializer):
+
+class GetDistrictSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     '''Serializer for districts'''
     region = RegionSerializer()
     regions = serializers.ReadOnlyField()
@@ -95,6 +273,18 @@ class GetDistrictSerializer(serializers.ModelSerializer):
         model = District
         fields = "__all__"
 
+    @staticmethod
+    def related_queryset():
+        '''Districts are prefetched with the church count they render'''
+        return District.objects.with_counts()
+
+    @staticmethod
+    def eager_load(queryset):
+        '''Loads the districts with their counts and regions (2 queries)'''
+        return queryset.with_counts().prefetch_related(
+            Prefetch('region', queryset=Region.objects.with_counts().select_related('created_by')),
+        )
+
 class AddChurchSerializer(serializers.ModelSerializer):
     '''Serializer for adding churches'''
     district = serializers.PrimaryKeyRelatedField(queryset=District.objects.all())
@@ -102,20 +292,44 @@ class AddChurchSerializer(serializers.ModelSerializer):
         model = Church
         fields = "__all__"
 
-class GetChurchSerializer(serializers.ModelSerializer):
+class GetChurchSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     '''Serializer for getting churches'''
     district = GetDistrictSerializer()
     class Meta:
         model = Church
         fields = "__all__"
 
+    @staticmethod
+    def eager_load(queryset):
+        '''Loads the churches with their districts and regions (3 queries)'''
+        return queryset.prefetch_related(*church_hierarchy())
+
+
+class ChurchListSerializer(GetChurchSerializer):
+    '''Serializer for listing churches with their repayment status'''
+    last_payment = serializers.SerializerMethodField()
+    next_due_date = serializers.SerializerMethodField()
 
-class ApplicationSerializers(serializers.ModelSerializer):
+    def get_last_payment(self, obj):
+        return obj.get_repayment_status()['last_payment']
+
+    def get_next_due_date(self, obj):
+        return obj.get_repayment_status()['next_due_date']
+
+
+class ApplicationSerializers(DynamicFieldsMixin, serializers.ModelSerializer):
     '''Serializer for applications'''
     church = GetChurchSerializer()
+    church_path = 'church_id'
+    projected = True
     class Meta:
         model = Application
         fields = "__all__"
+
+    @staticmethod
+    def eager_load(queryset, prefix: str = ''):
+        '''Loads the applications (reached through `prefix`) with their church hierarchy (3 queries)'''
+        return queryset.select_related(f'{prefix}church').prefetch_related(*church_hierarchy(f'{prefix}church__'))
         
 
 class AddApplicationSerializers(serializers.ModelSerializer):
@@ -131,13 +345,21 @@ class AddRepaymentSerializer(serializers.ModelSerializer):
         fields = "__all__"
 
 
-class GetRepaymentSerializer(serializers.ModelSerializer):
+class GetRepaymentSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     '''Serializer for repayments'''
     application = ApplicationSerializers()
+    church_path = 'application.church_id'
+    normalized_expand = {'application'}
+    projected = True
     class Meta:
         model = Repayment
         fields = "__all__"
 
+    @staticmethod
+    def eager_load(queryset):
+        '''Loads the rows with their application and church hierarchy (3 queries)'''
+        return ApplicationSerializers.eager_load(queryset, prefix='application__')
+
 
 class AddProgressReportSerializer(serializers.ModelSerializer):
     '''Serializer for adding progress reports'''
@@ -145,26 +367,42 @@ class AddProgressReportSerializer(serializers.ModelSerializer):
         model = ProgressReport
         fields = "__all__"
 
-class GetProgressReportSerializer(serializers.ModelSerializer):
+class GetProgressReportSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     '''Serializer for getting progress reports'''
     application = ApplicationSerializers()
+    church_path = 'application.church_id'
+    normalized_expand = {'application'}
+    projected = True
     class Meta:
         model = ProgressReport
         fields = "__all__"
 
+    @staticmethod
+    def eager_load(queryset):
+        '''Loads the rows with their application and church hierarchy (3 queries)'''
+        return ApplicationSerializers.eager_load(queryset, prefix='application__')
+
 class AddDisbursementSerializer(serializers.ModelSerializer):
     '''Serializer for adding disbursements'''
     class Meta:
         model = Disbursement
         fields = "__all__"
 
-class GetDisbursementSerializer(serializers.ModelSerializer):
+class GetDisbursementSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     '''Serializer for getting disbursements'''
     application = ApplicationSerializers()
+    church_path = 'application.church_id'
+    normalized_expand = {'application'}
+    projected = True
     class Meta:
         model = Disbursement
         fields = "__all__"
 
+    @staticmethod
+    def eager_load(queryset):
+        '''Loads the rows with their application and church hierarchy (3 queries)'''
+        return ApplicationSerializers.eager_load(queryset, prefix='application__')
+
 class AddDistrictSerializer(serializers.ModelSerializer):
     '''Serializer for districts'''
     region = serializers.PrimaryKeyRelatedField(queryset=Region.objects.all())
@@ -173,12 +411,52 @@ class AddDistrictSerializer(serializers.ModelSerializer):
         fields = "__all__"
 
 
-class NotificationSerializer(serializers.ModelSerializer):
+class NotificationSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     '''Serializer for notifications'''
     class Meta:
         model = Notification
         fields = "__all__"
 
+    @staticmethod
+    def eager_load(queryset):
+        '''Loads the notifications with their selected regions, districts and churches (4 queries)'''
+        return queryset.prefetch_related('regions', 'districts', 'churches')
+
+
+class RegionRollupSerializer(serializers.ModelSerializer):
+    '''Serializer for region portfolio rollups'''
+    region_name = serializers.ReadOnlyField(source='region.name')
+    class Meta:
+        model = RegionRollup
+        exclude = ['id']
+
+
+class DistrictRollupSerializer(serializers.ModelSerializer):
+    '''Serializer for district portfolio rollups'''
+    district_name = serializers.ReadOnlyField(source='district.name')
+    region = serializers.ReadOnlyField(source='district.region_id')
+    class Meta:
+        model = DistrictRollup
+        exclude = ['id']
+
+
+class PortfolioSnapshotSerializer(serializers.ModelSerializer):
+    '''Serializer for daily portfolio snapshots'''
+    class Meta:
+        model = PortfolioSnapshot
+        exclude = ['id', 'created_at']
+
+
+class RepaymentInstallmentSerializer(serializers.ModelSerializer):
+    '''Serializer for repayment installments'''
+    application = serializers.ReadOnlyField(source='application.application_id')
+    church = serializers.ReadOnlyField(source='application.church_id')
+    church_name = serializers.ReadOnlyField(source='application.church.location_name')
+    balance = serializers.DecimalField(max_digits=15, decimal_places=2, read_only=True)
+    class Meta:
+        model = RepaymentInstallment
+        exclude = ['id', 'created_at']
+
 
 class ResetPasswordSerializer(serializers.Serializer):
     '''Serializer for resetting password'''
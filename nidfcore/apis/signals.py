@@ -1,9 +1,14 @@
 import random
+from functools import partial
 
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
 from django.dispatch import receiver
 
-from accounts.models import OTP, User
+from accounts.models import OTP, Church, District, Region, User
+from apis import ledger, rollups, schedules, search
+from apis.models import Application, Disbursement, ProgressReport, Repayment
+from nidfcore.utils.cache import bump_data_version
 
 
 @receiver(post_save, sender=User)
@@ -20,3 +25,134 @@ def create_otp(sender, instance, created, **kwargs):
         otp.send_otp()
         return
     
+
+@receiver(pre_save, sender=Disbursement)
+@receiver(pre_save, sender=Repayment)
+def remember_ledger_state(sender, instance, **kwargs):
+    '''keep the persisted amount/status so the ledgers can be moved by the difference'''
+    ledger.remember_previous(instance)
+
+
+@receiver(post_save, sender=Disbursement)
+@receiver(post_save, sender=Repayment)
+def update_ledgers(sender, instance, **kwargs):
+    '''post created, changed or re-statused disbursements/repayments to the ledgers'''
+    ledger.record_saved(instance)
+    rollups.refresh_for_applications({instance.application_id})
+
+
+@receiver(post_delete, sender=Disbursement)
+@receiver(post_delete, sender=Repayment)
+def reverse_ledgers(sender, instance, **kwargs):
+    '''remove deleted disbursements/repayments from the ledgers'''
+    ledger.record_deleted(instance)
+    rollups.refresh_for_applications({instance.application_id})
+
+
+@receiver(pre_save, sender=Application)
+def remember_ledger_church(sender, instance, **kwargs):
+    '''keep the persisted church so the church ledgers follow a reassigned application'''
+    ledger.remember_church(instance)
+
+
+@receiver(post_save, sender=Application)
+def move_church_ledgers(sender, instance, **kwargs):
+    '''move the balance of an application reassigned to another church (before the rollups are refreshed)'''
+    ledger.application_saved(instance)
+
+
+@receiver(pre_save, sender=Application)
+@receiver(pre_save, sender=Church)
+@receiver(pre_save, sender=District)
+def remember_rollup_state(sender, instance, **kwargs):
+    '''keep the persisted status/hierarchy so only rollups that change are refreshed'''
+    rollups.remember_previous(instance)
+
+
+@receiver(post_save, sender=Application)
+@receiver(post_save, sender=Church)
+@receiver(post_save, sender=District)
+def update_rollups(sender, instance, created, **kwargs):
+    '''refresh the district/region rollups after applications, churches or districts change'''
+    rollups.instance_saved(instance, created)
+
+
+@receiver(post_delete, sender=Application)
+@receiver(post_delete, sender=Church)
+@receiver(post_delete, sender=District)
+def reverse_rollups(sender, instance, **kwargs):
+    '''refresh the district/region rollups after applications, churches or districts are deleted'''
+    rollups.instance_deleted(instance)
+
+
+@receiver(pre_save, sender=Application)
+@receiver(pre_save, sender=Church)
+@receiver(pre_save, sender=District)
+def remember_search_state(sender, instance, **kwargs):
+    '''keep the persisted indexed columns so only the documents that change are reindexed'''
+    search.remember_previous(instance)
+
+
+@receiver(post_save, sender=Application)
+@receiver(post_save, sender=Church)
+@receiver(post_save, sender=District)
+@receiver(post_save, sender=ProgressReport)
+def update_search_index(sender, instance, **kwargs):
+    '''reindex saved applications and progress reports, and the documents showing a changed application, church or district'''
+    search.instance_saved(instance)
+
+
+@receiver(post_delete, sender=Application)
+@receiver(post_delete, sender=Church)
+@receiver(post_delete, sender=ProgressReport)
+def remove_from_search_index(sender, instance, **kwargs):
+    '''drop deleted applications, churches and progress reports from the search index'''
+    search.instance_deleted(instance)
+
+
+@receiver(post_save, sender=Region)
+def create_region_rollup(sender, instance, created, **kwargs):
+    '''start new regions with an empty rollup'''
+    if created:
+        rollups.refresh_regions({instance.pk})
+
+
+@receiver(post_save, sender=Application)
+@receiver(post_save, sender=Disbursement)
+@receiver(post_save, sender=Repayment)
+@receiver(post_save, sender=Church)
+@receiver(post_save, sender=District)
+@receiver(post_save, sender=Region)
+@receiver(post_delete, sender=Application)
+@receiver(post_delete, sender=Disbursement)
+@receiver(post_delete, sender=Repayment)
+@receiver(post_delete, sender=Church)
+@receiver(post_delete, sender=District)
+@receiver(post_delete, sender=Region)
+def bump_cache_version(sender, instance, **kwargs):
+    '''invalidate the cached responses built from the changed model'''
+    # once committed: bumped earlier, a concurrent reader could cache the old rows under the new version
+    transaction.on_commit(partial(bump_data_version, sender))
+
+
+@receiver(post_save, sender=Application)
+def create_repayment_schedule(sender, instance, **kwargs):
+    '''materialize the installments of revolving fund applications approved after being disbursed'''
+    if schedules.needs_schedule(instance):
+        start = schedules.schedule_start(instance)
+        if start:
+            schedules.ensure_schedule(instance, start=start)
+
+
+@receiver(post_save, sender=Disbursement)
+def schedule_from_disbursement(sender, instance, created, **kwargs):
+    '''start the installments of a revolving fund a month after its first disbursement'''
+    if created and schedules.needs_schedule(instance.application):
+        schedules.ensure_schedule(instance.application, start=schedules.schedule_start(instance.application))
+
+
+@receiver(post_save, sender=Repayment)
+@receiver(post_delete, sender=Repayment)
+def allocate_installments(sender, instance, **kwargs):
+    '''re-allocate the verified repayments of the application to its installments'''
+    schedules.allocate_repayments(instance.application_id)
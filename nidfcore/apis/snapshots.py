@@ -0,0 +1,104 @@
+'''
+This module records the daily portfolio time series (PortfolioSnapshot).
+Today's snapshot is copied from the region rollups. History is rebuilt from
+grouped, date-truncated aggregates: the daily movements of every region are
+fetched once and accumulated into running totals in a single pass.
+Applications are counted on the day they were created with their current status,
+since status changes are not historized.
+
+'''
+
+from collections import defaultdict
+from datetime import date, timedelta
+
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from accounts.models import Church, Region
+from apis.models import Application, Disbursement, PortfolioSnapshot, RegionRollup, Repayment
+from apis.rollups import FIGURE_FIELDS, STATUS_FIELDS, empty_figures, get_national_figures
+from nidfcore.utils.constants import ApplicationStatus
+
+NATIONAL = None
+
+
+def _store(day_figures: dict) -> int:
+    '''Replaces the snapshots of the given (date, region_id) keys'''
+    days = {day for day, _ in day_figures}
+    rows = [PortfolioSnapshot(date=day, region_id=region_id, **figures) for (day, region_id), figures in day_figures.items()]
+    with transaction.atomic():
+        PortfolioSnapshot.objects.filter(date__in=days).delete()
+        PortfolioSnapshot.objects.bulk_create(rows, batch_size=500)
+    return len(rows)
+
+
+def take_snapshot(day: date = None) -> int:
+    '''Records the current rollup figures as the snapshots of a day (today by default)'''
+    day = day or timezone.localdate()
+    day_figures = {(day, NATIONAL): get_national_figures()}
+    for rollup in RegionRollup.objects.all():
+        day_figures[(day, rollup.region_id)] = {field: getattr(rollup, field) for field in FIGURE_FIELDS}
+    return _store(day_figures)
+
+
+def _daily_movements() -> dict:
+    '''Fetches the daily increments of every figure per region with grouped aggregates (4 queries)'''
+    movements = defaultdict(lambda: defaultdict(dict))
+
+    def add(day, region_id, field, value):
+        figures = movements[day][region_id]
+        figures[field] = figures.get(field, 0) + (value or 0)
+
+    churches = Church.objects.filter(district__region__isnull=False).annotate(day=TruncDate('created_at'))
+    for row in churches.values('day', 'district__region_id').annotate(total=Count('pk')):
+        add(row['day'], row['district__region_id'], 'churches', row['total'])
+
+    applications = Application.objects.filter(church__district__region__isnull=False).annotate(day=TruncDate('created_at'))
+    for row in applications.values('day', 'church__district__region_id', 'status').annotate(total=Count('pk')):
+        field = STATUS_FIELDS.get(row['status'])
+        if field:
+            add(row['day'], row['church__district__region_id'], field, row['total'])
+
+    disbursements = Disbursement.objects.filter(application__church__district__region__isnull=False)
+    for row in disbursements.values('date_paid', 'application__church__district__region_id').annotate(total=Sum('amount')):
+        add(row['date_paid'], row['application__church__district__region_id'], 'disbursed', row['total'])
+
+    repayments = Repayment.objects.filter(
+        application__church__district__region__isnull=False, status=ApplicationStatus.APPROVED.value
+    )
+    for row in repayments.values('date_paid', 'application__church__district__region_id').annotate(total=Sum('amount')):
+        add(row['date_paid'], row['application__church__district__region_id'], 'repaid', row['total'])
+
+    return movements
+
+
+def backfill_snapshots(start: date = None, end: date = None) -> int:
+    '''Rebuilds the daily snapshots between start and end (full history by default)'''
+    movements = _daily_movements()
+    end = end or timezone.localdate()
+    if not movements:
+        return 0
+    first_day = min(movements)
+    start = start or first_day
+
+    region_ids = list(Region.objects.values_list('pk', flat=True))
+    running = {region_id: empty_figures() for region_id in region_ids}
+    day_figures = {}
+    day = min(first_day, start)
+    while day <= end:
+        for region_id, figures in movements.get(day, {}).items():
+            totals = running.setdefault(region_id, empty_figures())
+            for field, value in figures.items():
+                totals[field] += value
+        if day >= start:
+            national = empty_figures()
+            for region_id, totals in running.items():
+                totals['arrears'] = totals['disbursed'] - totals['repaid']
+                day_figures[(day, region_id)] = dict(totals)
+                for field in FIGURE_FIELDS:
+                    national[field] += totals[field]
+            day_figures[(day, NATIONAL)] = national
+        day += timedelta(days=1)
+    return _store(day_figures)
@@ -1,3 +1,874 @@
-from django.test import TestCase
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from accounts.models import Church, District, Region, User
+from apis.models import (Application, ApplicationLedger, ChurchLedger, Disbursement,
+                         DistrictRollup, Notification, PortfolioSnapshot, ProgressReport, Repayment, RepaymentInstallment,
+                         RegionRollup, SmsDelivery, SmsOutbox)
+from apis import hierarchy
+from apis.aging import aging_rows, aging_totals, compute_aging
+from apis.broadcast import (count_recipients, queue_broadcast, retry_failed,
+                            target_phones)
+from apis.outbox import apply_delivery_reports, claim_batch, dispatch, record_failure, record_sent, retry_delay
+from apis.projections import get_projection
+from apis.rollups import FIGURE_FIELDS, rebuild_rollups
+from apis.schedules import overdue_installments
+from apis.search import search
+from apis.snapshots import backfill_snapshots, take_snapshot
+from apis.serializers import (ApplicationSerializers, GetDisbursementSerializer,
+                              GetProgressReportSerializer,
+                              GetRepaymentSerializer)
+from nidfcore.utils import services
+from nidfcore.utils.services import (CircuitBreaker, SmsDeliveryError, SmsGateway,
+                                     normalize_phone)
+
+
+class StandInGateway:
+    '''A local stand-in of the SMS gateway (SMS_GATEWAY_URL) answering with queued status codes (200 once they run out)'''
+
+    def __init__(self):
+        self.statuses = []
+        self.requests = []
+        gateway = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                payload = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                gateway.requests.append(payload)
+                code = gateway.statuses.pop(0) if gateway.statuses else 200
+                if code == 200:
+                    body = {"status": "success", "data": [{"recipient": phone, "id": f"msg-{phone}"} for phone in payload["recipients"]]}
+                else:
+                    body = {"status": "error", "message": f"error {code}"}
+                content = json.dumps(body).encode()
+                self.send_response(code)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_port}'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class StandInGatewayTestCase(TestCase):
+    '''Sends the SMS of the tests to a stand-in gateway, through a fresh gateway client per test'''
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.gateway = StandInGateway()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.gateway.close()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.gateway.statuses.clear()
+        self.gateway.requests.clear()
+        self.sms_gateway = SmsGateway(base_url=self.gateway.url)
+        patcher = mock.patch.object(services, '_gateway', self.sms_gateway)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def dispatch(self, size: int = 50) -> dict:
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            return dispatch(claim_batch(size), executor)
+
+
+class ProjectionContractTests(TestCase):
+    '''The projection read path must render exactly what the serializers render'''
+
+    @classmethod
+    def setUpTestData(cls):
+        # verified users are not sent an OTP
+        cls.admin = User.objects.create_superuser(
+            email='admin@nidf.org', password='pass', name='Admin', phone='0200000000', phone_verified=True,
+        )
+        region = Region.objects.create(name='Ashanti', location='Kumasi', phone='0300000000', created_by=cls.admin)
+        district = District.objects.create(name='Bantama', location='Kumasi', phone='0300000001', region=region)
+        churches = [
+            Church.objects.create(
+                location_name=f'Church {i}', location_address='Kumasi', pastor_name='Pastor', pastor_phone=f'02400000{i}',
+                church_phone=f'05500000{i}', district=district if i else None, region=region,
+            )
+            for i in range(2)
+        ]
+        for i, church in enumerate([*churches, None]):
+            application = Application.objects.create(
+                church=church, amount=Decimal('1500.5'), status='APPROVED', support_type='REVOLVING_FUND',
+                monthly_repayment_amount=Decimal('100'), expected_completion_date=date(2026, 1, i + 1),
+                cost_estimate='applications/cost_estimate/estimate.pdf' if i else '', is_emergency=bool(i),
+            )
+            Disbursement.objects.create(application=application, amount=Decimal('500'), date_paid=date(2025, 1, 1), proof_of_payment='d.pdf')
+            Repayment.objects.create(application=application, amount=Decimal('99.99'), date_paid=date(2025, 2, 1), proof_of_payment='r.pdf')
+            ProgressReport.objects.create(application=application, progress_description='Roofing', proof_of_progress='p.pdf')
+
+    def assert_same_rows(self, serializer_class, queryset):
+        projection = get_projection(serializer_class)
+        projected = projection.render(projection.values(queryset))
+        serialized = serializer_class(serializer_class.eager_load(queryset), many=True).data
+        self.assertEqual(projected, serialized)
+        self.assertEqual([list(row) for row in projected], [list(row) for row in serialized])
+
+    def test_applications(self):
+        self.assert_same_rows(ApplicationSerializers, Application.objects.order_by('pk'))
+
+    def test_repayments(self):
+        self.assert_same_rows(GetRepaymentSerializer, Repayment.objects.order_by('pk'))
+
+    def test_disbursements(self):
+        self.assert_same_rows(GetDisbursementSerializer, Disbursement.objects.order_by('pk'))
+
+    def test_progress_reports(self):
+        self.assert_same_rows(GetProgressReportSerializer, ProgressReport.objects.order_by('pk'))
+
+    def test_list_endpoints(self):
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        for url in ('/api-v1/applications/', '/api-v1/repayments/', '/api-v1/disbursements/', '/api-v1/progressreports/'):
+            for params in ({}, {'paginate': 'true', 'page_size': 2}):
+                projected = client.get(url, params)
+                with override_settings(PROJECTED_LISTS=False):
+                    serialized = client.get(url, params)
+                self.assertEqual(projected.status_code, 200)
+                self.assertEqual(projected.content, serialized.content, url)
+
+
+class LedgerTests(TestCase):
+    '''The ledgers must follow every change of disbursements, repayments and applications'''
+
+    @classmethod
+    def setUpTestData(cls):
+        region = Region.objects.create(name='Ashanti', location='Kumasi', phone='0300000000')
+        district = District.objects.create(name='Bantama', location='Kumasi', phone='0300000001', region=region)
+        cls.churches = [
+            Church.objects.create(
+                location_name=f'Church {i}', location_address='Kumasi', pastor_name='Pastor', pastor_phone=f'02400000{i}',
+                church_phone=f'05500000{i}', district=district, region=region,
+            )
+            for i in range(2)
+        ]
+
+    def setUp(self):
+        self.application = Application.objects.create(
+            church=self.churches[0], amount=Decimal('1000'), status='APPROVED', support_type='REVOLVING_FUND',
+            monthly_repayment_amount=Decimal('100'),
+        )
+
+    def balances(self, model, **lookup):
+        row = model.objects.filter(**lookup).first()
+        return (row.disbursed, row.repaid, row.outstanding) if row else None
+
+    def assert_balances(self, church, expected):
+        self.assertEqual(self.balances(ApplicationLedger, application=self.application), expected)
+        self.assertEqual(self.balances(ChurchLedger, church=church), expected)
+
+    def disburse(self, amount):
+        return Disbursement.objects.create(application=self.application, amount=Decimal(amount), date_paid=date(2025, 1, 1), proof_of_payment='d.pdf')
+
+    def repay(self, amount, status='PENDING REVIEW'):
+        return Repayment.objects.create(
+            application=self.application, amount=Decimal(amount), date_paid=date(2025, 2, 1), proof_of_payment='r.pdf', status=status,
+        )
+
+    def test_increments(self):
+        self.disburse('500')
+        self.disburse('250.50')
+        self.repay('100', status='APPROVED')
+        self.assert_balances(self.churches[0], (Decimal('750.50'), Decimal('100'), Decimal('650.50')))
+
+    def test_amount_changes(self):
+        disbursement = self.disburse('500')
+        disbursement.amount = Decimal('400')
+        disbursement.save()
+        self.assert_balances(self.churches[0], (Decimal('400'), Decimal('0'), Decimal('400')))
+
+    def test_status_flips(self):
+        self.disburse('500')
+        repayment = self.repay('200')
+        self.assert_balances(self.churches[0], (Decimal('500'), Decimal('0'), Decimal('500')))
+        repayment.status = 'APPROVED'
+        repayment.save()
+        self.assert_balances(self.churches[0], (Decimal('500'), Decimal('200'), Decimal('300')))
+        repayment.status = 'REJECTED'
+        repayment.save()
+        self.assert_balances(self.churches[0], (Decimal('500'), Decimal('0'), Decimal('500')))
+
+    def test_deletes(self):
+        disbursement = self.disburse('500')
+        repayment = self.repay('200', status='APPROVED')
+        repayment.delete()
+        self.assert_balances(self.churches[0], (Decimal('500'), Decimal('0'), Decimal('500')))
+        disbursement.delete()
+        self.assert_balances(self.churches[0], (Decimal('0'), Decimal('0'), Decimal('0')))
+
+    def test_church_reassignment(self):
+        self.disburse('500')
+        self.repay('200', status='APPROVED')
+        self.application.church = self.churches[1]
+        self.application.save()
+        self.assert_balances(self.churches[1], (Decimal('500'), Decimal('200'), Decimal('300')))
+        self.assertEqual(self.balances(ChurchLedger, church=self.churches[0]), (Decimal('0'), Decimal('0'), Decimal('0')))
+        self.assertEqual(self.churches[1].get_arrears(), Decimal('300'))
+
+
+class RollupTests(TestCase):
+    '''District and region rollups follow the churches and districts moving between them'''
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.regions = [Region.objects.create(name=name, location='Kumasi', phone=f'030000000{i}') for i, name in enumerate(['Ashanti', 'Volta'])]
+        cls.districts = [
+            District.objects.create(name=f'District {i}', location='Kumasi', phone=f'031000000{i}', region=region)
+            for i, region in enumerate(cls.regions)
+        ]
+
+    def setUp(self):
+        self.church = Church.objects.create(
+            location_name='Church', location_address='Kumasi', pastor_name='Pastor', pastor_phone='0240000000',
+            church_phone='0550000000', district=self.districts[0], region=self.regions[0],
+        )
+        application = Application.objects.create(church=self.church, amount=Decimal('1000'), status='APPROVED', support_type='REVOLVING_FUND')
+        Disbursement.objects.create(application=application, amount=Decimal('400'), date_paid=date(2025, 1, 1), proof_of_payment='d.pdf')
+
+    def figures(self, model, **lookup):
+        row = model.objects.get(**lookup)
+        return (row.churches, row.approved_applications, row.disbursed)
+
+    def rollups(self):
+        return [
+            {field: getattr(row, field) for field in FIGURE_FIELDS}
+            for model in (DistrictRollup, RegionRollup) for row in model.objects.order_by('pk')
+        ]
+
+    def test_church_moved_between_districts(self):
+        self.assertEqual(self.figures(DistrictRollup, district=self.districts[0]), (1, 1, Decimal('400')))
+        self.assertEqual(self.figures(DistrictRollup, district=self.districts[1]), (0, 0, Decimal('0')))
+        self.church.district = self.districts[1]
+        self.church.save()
+        self.assertEqual(self.figures(DistrictRollup, district=self.districts[0]), (0, 0, Decimal('0')))
+        self.assertEqual(self.figures(DistrictRollup, district=self.districts[1]), (1, 1, Decimal('400')))
+        self.assertEqual(self.figures(RegionRollup, region=self.regions[0]), (0, 0, Decimal('0')))
+        self.assertEqual(self.figures(RegionRollup, region=self.regions[1]), (1, 1, Decimal('400')))
+
+    def test_district_moved_between_regions(self):
+        district = self.districts[0]
+        district.region = self.regions[1]
+        district.save()
+        self.assertEqual(self.figures(RegionRollup, region=self.regions[0]), (0, 0, Decimal('0')))
+        self.assertEqual(self.figures(RegionRollup, region=self.regions[1]), (1, 1, Decimal('400')))
+
+    def test_rebuild_matches_the_maintained_rollups(self):
+        self.church.district = self.districts[1]
+        self.church.save()
+        maintained = self.rollups()
+        rebuild_rollups()
+        self.assertEqual(self.rollups(), maintained)
+
+
+class SnapshotTests(TestCase):
+    '''Daily snapshots are copied from the rollups, or rebuilt from the money movements'''
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(
+            email='admin@nidf.org', password='pass', name='Admin', phone='0200000000', phone_verified=True, user_type='ADMIN',
+        )
+        cls.regions = [Region.objects.create(name=name, location='Kumasi', phone=f'030000000{i}') for i, name in enumerate(['Ashanti', 'Volta'])]
+        for i, region in enumerate(cls.regions):
+            district = District.objects.create(name=f'District {i}', location='Kumasi', phone=f'031000000{i}', region=region)
+            church = Church.objects.create(
+                location_name=f'Church {i}', location_address='Kumasi', pastor_name='Pastor', pastor_phone=f'02400000{i}',
+                church_phone=f'05500000{i}', district=district, region=region,
+            )
+            application = Application.objects.create(church=church, amount=Decimal('1000'), status='APPROVED', support_type='REVOLVING_FUND')
+            Disbursement.objects.create(application=application, amount=Decimal(100 * (i + 1)), date_paid=date(2025, 1, 2), proof_of_payment='d.pdf')
+            Repayment.objects.create(
+                application=application, amount=Decimal('30'), date_paid=date(2025, 1, 5), proof_of_payment='r.pdf', status='APPROVED',
+            )
+
+    def money(self, day, region=None):
+        row = PortfolioSnapshot.objects.get(date=day, region=region)
+        return (row.disbursed, row.repaid, row.arrears)
+
+    def test_take_snapshot(self):
+        today = timezone.localdate()
+        self.assertEqual(take_snapshot(), 3)
+        national = PortfolioSnapshot.objects.get(date=today, region=None)
+        self.assertEqual((national.churches, national.approved_applications), (2, 2))
+        self.assertEqual(self.money(today), (Decimal('300'), Decimal('60'), Decimal('240')))
+        for region in self.regions:
+            rollup = RegionRollup.objects.get(region=region)
+            self.assertEqual(self.money(today, region), (rollup.disbursed, rollup.repaid, rollup.arrears))
+        # recorded again: replaced, not duplicated
+        self.assertEqual(take_snapshot(), 3)
+        self.assertEqual(PortfolioSnapshot.objects.filter(date=today).count(), 3)
+
+    def test_backfill(self):
+        self.assertEqual(backfill_snapshots(start=date(2025, 1, 1), end=date(2025, 1, 6)), 6 * 3)
+        self.assertEqual(self.money(date(2025, 1, 1)), (Decimal('0'), Decimal('0'), Decimal('0')))
+        self.assertEqual(self.money(date(2025, 1, 3)), (Decimal('300'), Decimal('0'), Decimal('300')))
+        self.assertEqual(self.money(date(2025, 1, 6)), (Decimal('300'), Decimal('60'), Decimal('240')))
+        self.assertEqual(self.money(date(2025, 1, 6), self.regions[1]), (Decimal('200'), Decimal('30'), Decimal('170')))
+
+    def test_trend(self):
+        backfill_snapshots(start=date(2025, 1, 1), end=date(2025, 1, 6))
+        api = APIClient()
+        api.force_authenticate(self.admin)
+        response = api.get('/api-v1/dashboard/trends/', {'start': '2025-01-02', 'end': '2025-01-04'})
+        self.assertEqual([row['date'] for row in response.data], ['2025-01-02', '2025-01-03', '2025-01-04'])
+        self.assertTrue(all(row['region'] is None for row in response.data))
+        response = api.get('/api-v1/dashboard/trends/', {'start': '2025-01-05', 'end': '2025-01-06', 'region': self.regions[0].pk})
+        self.assertEqual([(row['region'], Decimal(row['repaid'])) for row in response.data], [(self.regions[0].pk, Decimal('30'))] * 2)
+
+
+class ListEndpointTests(TestCase):
+    '''Keyset pages and conditional GETs of the list endpoints'''
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(
+            email='admin@nidf.org', password='pass', name='Admin', phone='0200000000', phone_verified=True, user_type='ADMIN',
+        )
+        cls.region = Region.objects.create(name='Ashanti', location='Kumasi', phone='0300000000')
+        district = District.objects.create(name='Bantama', location='Kumasi', phone='0300000001', region=cls.region)
+        cls.church = Church.objects.create(
+            location_name='Church', location_address='Kumasi', pastor_name='Pastor', pastor_phone='0240000000',
+            church_phone='0550000000', district=district, region=cls.region,
+        )
+        applications = [Application.objects.create(church=cls.church, amount=Decimal('1000'), support_type='REVOLVING_FUND') for _ in range(7)]
+        # ties on the ordering key: only the id tells most of them apart
+        tied = timezone.now() - timedelta(days=1)
+        Application.objects.filter(pk__in=[application.pk for application in applications[:5]]).update(created_at=tied)
+
+    def setUp(self):
+        self.api = APIClient()
+        self.api.force_authenticate(self.admin)
+
+    def test_next_cursor_round_trip(self):
+        expected = list(Application.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+        seen, params = [], {'page_size': 2}
+        while True:
+            response = self.api.get('/api-v1/applications/', params)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data['count'], 7)
+            seen += [row['id'] for row in response.data['results']]
+            if response.data['cursor'] is None:
+                self.assertIsNone(response.data['next'])
+                break
+            self.assertIn(f"cursor={response.data['cursor']}", response.data['next'])
+            params = {'page_size': 2, 'cursor': response.data['cursor']}
+        self.assertEqual(seen, expected)
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.api.get('/api-v1/applications/', {'cursor': 'not-a-cursor'}).status_code, 400)
+        self.assertEqual(self.api.get('/api-v1/applications/', {'page_size': 'x'}).status_code, 400)
+
+
+    def revalidate(self, url, etag, **params):
+        return self.api.get(url, params, HTTP_IF_NONE_MATCH=etag)
+
+    def test_conditional_get(self):
+        url = '/api-v1/applications/'
+        response = self.api.get(url)
+        etag = response['ETag']
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.revalidate(url, etag).status_code, 304)
+        # another representation of the same rows has its own validator
+        self.assertEqual(self.revalidate(url, etag, page_size=2).status_code, 200)
+
+        Application.objects.create(church=self.church, amount=Decimal('500'), support_type='REVOLVING_FUND')
+        response = self.revalidate(url, etag)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.assertEqual(self.revalidate(url, etag).status_code, 304)
+
+        # the nested region is rendered in every row: renaming it changes the validator once committed
+        with self.captureOnCommitCallbacks(execute=True):
+            self.region.name = 'Greater Ashanti'
+            self.region.save()
+        response = self.revalidate(url, etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Greater Ashanti', json.dumps(response.data, default=str))
+
+
+class HierarchyTests(TestCase):
+    '''The in-memory hierarchy is reused until a region, district or church write commits, or it expires'''
+
+    @classmethod
+    def setUpTestData(cls):
+        region = Region.objects.create(name='Ashanti', location='Kumasi', phone='0300000000')
+        cls.district = District.objects.create(name='Bantama', location='Kumasi', phone='0300000001', region=region)
+
+    def setUp(self):
+        # trees and data versions left by other tests were loaded from other rows
+        cache.clear()
+        hierarchy._tree = None
+        self.addCleanup(setattr, hierarchy, '_tree', None)
+
+    def add_church(self, name):
+        return Church.objects.create(
+            location_name=name, location_address='Kumasi', pastor_name='Pastor', pastor_phone='0240000000',
+            church_phone='0550000000', district=self.district, region=self.district.region,
+        )
+
+    def church_names(self, tree):
+        return [church['name'] for church in tree.district(self.district.pk)['churches']]
+
+    def test_rebuilt_after_a_write(self):
+        tree = hierarchy.get_hierarchy()
+        self.assertEqual(self.church_names(tree), [])
+        with self.assertNumQueries(0):
+            self.assertIs(hierarchy.get_hierarchy(), tree)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.add_church('Asafo')
+        rebuilt = hierarchy.get_hierarchy()
+        self.assertIsNot(rebuilt, tree)
+        self.assertEqual(self.church_names(rebuilt), ['Asafo'])
+        self.assertNotEqual(rebuilt.digest, tree.digest)
+
+    def test_expires_after_max_age(self):
+        tree = hierarchy.get_hierarchy()
+        # a write of another process: this one's data versions are not bumped
+        self.add_church('Asafo')
+        self.assertIs(hierarchy.get_hierarchy(), tree)
+        with override_settings(HIERARCHY_MAX_AGE=0):
+            self.assertEqual(self.church_names(hierarchy.get_hierarchy()), ['Asafo'])
+
+    def test_endpoint_revalidation(self):
+        api = APIClient()
+        response = api.get('/api-v1/hierarchy/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(api.get('/api-v1/hierarchy/', HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.add_church('Asafo')
+        response = api.get('/api-v1/hierarchy/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['regions'][0]['churches_count'], 1)
+
+
+class ScheduleTests(TestCase):
+    '''Repayment schedules start a month after the first disbursement, however they are made'''
+
+    @classmethod
+    def setUpTestData(cls):
+        region = Region.objects.create(name='Ashanti', location='Kumasi', phone='0300000000')
+        district = District.objects.create(name='Bantama', location='Kumasi', phone='0300000001', region=region)
+        cls.church = Church.objects.create(
+            location_name='Church', location_address='Kumasi', pastor_name='Pastor', pastor_phone='0240000000',
+            church_phone='0550000000', district=district, region=region,
+        )
+
+    def application(self, status='APPROVED'):
+        return Application.objects.create(
+            church=self.church, amount=Decimal('300'), status=status, support_type='REVOLVING_FUND',
+            monthly_repayment_amount=Decimal('100'),
+        )
+
+    def disburse(self, application, day):
+        return Disbursement.objects.create(application=application, amount=Decimal('300'), date_paid=day, proof_of_payment='d.pdf')
+
+    def due_dates(self, application):
+        return list(application.installments.order_by('number').values_list('due_date', flat=True))
+
+    def test_approved_then_disbursed(self):
+        application = self.application()
+        self.assertEqual(self.due_dates(application), [])
+        self.disburse(application, date(2025, 1, 31))
+        self.disburse(application, date(2025, 3, 1))
+        self.assertEqual(self.due_dates(application), [date(2025, 2, 28), date(2025, 3, 31), date(2025, 4, 30)])
+
+    def test_disbursed_then_approved(self):
+        application = self.application(status='PENDING REVIEW')
+        self.disburse(application, date(2025, 1, 1))
+        self.assertEqual(self.due_dates(application), [])
+        application.status = 'APPROVED'
+        application.save()
+        self.assertEqual(self.due_dates(application), [date(2025, 2, 1), date(2025, 3, 1), date(2025, 4, 1)])
+        self.assertEqual(overdue_installments(date(2025, 3, 15)).filter(application=application).count(), 2)
+
+    def test_backfill_uses_the_same_start(self):
+        application = self.application()
+        self.disburse(application, date(2025, 1, 1))
+        live = self.due_dates(application)
+        # a schedule made from another start (the approval date) is rebuilt, a missing one is created
+        RepaymentInstallment.objects.filter(application=application, number=1).update(due_date=date(2026, 1, 1))
+        call_command('generate_schedules', stdout=StringIO())
+        self.assertEqual(self.due_dates(application), live)
+        application.installments.all().delete()
+        call_command('generate_schedules', stdout=StringIO())
+        self.assertEqual(self.due_dates(application), live)
+        # not disbursed yet: no schedule
+        pending = self.application(status='PENDING REVIEW')
+        Application.objects.filter(pk=pending.pk).update(status='APPROVED')
+        call_command('generate_schedules', stdout=StringIO())
+        self.assertEqual(self.due_dates(pending), [])
+
+
+    def test_schedule_of_another_church_is_not_readable(self):
+        application = self.application()
+        self.disburse(application, date(2025, 1, 1))
+        orphan = Application.objects.create(amount=Decimal('300'), status='APPROVED', support_type='REVOLVING_FUND', monthly_repayment_amount=Decimal('100'))
+        self.disburse(orphan, date(2025, 1, 1))
+        api = APIClient()
+        for church in (None, self.church):
+            number = church.pk if church else 0
+            api.force_authenticate(User.objects.create_user(
+                email=f'user{number}@nidf.org', phone=f'020999990{number}', password='pass', name='User', church_profile=church,
+            ))
+            response = api.get('/api-v1/repayments/schedule/', {'application': orphan.application_id})
+            self.assertEqual(response.status_code, 400 if church is None else 200)
+            if church:
+                self.assertEqual(response.data, [])
+                self.assertEqual(len(api.get('/api-v1/repayments/schedule/', {'application': application.application_id}).data), 3)
+
+
+class SearchIndexTests(TestCase):
+    '''Search documents follow the records they show'''
+
+    @classmethod
+    def setUpTestData(cls):
+        region = Region.objects.create(name='Ashanti', location='Kumasi', phone='0300000000')
+        district = District.objects.create(name='Bantama', location='Kumasi', phone='0300000001', region=region)
+        cls.churches = [
+            Church.objects.create(
+                location_name=name, location_address='Kumasi', pastor_name='Pastor', pastor_phone=f'02400000{i}',
+                church_phone=f'05500000{i}', district=district, region=region,
+            )
+            for i, name in enumerate(['Asafo', 'Suame'])
+        ]
+
+    def found(self, text):
+        return {(document['kind'], document['id']) for document in search(text)}
+
+    def test_progress_reports_follow_their_application(self):
+        application = Application.objects.create(church=self.churches[0], amount=Decimal('1000'), support_type='REVOLVING_FUND')
+        report = ProgressReport.objects.create(application=application, progress_description='Roofing', proof_of_progress='p.pdf')
+        self.assertIn(('progress_report', report.pk), self.found('Asafo'))
+        application.church = self.churches[1]
+        application.save()
+        self.assertNotIn(('progress_report', report.pk), self.found('Asafo'))
+        self.assertIn(('progress_report', report.pk), self.found('Suame'))
+
+    def test_district_rename(self):
+        self.assertEqual(self.found('Bantama'), {('church', church.pk) for church in self.churches})
+        district = District.objects.get()
+        district.name = 'Manhyia'
+        district.save()
+        self.assertEqual(self.found('Bantama'), set())
+        self.assertEqual(self.found('Manhyia'), {('church', church.pk) for church in self.churches})
+
+
+class AgingTests(TestCase):
+    '''Arrears are aged per disbursement, after repayments settled the oldest ones first'''
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.regions = [Region.objects.create(name=name, location='Kumasi', phone=f'030000000{i}') for i, name in enumerate(['Ashanti', 'Volta'])]
+        cls.churches = []
+        for i, region in enumerate(cls.regions):
+            district = District.objects.create(name=f'District {i}', location='Kumasi', phone=f'031000000{i}', region=region)
+            cls.churches.append(Church.objects.create(
+                location_name=f'Church {i}', location_address='Kumasi', pastor_name='Pastor', pastor_phone=f'02400000{i}',
+                church_phone=f'05500000{i}', district=district, region=region,
+            ))
+        first, second = [
+            Application.objects.create(church=church, amount=Decimal('1000'), status='APPROVED', support_type='REVOLVING_FUND')
+            for church in cls.churches
+        ]
+        for application, amount, day in (
+            (first, '100.10', date(2025, 1, 1)), (first, '200.20', date(2025, 3, 1)), (first, '5.00', date(2025, 4, 20)),
+            (second, '10.01', date(2025, 1, 1)),
+        ):
+            Disbursement.objects.create(application=application, amount=Decimal(amount), date_paid=day, proof_of_payment='d.pdf')
+        for amount, day, status in (('150.15', date(2025, 3, 15), 'APPROVED'), ('50.00', date(2025, 5, 1), 'APPROVED'), ('99.00', date(2025, 3, 2), 'PENDING REVIEW')):
+            Repayment.objects.create(application=first, amount=Decimal(amount), date_paid=day, proof_of_payment='r.pdf', status=status)
+
+    def church_buckets(self, report):
+        return {row['id']: [row['current'], row['days_30'], row['days_60'], row['days_90_plus']] for row in aging_rows(report, 'church')}
+
+    def test_fifo_settlement(self):
+        # 150.15 repaid: the first disbursement is settled, 150.15 of the second is 40 days old
+        report = compute_aging(date(2025, 4, 10))
+        self.assertEqual(self.church_buckets(report), {
+            self.churches[0].pk: ['0.00', '150.15', '0.00', '0.00'],
+            self.churches[1].pk: ['0.00', '0.00', '0.00', '10.01'],
+        })
+        self.assertEqual(aging_totals(report), {'current': '0.00', 'days_30': '150.15', 'days_60': '0.00', 'days_90_plus': '10.01', 'outstanding': '160.16'})
+
+    def test_as_of_leaves_out_later_money(self):
+        self.assertEqual(self.church_buckets(compute_aging(date(2025, 2, 1)))[self.churches[0].pk], ['0.00', '100.10', '0.00', '0.00'])
+        # the repayment of May 1 settles more of the second disbursement, the one of April 20 is current
+        self.assertEqual(self.church_buckets(compute_aging(date(2025, 5, 10)))[self.churches[0].pk], ['5.00', '0.00', '100.15', '0.00'])
+
+    def test_region_filter(self):
+        report = compute_aging(date(2025, 4, 10), region_id=self.regions[1].pk)
+        self.assertEqual(self.church_buckets(report), {self.churches[1].pk: ['0.00', '0.00', '0.00', '10.01']})
+        self.assertEqual([row['id'] for row in aging_rows(report, 'region')], [self.regions[1].pk])
+        self.assertEqual(aging_totals(report)['outstanding'], '10.01')
+
+
+class OutboxTests(StandInGatewayTestCase):
+    '''Claims, leases, retries and dead-lettering of the SMS outbox'''
+
+    def setUp(self):
+        super().setUp()
+        self.messages = [SmsOutbox.queue(f'Message {i}', [f'024400000{i}']) for i in range(3)]
+
+    def test_claimed_messages_are_not_claimed_again(self):
+        first = claim_batch(2)
+        second = claim_batch(5)
+        self.assertEqual(len(first), 2)
+        self.assertEqual([sms.pk for sms in second], [self.messages[2].pk])
+        self.assertEqual(claim_batch(5), [])
+        self.assertTrue(all(sms.attempts == 1 and sms.status == 'SENDING' for sms in first + second))
+
+    def test_expired_lease_is_claimed_again(self):
+        [stale] = claim_batch(1)
+        SmsOutbox.objects.filter(pk=stale.pk).update(locked_until=timezone.now() - timedelta(seconds=1))
+        [fresh] = claim_batch(1)
+        self.assertEqual(fresh.pk, stale.pk)
+        self.assertNotEqual(fresh.claimed_by, stale.claimed_by)
+        self.assertEqual(fresh.attempts, 2)
+        # the worker that lost its lease cannot record an outcome any more
+        record_sent(stale, {"data": []})
+        fresh.refresh_from_db()
+        self.assertEqual(fresh.status, 'SENDING')
+        self.assertFalse(SmsDelivery.objects.exists())
+
+    def test_backoff(self):
+        with override_settings(SMS_RETRY_DELAY=10, SMS_RETRY_MAX_DELAY=100):
+            for attempts, delay in ((1, 10), (2, 20), (3, 40), (4, 80), (5, 100), (9, 100)):
+                self.assertTrue(delay * 0.8 <= retry_delay(attempts) <= delay * 1.2, attempts)
+
+    def test_transient_failure_is_retried_later(self):
+        [sms] = claim_batch(1)
+        self.assertEqual(record_failure(sms, SmsDeliveryError('Gateway error 503')), 'PENDING')
+        sms.refresh_from_db()
+        self.assertGreater(sms.next_attempt_at, timezone.now())
+        self.assertEqual(sms.last_error, 'Gateway error 503')
+        self.assertNotIn(sms.pk, [other.pk for other in claim_batch(5)])
+
+    def test_dead_letters(self):
+        [rejected, exhausted] = claim_batch(2)
+        SmsOutbox.objects.filter(pk=exhausted.pk).update(attempts=settings.SMS_MAX_ATTEMPTS)
+        exhausted.attempts = settings.SMS_MAX_ATTEMPTS
+        self.assertEqual(record_failure(rejected, SmsDeliveryError('Rejected', permanent=True)), 'DEAD')
+        self.assertEqual(record_failure(exhausted, SmsDeliveryError('Gateway error 503')), 'DEAD')
+        self.assertEqual(
+            sorted(SmsDelivery.objects.values_list('phone', 'status')),
+            [(rejected.recipients[0], 'FAILED'), (exhausted.recipients[0], 'FAILED')],
+        )
+
+    def test_dispatch_through_the_gateway(self):
+        # a server error is retried, a rejection is dead-lettered
+        self.gateway.statuses.extend([503, 400])
+        counts = self.dispatch()
+        self.assertEqual(counts, {'SENT': 1, 'PENDING': 1, 'DEAD': 1})
+        self.assertEqual(len(self.gateway.requests), 3)
+        sent = SmsOutbox.objects.get(status='SENT')
+        self.assertEqual(list(sent.deliveries.values_list('phone', 'provider_id', 'status')), [(sent.recipients[0], f'msg-{sent.recipients[0]}', 'SENT')])
+
+
+class GatewayBreakerTests(StandInGatewayTestCase):
+    '''The circuit breaker of the gateway client and how the outbox works around an open circuit'''
+
+    def setUp(self):
+        super().setUp()
+        self.sms_gateway.breaker = CircuitBreaker(threshold=2, reset_timeout=60)
+
+    def half_open(self):
+        self.sms_gateway.breaker.failures = self.sms_gateway.breaker.threshold
+        self.sms_gateway.breaker.opened_at = time.monotonic() - 61
+
+    def test_server_errors_open_the_circuit(self):
+        self.gateway.statuses.extend([503, 503])
+        for _ in range(2):
+            with self.assertRaises(SmsDeliveryError) as error:
+                self.sms_gateway.send('Hi', ['233244000001'])
+            self.assertFalse(error.exception.permanent)
+        self.assertEqual(self.sms_gateway.breaker.state, 'open')
+        with self.assertRaises(SmsDeliveryError) as error:
+            self.sms_gateway.send('Hi', ['233244000001'])
+        self.assertTrue(error.exception.short_circuited)
+        self.assertEqual(len(self.gateway.requests), 2)
+
+    def test_rejections_do_not_open_the_circuit(self):
+        self.gateway.statuses.extend([400, 400])
+        for _ in range(2):
+            with self.assertRaises(SmsDeliveryError) as error:
+                self.sms_gateway.send('Hi', ['233244000001'])
+            self.assertTrue(error.exception.permanent)
+        self.assertEqual(self.sms_gateway.breaker.state, 'closed')
+
+    def test_half_open_allows_a_single_trial(self):
+        self.half_open()
+        self.assertEqual(self.sms_gateway.breaker.state, 'half-open')
+        self.assertTrue(self.sms_gateway.breaker.allow())
+        self.assertFalse(self.sms_gateway.breaker.allow())
+        self.sms_gateway.breaker.success()
+        self.assertEqual(self.sms_gateway.breaker.state, 'closed')
+
+    def test_short_circuited_messages_keep_their_attempts(self):
+        messages = [SmsOutbox.queue(f'Message {i}', [f'024400000{i}']) for i in range(3)]
+        self.sms_gateway.breaker.failure()
+        self.sms_gateway.breaker.failure()
+        self.assertEqual(self.dispatch(), {'PENDING': 3})
+        self.assertEqual(self.gateway.requests, [])
+        for sms in messages:
+            sms.refresh_from_db()
+            self.assertEqual((sms.status, sms.attempts), ('PENDING', 0))
+            self.assertLessEqual(sms.next_attempt_at, timezone.now())
+
+    def test_worker_claims_one_message_when_half_open(self):
+        messages = [SmsOutbox.queue(f'Message {i}', [f'024400000{i}']) for i in range(3)]
+        self.half_open()
+        self.gateway.statuses.append(503)
+        call_command('run_sms_worker', once=True, stdout=StringIO())
+        self.assertEqual(len(self.gateway.requests), 1)
+        self.assertEqual(sorted(SmsOutbox.objects.filter(pk__in=[sms.pk for sms in messages]).values_list('attempts', flat=True)), [0, 0, 1])
+        self.assertEqual(self.sms_gateway.breaker.state, 'open')
+
+
+class BroadcastTests(StandInGatewayTestCase):
+    '''Broadcasts send each valid number once, in SMS_BATCH_SIZE recipient batches'''
+
+    @classmethod
+    def setUpTestData(cls):
+        region = Region.objects.create(name='Ashanti', location='Kumasi', phone='0300000000')
+        district = District.objects.create(name='Bantama', location='Kumasi', phone='0300000001', region=region)
+        phones = [('0244000001', '233244000001'), ('0244000002', 'not a phone'), ('0244000003', '244000004')]
+        for i, (pastor_phone, church_phone) in enumerate(phones):
+            Church.objects.create(
+                location_name=f'Church {i}', location_address='Kumasi', pastor_name='Pastor', pastor_phone=pastor_phone,
+                church_phone=church_phone, district=district, region=region,
+            )
+        cls.notification = Notification.objects.create(title='Meeting', message='Saturday at 10', target='CHURCH')
+
+    def test_normalize_phone(self):
+        for phone, expected in (
+            ('0244123456', '233244123456'), ('+233 24 412 3456', '233244123456'), ('00233244123456', '233244123456'),
+            ('244123456', '233244123456'), ('233244123456', '233244123456'), ('pastor@church.org', None), ('', None), (None, None),
+        ):
+            self.assertEqual(normalize_phone(phone), expected, phone)
+
+    def test_queue_normalizes_recipients(self):
+        sms = SmsOutbox.queue('Hi', ['0244000001', '233244000001', 'not a phone', '0244000002'])
+        self.assertEqual(sms.recipients, ['233244000001', '233244000002'])
+        self.assertIsNone(SmsOutbox.queue('Hi', ['not a phone']))
+
+    @override_settings(SMS_BATCH_SIZE=3)
+    def test_batches(self):
+        expected = ['233244000001', '233244000002', '233244000003', '233244000004']
+        self.assertEqual(count_recipients(target_phones(self.notification)), 4)
+        self.assertEqual(queue_broadcast(self.notification, 'Hi', target_phones(self.notification)), {"recipients": 4, "batches": 2})
+        batches = list(self.notification.sms_batches.order_by('pk').values_list('recipients', flat=True))
+        self.assertEqual([len(batch) for batch in batches], [3, 1])
+        self.assertEqual(sorted(sum(batches, [])), expected)
+        self.assertEqual(self.dispatch(), {'SENT': 2})
+        self.assertEqual(sorted(sum((request['recipients'] for request in self.gateway.requests), [])), expected)
+        self.assertEqual(SmsDelivery.objects.filter(outbox__notification=self.notification, status='SENT').count(), 4)
+
+
+@override_settings(SMS_CALLBACK_TOKEN='callback-secret')
+class DeliveryReportTests(StandInGatewayTestCase):
+    '''Gateway delivery reports update the deliveries, and the failed recipients can be sent the message again'''
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(
+            email='admin@nidf.org', password='pass', name='Admin', phone='0200000000', phone_verified=True, user_type='ADMIN',
+        )
+        cls.notification = Notification.objects.create(title='Meeting', message='Saturday at 10', target='SELECTION')
+
+    def setUp(self):
+        super().setUp()
+        self.phones = [f'23324400000{i}' for i in range(4)]
+        queue_broadcast(self.notification, 'Meeting\n\nSaturday at 10', self.phones)
+        self.dispatch()
+        self.gateway.requests.clear()
+        self.api = APIClient()
+
+    def statuses(self):
+        return dict(SmsDelivery.objects.order_by('phone').values_list('phone', 'status'))
+
+    def report(self, data, **headers):
+        return self.api.post('/api-v1/sms/delivery-reports/', data, format='json', **headers)
+
+    def test_reports(self):
+        counts = apply_delivery_reports([
+            {"id": f"msg-{self.phones[0]}", "status": "DELIVRD"},
+            {"id": f"msg-{self.phones[1]}", "status": "undelivered", "reason": "Absent subscriber"},
+            {"id": f"msg-{self.phones[1]}", "status": "FAILED", "reason": "Absent subscriber"},
+            {"id": f"msg-{self.phones[2]}", "status": "SENT"},
+            {"id": "msg-unknown", "status": "DELIVERED"},
+            {"id": f"msg-{self.phones[3]}", "status": "LOST"},
+            "not a report",
+        ])
+        self.assertEqual(counts, {"updated": 2, "ignored": 2, "unknown": 3})
+        self.assertEqual(self.statuses(), dict(zip(self.phones, ['DELIVERED', 'FAILED', 'SENT', 'SENT'])))
+        self.assertEqual(SmsDelivery.objects.get(phone=self.phones[1]).error, 'Absent subscriber')
+        self.assertIsNotNone(SmsDelivery.objects.get(phone=self.phones[0]).delivered_at)
+
+    def test_late_reports_do_not_move_deliveries_back(self):
+        apply_delivery_reports([{"id": f"msg-{self.phones[0]}", "status": "DELIVERED"}])
+        counts = apply_delivery_reports([{"id": f"msg-{self.phones[0]}", "status": "FAILED"}, {"id": f"msg-{self.phones[0]}", "status": "SENT"}])
+        self.assertEqual(counts, {"updated": 0, "ignored": 2, "unknown": 0})
+        self.assertEqual(self.statuses()[self.phones[0]], 'DELIVERED')
+
+    def test_callback_token_is_taken_from_the_header(self):
+        data = {"reports": [{"id": f"msg-{self.phones[0]}", "status": "DELIVERED"}]}
+        self.assertEqual(self.report(data).status_code, 403)
+        self.assertEqual(self.report(data, HTTP_X_CALLBACK_TOKEN='wrong').status_code, 403)
+        self.assertEqual(self.api.post('/api-v1/sms/delivery-reports/?token=callback-secret', data, format='json').status_code, 403)
+        self.assertEqual(self.statuses()[self.phones[0]], 'SENT')
+        response = self.report(data, HTTP_X_CALLBACK_TOKEN='callback-secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {"updated": 1, "ignored": 0, "unknown": 0})
+        self.assertEqual(self.report({"id": f"msg-{self.phones[1]}", "status": "DELIVERED"}, HTTP_X_CALLBACK_TOKEN='callback-secret').data["updated"], 1)
+        self.assertEqual(self.report("[1]", HTTP_X_CALLBACK_TOKEN='callback-secret').status_code, 400)
+
+    def test_retry_failed(self):
+        failed = self.phones[1:3]
+        apply_delivery_reports([{"id": f"msg-{phone}", "status": "FAILED"} for phone in failed])
+        self.assertEqual(retry_failed(self.notification), {"recipients": 2, "batches": 1})
+        self.assertEqual(self.statuses(), dict(zip(self.phones, ['SENT', 'RETRIED', 'RETRIED', 'SENT'])))
+        # nothing is left to retry until the new attempt fails
+        self.assertEqual(retry_failed(self.notification), {"recipients": 0, "batches": 0})
+        self.dispatch()
+        self.assertEqual(self.gateway.requests, [{"sender": settings.SENDER_ID, "message": 'Meeting\n\nSaturday at 10', "recipients": failed}])
+
+    def test_deliveries_endpoint(self):
+        apply_delivery_reports([{"id": f"msg-{self.phones[0]}", "status": "FAILED"}])
+        self.api.force_authenticate(self.admin)
+        response = self.api.get('/api-v1/notifications/deliveries/', {'notification': self.notification.id})
+        self.assertEqual(response.data["deliveries"], {'SENT': 3, 'FAILED': 1})
+        response = self.api.post('/api-v1/notifications/deliveries/', {'notification': self.notification.id}, format='json')
+        self.assertEqual((response.data["recipients"], response.data["batches"]), (1, 1))
+        self.assertEqual(self.api.get('/api-v1/notifications/deliveries/', {'notification': 'x'}).status_code, 404)
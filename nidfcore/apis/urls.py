@@ -32,10 +32,23 @@ urlpatterns += [
 urlpatterns += [
     path('repayments/', views.RepaymensAPIView.as_view(), name='repayments'),
     path('verifyrepayments/', views.VerifyRepaymentAPIView.as_view(), name='verify_repayments'),
+    path('repayments/schedule/', views.RepaymentScheduleAPIView.as_view(), name='repayment_schedule'),
+    path('repayments/overdue/', views.OverdueInstallmentsAPIView.as_view(), name='overdue_installments'),
     path('progressreports/', views.ProgressReportsAPIView.as_view(), name='progressreports'),
     path('verifyreports/', views.VerifyProgressReportAPIView.as_view(), name='verify_reports'),
 ]
 
+# finance reports
+urlpatterns += [
+    path('reports/aging/', views.AgingReportAPIView.as_view(), name='aging_report'),
+    path('exports/<str:kind>/', views.ExportAPIView.as_view(), name='exports'),
+]
+
+# search endpoints
+urlpatterns += [
+    path('search/', views.SearchAPIView.as_view(), name='search'),
+]
+
 # disbursements
 urlpatterns += [
     path('disbursements/', views.DisbursementsAPIView.as_view(), name='disbursements'),
@@ -44,6 +57,9 @@ urlpatterns += [
 # dashboard
 urlpatterns += [
     path('dashboard/', views.DashboardAPIView.as_view(), name='dashboard'),
+    path('dashboard/regions/', views.RegionDashboardAPIView.as_view(), name='region_dashboard'),
+    path('dashboard/districts/', views.DistrictDashboardAPIView.as_view(), name='district_dashboard'),
+    path('dashboard/trends/', views.PortfolioTrendAPIView.as_view(), name='portfolio_trends'),
 ]
 
 # church and divisions endpoints
@@ -52,11 +68,17 @@ urlpatterns += [
     path('churchprofile/', views.ChurchProfileAPIView.as_view(), name='churchprofile'),
     path('regions/', views.RegionsAPIView.as_view(), name='regions'),
     path('divisions/', views.DivisionsAPIView.as_view(), name='districts'),
+    path('hierarchy/', views.HierarchyAPIView.as_view(), name='hierarchy'),
+    path('autocomplete/<str:kind>/', views.AutocompleteAPIView.as_view(), name='autocomplete'),
 ]
 
 # notifications endpoints
 urlpatterns += [
     path('notifications/', views.NotificationsAPIView.as_view(), name='notifications'),
+    path('notifications/audience/', views.NotificationAudienceAPIView.as_view(), name='notification_audience'),
+    path('notifications/deliveries/', views.NotificationDeliveriesAPIView.as_view(), name='notification_deliveries'),
+    path('sms/metrics/', views.SmsMetricsAPIView.as_view(), name='sms_metrics'),
+    path('sms/delivery-reports/', views.SmsDeliveryReportsAPIView.as_view(), name='sms_delivery_reports'),
     # broadcast scheduled notifications
     path('broadcastsn/', views.ScheduledNotificationBroadcastAPIView.as_view(), name='bsn'),
 ]
\ No newline at end of file
@@ -3,8 +3,11 @@ from .churches import *
 from .dashboard import *
 from .disbursements import *
 from .divisions import *
+from .exports import *
 from .progressreport import *
 from .repayments import *
+from .reports import *
+from .search import *
 from .users import *
 from .notifications import *
 
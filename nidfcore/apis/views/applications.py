@@ -2,11 +2,12 @@ from rest_framework import permissions, status
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from apis.models import Application
+from apis.filters import ApplicationFilter
+from apis.models import Application, SmsOutbox
 from apis.serializers import AddApplicationSerializers, ApplicationSerializers
 from nidfcore.utils.constants import ApplicationStatus, ConstLists, UserType
+from nidfcore.utils.pagination import list_response
 from nidfcore.utils.permissions import IsCentralAndSuperUser
-from nidfcore.utils.services import send_sms
 
 
 class ApplicationsAPIView(APIView):
@@ -15,23 +16,21 @@ class ApplicationsAPIView(APIView):
     permission_classes = (permissions.IsAuthenticated,)
 
     def get(self, request, *args, **kwargs):
+        '''Get applications - query budget: 5 queries (ETag validator, rows, churches, districts, regions) whatever the number of rows'''
         user = request.user
 
         # superuser, admin users and finance officers can view all applications
         if user.is_superuser or user.user_type == UserType.ADMIN.value or user.user_type == UserType.FINANCE_OFFICER.value:
             applications = Application.objects.all().order_by('-created_at')
-            serializer = ApplicationSerializers(applications, many=True)
-            return Response(serializer.data, status=status.HTTP_200_OK)
+            return list_response(request, applications, ApplicationSerializers, ordering=('-created_at', '-id'), filterset_class=ApplicationFilter)
         elif user.user_type == UserType.CHURCH_USER.value:
             # church users can only see applications belonging to their church
             applications = Application.objects.filter(church=user.church_profile).order_by('-created_at')
-            serializer = ApplicationSerializers(applications, many=True)
-            return Response(serializer.data, status=status.HTTP_200_OK)
+            return list_response(request, applications, ApplicationSerializers, ordering=('-created_at', '-id'), filterset_class=ApplicationFilter)
         else:
             # anyone else shouldn't see any applications
             applications = Application.objects.none()
-            serializer = ApplicationSerializers(applications, many=True)
-            return Response(serializer.data, status=status.HTTP_200_OK)
+            return list_response(request, applications, ApplicationSerializers, ordering=('-created_at', '-id'), filterset_class=ApplicationFilter)
 
     def post(self, request, *args, **kwargs):
         '''POST request to create or update an application'''
@@ -196,7 +195,7 @@ class AdditionalInformationAPIView(APIView):
         msg = title + "\n" + message
 
         # send sms to user
-        send_sms(message=msg, recipients=phones)
+        SmsOutbox.queue(message=msg, recipients=phones)
 
         # change the status back to draft
         application.status = ApplicationStatus.DRAFT.value
@@ -2,9 +2,13 @@ from rest_framework import permissions, status
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from accounts.models import Church
-from apis.serializers import AddChurchSerializer, GetChurchSerializer
+from accounts.models import Church, District, Region
+from apis.models import Application, Repayment
+from apis.serializers import AddChurchSerializer, ChurchListSerializer, GetChurchSerializer
+from nidfcore.utils.cache import get_data_versions, response_cache_key, single_flight
+from nidfcore.utils.conditional import conditional_response
 from nidfcore.utils.constants import UserType
+from nidfcore.utils.pagination import KeysetPagination
 
 
 class ChurchProfileAPIView(APIView):
@@ -15,8 +19,11 @@ class ChurchProfileAPIView(APIView):
         '''Returns the church profile of the authenticated user'''
         user = request.user
         if user.church_profile:
-            serializer = GetChurchSerializer(user.church_profile)
-            return Response(serializer.data, status=status.HTTP_200_OK)
+            church = user.church_profile
+            build = lambda: Response(GetChurchSerializer(church).data, status=status.HTTP_200_OK)
+            # the nested district and region are covered by their data versions
+            validator = (church.updated_at, get_data_versions([District, Region]))
+            return conditional_response(request, build, validator, last_modified=church.updated_at)
         return Response({'error': 'Church profile not found'}, status=status.HTTP_404_NOT_FOUND)
     
     def put(self, request, *args, **kwargs):
@@ -35,12 +42,25 @@ class ChurchesAPIView(APIView):
     '''API endpoint for churches'''
     permission_classes = [permissions.IsAuthenticated]
 
+    # responses are cached until one of these models changes
+    cache_models = [Church, District, Region, Application, Repayment]
+
     def get(self, request, *args, **kwargs):
-        '''Returns a list of churches'''
+        '''Returns a list of churches - query budget: 3 queries (rows, districts, regions) whatever the number of rows'''
         # everyone can view the list of churches
-        churches = Church.objects.all().order_by('location_name')
-        serializer = GetChurchSerializer(churches, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        key = response_cache_key('churches', 'all', request.query_params, self.cache_models)
+        build = lambda: Response(single_flight(key, lambda: self.list_churches(request)), status=status.HTTP_200_OK)
+        return conditional_response(request, build, validator=get_data_versions(self.cache_models))
+
+    def list_churches(self, request):
+        '''Serializes the churches with their repayment status (one keyset page when pagination is requested)'''
+        paginator = KeysetPagination(ordering=('location_name', 'id'))
+        churches = ChurchListSerializer.from_request(request).optimize(Church.objects.with_repayment_status(), keep=paginator.fields)
+        churches = churches.order_by('location_name')
+        if not paginator.is_requested(request):
+            return ChurchListSerializer.from_request(request, churches, many=True).data
+        page = paginator.paginate_queryset(churches, request)
+        return paginator.get_paginated_data(ChurchListSerializer.from_request(request, page, many=True).data)
 
 
     def post(self, request, *args, **kwargs):
@@ -1,40 +1,150 @@
+from datetime import timedelta
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date
 from rest_framework import permissions, status
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from apis.models import Application
+from accounts.models import District, Region
+from apis.finance import get_church_summary, get_portfolio_summary
+from apis.models import Application, Disbursement, DistrictRollup, PortfolioSnapshot, RegionRollup, Repayment
+from apis.rollups import get_national_figures
+from apis.serializers import DistrictRollupSerializer, PortfolioSnapshotSerializer, RegionRollupSerializer
+from nidfcore.utils.cache import get_data_versions, response_cache_key, single_flight
+from nidfcore.utils.conditional import conditional_response, queryset_validator
 from nidfcore.utils.constants import ApplicationStatus, UserType
+from nidfcore.utils.permissions import IsDivisionAndCentralUser
 
 
 class DashboardAPIView(APIView):
     '''Dashboard API View'''
     permission_classes = [permissions.IsAuthenticated]
 
+    # responses are cached until one of these models changes
+    cache_models = [Application, Disbursement, Repayment]
+
     def get(self, request, *args, **kwargs):
-        '''GET request'''
+        '''GET request (unchanged polls get a 304 from the data versions, without a query)'''
         user = request.user
+        versions = get_data_versions(self.cache_models)
         if user.is_superuser or user.user_type == UserType.ADMIN.value or user.user_type == UserType.FINANCE_OFFICER.value:
-            return Response({
-                'total_pending': Application.objects.filter(status=ApplicationStatus.PENDING.value).count(),
-                'total_approved': Application.objects.filter(status=ApplicationStatus.APPROVED.value).count(),
-                'total_rejected': Application.objects.filter(status=ApplicationStatus.REJECTED.value).count(),
-                'total_disbursed': sum([app.get_disbursed_amount() for app in Application.objects.all()]),
-                'total_repaid': sum([app.get_repayment_amount() for app in Application.objects.all()]),
-                'outstanding_balance': sum([app.get_disbursed_amount() for app in Application.objects.all()]) - sum([app.get_repayment_amount() for app in Application.objects.all()]),
-            }, status=status.HTTP_200_OK)
+            key = response_cache_key('dashboard', 'admin', None, self.cache_models)
+            build = lambda: Response(single_flight(key, get_portfolio_summary), status=status.HTTP_200_OK)
+            return conditional_response(request, build, validator=versions)
         elif user.user_type == UserType.CHURCH_USER.value and user.church_profile != None:
             church = user.church_profile
-            pending_statuses = [ApplicationStatus.PENDING.value, ApplicationStatus.UNDER_REVIEW.value, ApplicationStatus.WAITING_NO_APPROVAL.value]
-            pending = Application.objects.filter(church=user.church_profile, status__in=pending_statuses).order_by('-created_by').first()
-            msg = f"Your Application ({pending.application_id}) is pending review." if pending is not None else "You have no application pending review."
-            return Response({
-                'amount_received': church.get_amount_received(),
-                'amount_repaid': church.get_amount_repaid(),
-                'arrears': church.get_arrears(),
-                'last_payment': church.get_last_repayment_date(),
-                'repayment_percentage': church.get_repaid_percentage(),
-                'next_due_date': church.get_next_due_date(),
-                'pending_application': msg
-            }, status=status.HTTP_200_OK)
+            key = response_cache_key('dashboard', f'church:{church.pk}', None, self.cache_models)
+            build = lambda: Response(single_flight(key, lambda: self.get_church_dashboard(church)), status=status.HTTP_200_OK)
+            return conditional_response(request, build, validator=versions)
+        else:
+            return Response({"message": "User does not have a church profile"}, status=status.HTTP_400_BAD_REQUEST)
+
+    def get_church_dashboard(self, church) -> dict:
+        '''Builds the dashboard figures of a church'''
+        pending_statuses = [ApplicationStatus.PENDING.value, ApplicationStatus.UNDER_REVIEW.value, ApplicationStatus.WAITING_NO_APPROVAL.value]
+        pending = Application.objects.filter(church=church, status__in=pending_statuses).order_by('-created_by').first()
+        msg = f"Your Application ({pending.application_id}) is pending review." if pending is not None else "You have no application pending review."
+        summary = get_church_summary(church)
+        repayment_status = church.get_repayment_status()
+        return {
+            'amount_received': summary['amount_received'],
+            'amount_repaid': summary['amount_repaid'],
+            'arrears': summary['arrears'],
+            'last_payment': repayment_status['last_payment'],
+            'repayment_percentage': summary['repayment_percentage'],
+            'next_due_date': repayment_status['next_due_date'],
+            'pending_application': msg
+        }
+
+
+class RegionDashboardAPIView(APIView):
+    '''Portfolio figures per region and nationally, read from the region rollups'''
+    permission_classes = [IsDivisionAndCentralUser]
+
+    def get(self, request, *args, **kwargs):
+        '''GET request: all regions (with national totals) or a single region if a `region` id is parsed'''
+        try:
+            region_id = int(request.query_params['region']) if request.query_params.get('region') else None
+        except ValueError:
+            return Response({"message": "region must be an id"}, status=status.HTTP_400_BAD_REQUEST)
+        rollups = RegionRollup.objects.select_related('region')
+        if region_id:
+            rollups = rollups.filter(region_id=region_id)
+        count, last_modified = queryset_validator(rollups)
+        validator = (count, last_modified, get_data_versions([Region]))
+        return conditional_response(request, lambda: self.build(rollups, region_id), validator, last_modified)
+
+    def build(self, rollups, region_id) -> Response:
+        '''Serializes the rollups'''
+        if region_id:
+            rollup = rollups.first()
+            if rollup is None:
+                return Response({"message": "Region not found"}, status=status.HTTP_404_NOT_FOUND)
+            return Response(RegionRollupSerializer(rollup).data, status=status.HTTP_200_OK)
+        serializer = RegionRollupSerializer(rollups.order_by('region__name'), many=True)
+        return Response({"national": get_national_figures(), "regions": serializer.data}, status=status.HTTP_200_OK)
+
+
+class DistrictDashboardAPIView(APIView):
+    '''Portfolio figures per district, read from the district rollups'''
+    permission_classes = [IsDivisionAndCentralUser]
+
+    def get(self, request, *args, **kwargs):
+        '''GET request: all districts, the districts of a `region` or a single `district`'''
+        try:
+            district_id = int(request.query_params['district']) if request.query_params.get('district') else None
+            region_id = int(request.query_params['region']) if request.query_params.get('region') else None
+        except ValueError:
+            return Response({"message": "region and district must be ids"}, status=status.HTTP_400_BAD_REQUEST)
+        rollups = DistrictRollup.objects.select_related('district')
+        if district_id:
+            rollups = rollups.filter(district_id=district_id)
+        elif region_id:
+            rollups = rollups.filter(district__region_id=region_id)
+        count, last_modified = queryset_validator(rollups)
+        validator = (count, last_modified, get_data_versions([District]))
+        return conditional_response(request, lambda: self.build(rollups, district_id), validator, last_modified)
+
+    def build(self, rollups, district_id) -> Response:
+        '''Serializes the rollups'''
+        if district_id:
+            rollup = rollups.first()
+            if rollup is None:
+                return Response({"message": "Division not found"}, status=status.HTTP_404_NOT_FOUND)
+            return Response(DistrictRollupSerializer(rollup).data, status=status.HTTP_200_OK)
+        serializer = DistrictRollupSerializer(rollups.order_by('district__name'), many=True)
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+
+
+class PortfolioTrendAPIView(APIView):
+    '''Portfolio trend over a date range, read from the daily snapshots'''
+    permission_classes = [IsDivisionAndCentralUser]
+
+    def get(self, request, *args, **kwargs):
+        '''GET request: national trend, or a region's trend if a `region` id is parsed (`start`/`end` as YYYY-MM-DD)'''
+        end = request.query_params.get('end')
+        start = request.query_params.get('start')
+        try:
+            # parse_date returns None for malformed dates and raises for impossible ones (2025-02-30)
+            end = parse_date(end) if end else timezone.localdate()
+            start = parse_date(start) if start else (end - timedelta(days=30) if end else None)
+        except ValueError:
+            start = end = None
+        if start is None or end is None:
+            return Response({"message": "Dates must be valid YYYY-MM-DD dates"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            region_id = int(request.query_params['region']) if request.query_params.get('region') else None
+        except ValueError:
+            return Response({"message": "region must be an id"}, status=status.HTTP_400_BAD_REQUEST)
+
+        snapshots = PortfolioSnapshot.objects.filter(date__range=(start, end))
+        if region_id:
+            snapshots = snapshots.filter(region_id=region_id)
         else:
-            return Response({"message": "User does not have a church profile"}, status=status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
+            snapshots = snapshots.filter(region__isnull=True)
+        # snapshots are replaced (not updated) when recorded again
+        count, last_modified = queryset_validator(snapshots, field='created_at')
+        build = lambda: Response(PortfolioSnapshotSerializer(snapshots.order_by('date'), many=True).data, status=status.HTTP_200_OK)
+        return conditional_response(request, build, (count, last_modified), last_modified)
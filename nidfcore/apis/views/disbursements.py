@@ -2,10 +2,12 @@ from rest_framework import permissions, status
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from apis.filters import DisbursementFilter
 from apis.models import Disbursement
 from apis.serializers import (AddDisbursementSerializer,
                               GetDisbursementSerializer)
 from nidfcore.utils.constants import UserType
+from nidfcore.utils.pagination import list_response
 
 
 class DisbursementsAPIView(APIView):
@@ -13,23 +15,20 @@ class DisbursementsAPIView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request, *args, **kwargs):
-        '''Handles GET requests'''
+        '''Handles GET requests - query budget: 5 queries (ETag validator, rows, churches, districts, regions) whatever the number of rows'''
         user = request.user
         if user.is_superuser or user.user_type == UserType.ADMIN.value or user.user_type == UserType.FINANCE_OFFICER.value:
             # superuser, admin and finance officer can view all disbursements
             disbursements = Disbursement.objects.all().order_by('-created_at')
-            serializer = GetDisbursementSerializer(disbursements, many=True)
-            return Response(serializer.data, status=status.HTTP_200_OK)
+            return list_response(request, disbursements, GetDisbursementSerializer, ordering=('-created_at', '-id'), filterset_class=DisbursementFilter)
         elif user.user_type == UserType.CHURCH_USER.value:
             # church users can only see disbursements belonging to their church
             disbursements = Disbursement.objects.filter(application__church=user.church_profile).order_by('-created_at')
-            serializer = GetDisbursementSerializer(disbursements, many=True)
-            return Response(serializer.data, status=status.HTTP_200_OK)
+            return list_response(request, disbursements, GetDisbursementSerializer, ordering=('-created_at', '-id'), filterset_class=DisbursementFilter)
         else:
             # anyone else shouldn't see any disbursements
             disbursements = Disbursement.objects.none()
-            serializer = GetDisbursementSerializer(disbursements, many=True)
-            return Response(serializer.data, status=status.HTTP_200_OK)
+            return list_response(request, disbursements, GetDisbursementSerializer, ordering=('-created_at', '-id'), filterset_class=DisbursementFilter)
         
     def post(self, request, *args, **kwargs):
         '''Handles POST requests'''
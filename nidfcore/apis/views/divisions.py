@@ -3,8 +3,11 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 
 from accounts.models import Church, District, Region
+from apis.hierarchy import DEPTHS, get_hierarchy
 from apis.serializers import (AddDistrictSerializer, GetChurchSerializer,
                               GetDistrictSerializer, RegionSerializer)
+from nidfcore.utils.cache import get_data_versions, response_cache_key, single_flight
+from nidfcore.utils.conditional import conditional_response
 from nidfcore.utils.constants import UserType
 
 
@@ -13,22 +16,31 @@ class RegionsAPIView(APIView):
 
     permission_classes = (permissions.AllowAny,)
 
+    # responses are cached until one of these models changes
+    cache_models = [Region, District, Church]
+
     def get(self, request, *args, **kwargs):
         # anyone user can get all regions or a single region if a param is parsed
         param = request.query_params.get('query')
+        key = response_cache_key('regions', 'all', request.query_params, self.cache_models)
+        build = lambda: Response(single_flight(key, lambda: self.list_regions(param)), status=status.HTTP_200_OK)
+        return conditional_response(request, build, validator=get_data_versions(self.cache_models))
+
+    def list_regions(self, param: str) -> dict:
+        '''Serializes all regions, or a single region and its divisions (query budget: 1 query, 3 for a single region)'''
         divisions = District.objects.none() 
         if param == None:
-            regions = Region.objects.all().order_by('name')
+            regions = RegionSerializer.eager_load(Region.objects.all()).order_by('name')
             many = True
         else:
-            regions = Region.objects.filter(name=param).first()
+            regions = RegionSerializer.eager_load(Region.objects.filter(name=param)).first()
             if regions is not None:
-                divisions = District.objects.filter(region=regions)
+                divisions = GetDistrictSerializer.eager_load(District.objects.filter(region=regions))
             many = False
         serializer = RegionSerializer(regions, many=many)
         district_serializer = GetDistrictSerializer(divisions, many=True)
 
-        return Response({"region":serializer.data, "divisions":district_serializer.data }, status=status.HTTP_200_OK)
+        return {"region":serializer.data, "divisions":district_serializer.data }
     
     def post(self, request, *args, **kwargs):
         user = request.user
@@ -85,24 +97,32 @@ class DivisionsAPIView(APIView):
 
     permission_classes = (permissions.AllowAny,)
 
+    # responses are cached until one of these models changes
+    cache_models = [Region, District, Church]
+
     def get(self, request, *args, **kwargs):
         # we can use this endpoint to get all or a single district by parsing 
         # the name of the district as a 'query' param.
         param = request.query_params.get('query')
+        key = response_cache_key('divisions', 'all', request.query_params, self.cache_models)
+        build = lambda: Response(single_flight(key, lambda: self.list_divisions(param)), status=status.HTTP_200_OK)
+        return conditional_response(request, build, validator=get_data_versions(self.cache_models))
+
+    def list_divisions(self, param: str) -> dict:
+        '''Serializes all divisions, or a single division and its churches (query budget: 2 queries, 5 for a single division)'''
         churches = Church.objects.none()
         if param == None:
-            divisions = District.objects.all().order_by('name')
+            divisions = GetDistrictSerializer.eager_load(District.objects.all()).order_by('name')
             many = True
         else:
-            divisions = District.objects.filter(name=param).first()
+            divisions = GetDistrictSerializer.eager_load(District.objects.filter(name=param)).first()
             if divisions is not None:
-                churches = Church.objects.filter(district=divisions)
+                churches = GetChurchSerializer.eager_load(Church.objects.filter(district=divisions))
             many = False
-        divisions = District.objects.all().order_by('name')
         serializer = GetDistrictSerializer(divisions, many=many)
         church_serializer = GetChurchSerializer(churches, many=True)
 
-        return Response({"divisions":serializer.data, "churches":church_serializer.data }, status=status.HTTP_200_OK)
+        return {"divisions":serializer.data, "churches":church_serializer.data }
     
     def post(self, request, *args, **kwargs):
         user = request.user
@@ -149,4 +169,74 @@ class DivisionsAPIView(APIView):
         if division is None:
             return Response({"message": "Division not found"}, status=status.HTTP_404_NOT_FOUND)
         division.delete()
-        return Response({"message": "Division deleted successfully"}, status=status.HTTP_200_OK)
\ No newline at end of file
+        return Response({"message": "Division deleted successfully"}, status=status.HTTP_200_OK)
+
+class HierarchyAPIView(APIView):
+    '''The Region -> District -> Church tree (ids, names and counts), served from process memory'''
+
+    permission_classes = (permissions.AllowAny,)
+
+    def get(self, request, *args, **kwargs):
+        '''
+        GET request. Query params: `region` or `district` (id) for a subtree, and `depth`
+        (region, district or church, the default) to leave out the levels below it.
+        Query budget: 0 queries (3 after regions, districts or churches changed, or every HIERARCHY_MAX_AGE seconds).
+        '''
+        depth = request.query_params.get('depth', 'church')
+        if depth not in DEPTHS:
+            return Response({"message": f"Depth must be one of {', '.join(DEPTHS)}"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            region = int(request.query_params['region']) if 'region' in request.query_params else None
+            district = int(request.query_params['district']) if 'district' in request.query_params else None
+        except ValueError:
+            return Response({"message": "region and district must be ids"}, status=status.HTTP_400_BAD_REQUEST)
+
+        hierarchy = get_hierarchy()
+
+        def build() -> Response:
+            if district is not None:
+                data = hierarchy.district(district, depth)
+            elif region is not None:
+                data = hierarchy.region(region, depth)
+            else:
+                return Response({"regions": hierarchy.tree(depth)}, status=status.HTTP_200_OK)
+            if data is None:
+                return Response({"message": "Region or division not found"}, status=status.HTTP_404_NOT_FOUND)
+            return Response(data, status=status.HTTP_200_OK)
+
+        return conditional_response(request, build, validator=hierarchy.digest)
+
+
+class AutocompleteAPIView(APIView):
+    '''Prefix autocomplete of churches, districts and regions for pickers, as (id, label) pairs'''
+
+    permission_classes = (permissions.AllowAny,)
+
+    # kind -> (model, label field, {query param: lookup} narrowing the choices)
+    sources = {
+        'church': (Church, 'location_name', {'district': 'district_id', 'region': 'district__region_id'}),
+        'district': (District, 'name', {'region': 'region_id'}),
+        'region': (Region, 'name', {}),
+    }
+    max_limit = 50
+
+    def get(self, request, kind, *args, **kwargs):
+        '''
+        GET request. Query params: `q` (prefix, case and accent insensitive), `limit` (default 10)
+        and, to chain pickers, `region` for districts or `district`/`region` for churches (query budget: 1 query).
+        '''
+        if kind not in self.sources:
+            return Response({"message": f"Kind must be one of {', '.join(self.sources)}"}, status=status.HTTP_404_NOT_FOUND)
+        if kind == 'church' and not request.user.is_authenticated:
+            # churches are only listed to signed in users (as in ChurchesAPIView)
+            return Response({"message": "Authentication credentials were not provided."}, status=status.HTTP_401_UNAUTHORIZED)
+        try:
+            limit = min(max(int(request.query_params.get('limit', 10)), 1), self.max_limit)
+            narrowing = {lookup: int(request.query_params[param]) for param, lookup in self.sources[kind][2].items() if param in request.query_params}
+        except ValueError:
+            return Response({"message": "limit and ids must be numbers"}, status=status.HTTP_400_BAD_REQUEST)
+
+        model, label, _ = self.sources[kind]
+        rows = model.objects.prefix(request.query_params.get('q', '')).filter(**narrowing).order_by('search_key', 'id')
+        results = [{"id": pk, "label": name} for pk, name in rows.values_list('id', label)[:limit]]
+        return Response({"results": results}, status=status.HTTP_200_OK)
@@ -0,0 +1,51 @@
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from rest_framework import permissions, status
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from apis.exports import EXPORTS, FORMATS, export_rows, stream_export
+from nidfcore.utils.constants import UserType
+
+
+class ExportAPIView(APIView):
+    '''Streams applications, repayments or disbursements as CSV or JSON Lines'''
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, kind, *args, **kwargs):
+        '''
+        GET request. Query params: `export_format` (csv or jsonl), `start` and `end`
+        (YYYY-MM-DD, inclusive) and `status`.
+        '''
+        if kind not in EXPORTS:
+            return Response({"message": f"Export must be one of {', '.join(EXPORTS)}"}, status=status.HTTP_404_NOT_FOUND)
+        export_format = request.query_params.get('export_format', 'csv')
+        if export_format not in FORMATS:
+            return Response({"message": f"Export format must be one of {', '.join(FORMATS)}"}, status=status.HTTP_400_BAD_REQUEST)
+
+        dates = {}
+        for param in ('start', 'end'):
+            value = request.query_params.get(param)
+            try:
+                # parse_date returns None for malformed dates and raises for impossible ones (2025-13-01)
+                dates[param] = parse_date(value) if value else None
+            except ValueError:
+                dates[param] = None
+            if value and dates[param] is None:
+                return Response({"message": "Dates must be valid YYYY-MM-DD dates"}, status=status.HTTP_400_BAD_REQUEST)
+
+        # superuser, admin and finance officer can export everything, church users their own records
+        user = request.user
+        church = None
+        if not (user.is_superuser or user.user_type in (UserType.ADMIN.value, UserType.FINANCE_OFFICER.value)):
+            if user.user_type != UserType.CHURCH_USER.value or not user.church_profile:
+                return Response({"message": "You are not allowed to export records"}, status=status.HTTP_403_FORBIDDEN)
+            church = user.church_profile
+
+        headers, rows = export_rows(kind, start=dates['start'], end=dates['end'], status=request.query_params.get('status'), church=church)
+        content_type, extension = FORMATS[export_format]
+        response = StreamingHttpResponse(stream_export(export_format, headers, rows), content_type=content_type)
+        filename = f"{kind}-{timezone.localdate():%Y%m%d}.{extension}"
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
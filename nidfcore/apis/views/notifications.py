@@ -1,12 +1,19 @@
+import hmac
+
+from django.conf import settings
 from rest_framework import permissions, status
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from django.db.models import Q
+from django.db.models import Count, Q
 from django.utils import timezone
 
-from apis.models import Notification
+from apis.broadcast import CHUNK_SIZE, audience_phones, count_recipients, retry_failed, target_phones
+from apis.models import Notification, SmsDelivery
+from apis.outbox import apply_delivery_reports, outbox_metrics
 from apis.serializers import NotificationSerializer
 from nidfcore.utils.constants import Target, UserType
+from nidfcore.utils.pagination import TRUE_VALUES, list_response
+from nidfcore.utils.permissions import IsCentralAndSuperUser
 
 
 class NotificationsAPIView(APIView):
@@ -24,12 +31,12 @@ class NotificationsAPIView(APIView):
         # church users can only see notifications targeted to their church
         if user.user_type == UserType.CHURCH_USER.value:
             notifications = Notification.objects.filter(
-                Q(traget=Target.ALL.value) | Q(target=Target.CHURCH.value)
+                Q(target=Target.ALL.value) | Q(target=Target.CHURCH.value)
             ).order_by('-created_at')
-        # admin users can see all notifications
-        notifications = Notification.objects.all().order_by('-created_at')
-        serializer = NotificationSerializer(notifications, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        else:
+            # admin users can see all notifications
+            notifications = Notification.objects.all().order_by('-created_at')
+        return list_response(request, notifications, NotificationSerializer, ordering=('-created_at', '-id'))
     
     def post(self, request):
         '''Post a new notification'''
@@ -100,3 +107,103 @@ class ScheduledNotificationBroadcastAPIView(APIView):
             notification.broadcast(user=None)
             print("============================================")
         return Response({"message": "Request Submitted Successfully"}, status=status.HTTP_200_OK)
+
+
+class SmsMetricsAPIView(APIView):
+    '''SMS outbox size per status, and the gateway latency, error and throughput counters of the workers'''
+    permission_classes = [IsCentralAndSuperUser]
+
+    def get(self, request):
+        return Response(outbox_metrics(), status=status.HTTP_200_OK)
+
+
+class SmsDeliveryReportsAPIView(APIView):
+    '''
+    Delivery report callback of the SMS gateway: a report ({"id", "status", "reason"?}), a list
+    of reports or {"reports": [...]}, applied in bulk. The gateway sends SMS_CALLBACK_TOKEN in
+    the X-Callback-Token header (never in the URL, which ends up in access logs).
+    '''
+    permission_classes = [permissions.AllowAny]
+
+    def post(self, request):
+        token = request.headers.get('X-Callback-Token', '')
+        if not settings.SMS_CALLBACK_TOKEN or not hmac.compare_digest(token, settings.SMS_CALLBACK_TOKEN):
+            return Response({"message": "Invalid callback token"}, status=status.HTTP_403_FORBIDDEN)
+
+        reports = request.data
+        if isinstance(reports, dict):
+            reports = reports.get('reports', [reports])
+        if not isinstance(reports, list):
+            return Response({"message": "Expected a report or a list of reports"}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(apply_delivery_reports(reports), status=status.HTTP_200_OK)
+
+
+class NotificationDeliveriesAPIView(APIView):
+    '''Delivery counts per status of a broadcast notification (get), and re-sending to its failed recipients (post)'''
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_notification(self, request, notification_id):
+        if request.user.user_type == UserType.CHURCH_USER.value:
+            return None, Response({"message": "You are not allowed to manage notifications"}, status=status.HTTP_401_UNAUTHORIZED)
+        notification = Notification.objects.filter(id=notification_id).first() if str(notification_id or '').isdigit() else None
+        if not notification:
+            return None, Response({"message": "Notification not found"}, status=status.HTTP_404_NOT_FOUND)
+        return notification, None
+
+    def get(self, request):
+        notification, error = self.get_notification(request, request.query_params.get('notification'))
+        if error:
+            return error
+        counts = dict(
+            SmsDelivery.objects.filter(outbox__notification=notification)
+            .values_list('status').annotate(count=Count('id')).order_by()
+        )
+        return Response({"notification": notification.id, "deliveries": counts}, status=status.HTTP_200_OK)
+
+    def post(self, request):
+        '''Queues the notification again, only to the recipients it failed to reach'''
+        notification, error = self.get_notification(request, request.data.get('notification'))
+        if error:
+            return error
+        queued = retry_failed(notification)
+        return Response({"message": "Failed recipients queued again", **queued}, status=status.HTTP_200_OK)
+
+
+
+class NotificationAudienceAPIView(APIView):
+    '''
+    Reports how many phones a notification would reach, without sending it.
+    Preview a saved notification (`notification`), or any selection: `regions`, `districts` and
+    `churches` (comma separated ids) with the `church_users`, `pastors`, `managers` and `overseers`
+    flags (true/false, default to those of a new notification). The count is that of the numbers
+    the broadcast would queue (normalized and deduplicated); selections are streamed by one query.
+    '''
+    permission_classes = [permissions.IsAuthenticated]
+    flags = {'church_users': 'include_church_users', 'pastors': 'include_pastors', 'managers': 'include_managers', 'overseers': 'include_overseers'}
+
+    def get(self, request):
+        if request.user.user_type == UserType.CHURCH_USER.value:
+            return Response({"message": "You are not allowed to preview notifications"}, status=status.HTTP_401_UNAUTHORIZED)
+
+        params = request.query_params
+        notification_id = params.get('notification')
+        if notification_id:
+            notification = Notification.objects.filter(id=notification_id).first() if notification_id.isdigit() else None
+            if not notification:
+                return Response({"message": "Notification not found"}, status=status.HTTP_404_NOT_FOUND)
+            count = count_recipients(target_phones(notification))
+            return Response({"target": notification.target, "count": count}, status=status.HTTP_200_OK)
+
+        try:
+            selection = {
+                name: [int(pk) for pk in params.get(name, '').split(',') if pk.strip()]
+                for name in ('regions', 'districts', 'churches')
+            }
+        except ValueError:
+            return Response({"message": "regions, districts and churches must be comma separated ids"}, status=status.HTTP_400_BAD_REQUEST)
+        audience = {
+            flag: params[flag].lower() in TRUE_VALUES if flag in params else Notification._meta.get_field(field).default
+            for flag, field in self.flags.items()
+        }
+        count = count_recipients(audience_phones(**selection, **audience).iterator(chunk_size=CHUNK_SIZE))
+        return Response({"target": Target.SELECTION.value, **selection, **audience, "count": count}, status=status.HTTP_200_OK)
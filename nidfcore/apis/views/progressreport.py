@@ -6,6 +6,7 @@ from apis.models import ProgressReport
 from apis.serializers import (AddProgressReportSerializer,
                               GetProgressReportSerializer)
 from nidfcore.utils.constants import ReportStatus, UserType
+from nidfcore.utils.pagination import list_response
 from nidfcore.utils.permissions import IsCentralAndSuperUser
 
 
@@ -15,24 +16,21 @@ class ProgressReportsAPIView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request, *args, **kwargs):
-        '''Get all progress reports'''
+        '''Get all progress reports - query budget: 5 queries (ETag validator, rows, churches, districts, regions) whatever the number of rows'''
         user = request.user
 
         if user.is_superuser or user.user_type == UserType.ADMIN.value:
             # superuser and admin can view all progress reports
             progress_reports = ProgressReport.objects.all().order_by('-created_at')
-            serializer = GetProgressReportSerializer(progress_reports, many=True)
-            return Response(serializer.data, status=status.HTTP_200_OK)
+            return list_response(request, progress_reports, GetProgressReportSerializer, ordering=('-created_at', '-id'))
         elif user.user_type == UserType.CHURCH_USER.value:
             # church users can only see progress reports belonging to their church
             progress_reports = ProgressReport.objects.filter(application__church=user.church_profile).order_by('-created_at')
-            serializer = GetProgressReportSerializer(progress_reports, many=True)
-            return Response(serializer.data, status=status.HTTP_200_OK)
+            return list_response(request, progress_reports, GetProgressReportSerializer, ordering=('-created_at', '-id'))
         else:
             # anyone else shouldn't see any progress reports
             progress_reports = ProgressReport.objects.none()
-            serializer = GetProgressReportSerializer(progress_reports, many=True)
-            return Response(serializer.data, status=status.HTTP_200_OK)
+            return list_response(request, progress_reports, GetProgressReportSerializer, ordering=('-created_at', '-id'))
         
     def post(self, request, *args, **kwargs):
         '''Create a new progress report'''
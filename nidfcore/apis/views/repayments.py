@@ -1,10 +1,15 @@
+from django.utils import timezone
+from django.utils.dateparse import parse_date
 from rest_framework import permissions, status
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from apis.models import Repayment
-from apis.serializers import AddRepaymentSerializer, GetRepaymentSerializer
+from apis.filters import RepaymentFilter
+from apis.models import Repayment, RepaymentInstallment
+from apis.schedules import overdue_installments
+from apis.serializers import AddRepaymentSerializer, GetRepaymentSerializer, RepaymentInstallmentSerializer
 from nidfcore.utils.constants import ApplicationStatus, UserType
+from nidfcore.utils.pagination import list_response
 from nidfcore.utils.permissions import IsCentralAndSuperUser
 
 
@@ -13,22 +18,19 @@ class RepaymensAPIView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request, *args, **kwargs):
-        '''Get all repayments'''
+        '''Get all repayments - query budget: 5 queries (ETag validator, rows, churches, districts, regions) whatever the number of rows'''
         # superuser, admin and finance officer can view all repayments
         user = request.user
         if user.is_superuser or user.user_type == UserType.ADMIN.value or user.user_type == UserType.FINANCE_OFFICER.value:
             repayments = Repayment.objects.all().order_by('-date_paid')
-            serializer = GetRepaymentSerializer(repayments, many=True)
-            return Response(serializer.data, status=status.HTTP_200_OK)
+            return list_response(request, repayments, GetRepaymentSerializer, ordering=('-date_paid', '-id'), filterset_class=RepaymentFilter)
         elif user.user_type == UserType.CHURCH_USER.value:
             # church users can only see repayments belonging to their church
             repayments = Repayment.objects.filter(application__church=user.church_profile).order_by('-date_paid', '-created_at')
-            serializer = GetRepaymentSerializer(repayments, many=True)
-            return Response(serializer.data, status=status.HTTP_200_OK)
+            return list_response(request, repayments, GetRepaymentSerializer, ordering=('-date_paid', '-id'), filterset_class=RepaymentFilter)
         else:
             repayments = Repayment.objects.none()
-            serializer = GetRepaymentSerializer(repayments, many=True)
-            return Response(serializer.data, status=status.HTTP_200_OK)
+            return list_response(request, repayments, GetRepaymentSerializer, ordering=('-date_paid', '-id'), filterset_class=RepaymentFilter)
 
 
     def post(self, request, *args, **kwargs):
@@ -123,4 +125,46 @@ class VerifyRepaymentAPIView(APIView):
         repayment.updated_by = user
         repayment.save()
 
-        return Response({"message": msg}, status=status.HTTP_200_OK)
\ No newline at end of file
+        return Response({"message": msg}, status=status.HTTP_200_OK)
+
+
+class RepaymentScheduleAPIView(APIView):
+    '''Endpoint to get the repayment schedule (installments) of an application'''
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        user = request.user
+        installments = RepaymentInstallment.objects.filter(
+            application__application_id=request.query_params.get('application')
+        ).select_related('application__church').order_by('number')
+        if not (user.is_superuser or user.user_type in [UserType.ADMIN.value, UserType.FINANCE_OFFICER.value]):
+            # church users can only see the schedules of their church
+            if user.church_profile is None:
+                return Response({"message": "User does not have a church profile"}, status=status.HTTP_400_BAD_REQUEST)
+            installments = installments.filter(application__church=user.church_profile)
+        serializer = RepaymentInstallmentSerializer(installments, many=True)
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+
+class OverdueInstallmentsAPIView(APIView):
+    '''Endpoint to get the overdue installments (optionally as of a date and within a region)'''
+    permission_classes = [IsCentralAndSuperUser]
+
+    def get(self, request, *args, **kwargs):
+        as_of = request.query_params.get('as_of')
+        try:
+            # parse_date returns None for malformed dates and raises for impossible ones (2025-02-30)
+            as_of = parse_date(as_of) if as_of else timezone.localdate()
+        except ValueError:
+            as_of = None
+        if as_of is None:
+            return Response({"message": "Dates must be valid YYYY-MM-DD dates"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            region_id = int(request.query_params['region']) if request.query_params.get('region') else None
+        except ValueError:
+            return Response({"message": "region must be an id"}, status=status.HTTP_400_BAD_REQUEST)
+        installments = overdue_installments(as_of).select_related('application__church').order_by('due_date')
+        if region_id:
+            installments = installments.filter(application__church__district__region_id=region_id)
+        serializer = RepaymentInstallmentSerializer(installments, many=True)
+        return Response(serializer.data, status=status.HTTP_200_OK)
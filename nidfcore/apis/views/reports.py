@@ -0,0 +1,53 @@
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from apis.aging import LEVELS, aging_rows, aging_totals, compute_aging
+from nidfcore.utils.permissions import IsCentralAndSuperUser
+
+
+class AgingReportAPIView(APIView):
+    '''Arrears aging report (current / 30 / 60 / 90+ days) per church, district or region'''
+    permission_classes = [IsCentralAndSuperUser]
+
+    max_page_size = 500
+
+    def get(self, request, *args, **kwargs):
+        '''
+        GET request. Query params: `level` (church, district or region), `region` id,
+        `as_of` (YYYY-MM-DD, defaults to today), `page` and `page_size`.
+        '''
+        level = request.query_params.get('level', 'church')
+        if level not in LEVELS:
+            return Response({"message": f"Level must be one of {', '.join(LEVELS)}"}, status=status.HTTP_400_BAD_REQUEST)
+        as_of = request.query_params.get('as_of')
+        try:
+            # parse_date returns None for malformed dates and raises for impossible ones (2025-13-01)
+            as_of = parse_date(as_of) if as_of else timezone.localdate()
+        except ValueError:
+            as_of = None
+        if as_of is None:
+            return Response({"message": "Dates must be valid YYYY-MM-DD dates"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            region_id = int(request.query_params['region']) if request.query_params.get('region') else None
+        except ValueError:
+            return Response({"message": "region must be an id"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            page = max(int(request.query_params.get('page', 1)), 1)
+            page_size = min(max(int(request.query_params.get('page_size', 50)), 1), self.max_page_size)
+        except ValueError:
+            return Response({"message": "page and page_size must be numbers"}, status=status.HTTP_400_BAD_REQUEST)
+
+        report = compute_aging(as_of, region_id=region_id)
+        start = (page - 1) * page_size
+        return Response({
+            "as_of": as_of,
+            "level": level,
+            "count": len(report[level][0]),
+            "page": page,
+            "page_size": page_size,
+            "totals": aging_totals(report),
+            "results": aging_rows(report, level, start, start + page_size),
+        }, status=status.HTTP_200_OK)
@@ -0,0 +1,34 @@
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from apis import search
+from nidfcore.utils.permissions import IsCentralAndSuperUser
+
+
+class SearchAPIView(APIView):
+    '''Ranked full-text search over applications, churches and progress reports'''
+    permission_classes = [IsCentralAndSuperUser]
+
+    max_limit = 100
+
+    def get(self, request, *args, **kwargs):
+        '''
+        GET request. Query params: `q` (words, matched as prefixes), `kind` (comma separated
+        application, church and/or progress_report; all by default) and `limit` (default 20).
+        '''
+        text = request.query_params.get('q', '').strip()
+        if not text:
+            return Response({"message": "Search text (q) is required"}, status=status.HTTP_400_BAD_REQUEST)
+        kinds = [kind for kind in request.query_params.get('kind', '').split(',') if kind]
+        if any(kind not in search.KINDS for kind in kinds):
+            return Response({"message": f"Kind must be one of {', '.join(search.KINDS)}"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = min(max(int(request.query_params.get('limit', 20)), 1), self.max_limit)
+        except ValueError:
+            return Response({"message": "limit must be a number"}, status=status.HTTP_400_BAD_REQUEST)
+        if not search.is_available():
+            return Response({"message": "Search is not available on this database"}, status=status.HTTP_501_NOT_IMPLEMENTED)
+
+        results = search.search(text, kinds=kinds or None, limit=limit)
+        return Response({"query": text, "count": len(results), "results": results}, status=status.HTTP_200_OK)
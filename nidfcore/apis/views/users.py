@@ -9,6 +9,7 @@ from accounts.models import OTP, User
 from apis.serializers import (AddChurchSerializer, LoginSerializer, RegisterUserSerializer, ResetPasswordSerializer,
                               UserSerializer)
 from nidfcore.utils.constants import UserType
+from nidfcore.utils.pagination import list_response
 
 import random
 
@@ -215,8 +216,7 @@ class UsersAPIView(APIView):
         else:
             # other users get only themselves
             users = User.objects.filter(id=user.id)
-        serializer = UserSerializer(users, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return list_response(request, users, UserSerializer, ordering=('-created_at', '-id'))
     
     
     def post(self, request):
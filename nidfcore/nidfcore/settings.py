@@ -1,6 +1,8 @@
 import os
+from importlib.util import find_spec
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -35,6 +37,7 @@ INSTALLED_APPS = [
     'rest_framework',
     'knox',
     'drf_spectacular',
+    'django_filters',
 
 ]
 
@@ -81,6 +84,53 @@ DATABASES = {
 }
 
 
+# Cache
+# Cached responses, their data versions (ETags) and the SMS worker metrics are shared by every
+# gunicorn worker and the SMS worker through redis (REDIS_URL), required unless DEBUG is on.
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
+    }
+elif not DEBUG:
+    raise ImproperlyConfigured(
+        "REDIS_URL is required when DEBUG is off: with a local-memory cache per process, "
+        "a write handled by one worker leaves the cached responses of the others stale"
+    )
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+SHARED_CACHE = bool(os.getenv('REDIS_URL'))
+
+# cached responses are invalidated by data versions, the timeout is only a safety net
+RESPONSE_CACHE_TIMEOUT = int(os.getenv('RESPONSE_CACHE_TIMEOUT', 60 * 60))
+# seconds data versions are kept (forever with a shared cache); a local-memory cache does not see the
+# versions bumped by the other processes, so its responses and versions are only trusted this long
+DATA_VERSION_TIMEOUT = None
+if not SHARED_CACHE:
+    DATA_VERSION_TIMEOUT = int(os.getenv('LOCAL_CACHE_TIMEOUT', 30))
+    RESPONSE_CACHE_TIMEOUT = min(RESPONSE_CACHE_TIMEOUT, DATA_VERSION_TIMEOUT)
+# how long (seconds) concurrent requests wait for the first one to build a response
+RESPONSE_CACHE_LOCK_WAIT = int(os.getenv('RESPONSE_CACHE_LOCK_WAIT', 10))
+# seconds the in-memory hierarchy (apis.hierarchy) is served before it is reloaded; without
+# a shared cache, how long a worker can miss the region/district/church writes of the others
+HIERARCHY_MAX_AGE = int(os.getenv('HIERARCHY_MAX_AGE', 60))
+
+# list endpoints: cursor pagination is opt-in (?cursor=, ?page_size=, ?paginate=true)
+# unless PAGINATE_LISTS is on, in which case ?paginate=false returns the full list
+PAGINATE_LISTS = os.getenv('PAGINATE_LISTS', 'False').lower() in ('1', 'true', 'yes')
+LIST_PAGE_SIZE = int(os.getenv('LIST_PAGE_SIZE', 50))
+LIST_MAX_PAGE_SIZE = int(os.getenv('LIST_MAX_PAGE_SIZE', 500))
+# hot lists (applications, repayments, disbursements, progress reports) are rendered from
+# .values() projections instead of a serializer per row; turn off to fall back to the serializers
+PROJECTED_LISTS = os.getenv('PROJECTED_LISTS', 'True').lower() in ('1', 'true', 'yes')
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -137,6 +187,12 @@ REST_FRAMEWORK = {
         'knox.auth.TokenAuthentication',
     ],
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
+    # orjson for JSON, MessagePack (Accept: application/msgpack) when msgpack is installed
+    'DEFAULT_RENDERER_CLASSES': [
+        'nidfcore.utils.renderers.ORJSONRenderer',
+        *(['nidfcore.utils.renderers.MessagePackRenderer'] if find_spec('msgpack') else []),
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
 }
 # knox - make token non-expiry
 REST_KNOX = {
@@ -170,4 +226,21 @@ DEFAULT_FROM_EMAIL = os.getenv('DEFAULT_FROM_MAIL')
 SENDER_ID = os.getenv('SMS_SENDER_ID') # 11 characters max
 
 # Get the key from .env file
-ARKESEL_API_KEY = os.getenv('ARKESEL_SMS_API_KEY')
\ No newline at end of file
+ARKESEL_API_KEY = os.getenv('ARKESEL_SMS_API_KEY')
+
+# sms gateway client (nidfcore.utils.services.SmsGateway), point SMS_GATEWAY_URL to a stand-in gateway in tests
+SMS_GATEWAY_URL = os.getenv('SMS_GATEWAY_URL', 'https://sms.arkesel.com')
+SMS_CONNECT_TIMEOUT = float(os.getenv('SMS_CONNECT_TIMEOUT', 3.05))
+SMS_READ_TIMEOUT = float(os.getenv('SMS_READ_TIMEOUT', 15))
+SMS_CONNECT_RETRIES = int(os.getenv('SMS_CONNECT_RETRIES', 2)) # connection failures only, nothing was sent
+SMS_BREAKER_THRESHOLD = int(os.getenv('SMS_BREAKER_THRESHOLD', 5)) # consecutive failures opening the circuit
+SMS_BREAKER_RESET = float(os.getenv('SMS_BREAKER_RESET', 30)) # seconds before a trial call is let through
+
+# sms outbox (apis.outbox): messages are queued by request handlers and sent by `manage.py run_sms_worker`
+SMS_WORKERS = int(os.getenv('SMS_WORKERS', 4)) # concurrent senders per worker process
+SMS_MAX_ATTEMPTS = int(os.getenv('SMS_MAX_ATTEMPTS', 6)) # dead-lettered after this many failed attempts
+SMS_RETRY_DELAY = int(os.getenv('SMS_RETRY_DELAY', 30)) # seconds before the first retry, doubled on every attempt
+SMS_RETRY_MAX_DELAY = int(os.getenv('SMS_RETRY_MAX_DELAY', 60 * 60))
+SMS_LEASE = int(os.getenv('SMS_LEASE', 5 * 60)) # seconds before a message claimed by a crashed worker is retried
+SMS_BATCH_SIZE = int(os.getenv('SMS_BATCH_SIZE', 1000)) # recipients per gateway request when broadcasting
+SMS_CALLBACK_TOKEN = os.getenv('SMS_CALLBACK_TOKEN') # shared with the gateway, delivery reports are refused without it
\ No newline at end of file
@@ -0,0 +1,75 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+_MISSING = object()
+
+
+def _version_key(model) -> str:
+    '''Returns the cache key holding the data version of a model'''
+    return f"data-version:{model._meta.label_lower}"
+
+
+def _new_version() -> int:
+    '''Returns a fresh version number that cannot collide with an evicted one'''
+    return time.time_ns() // 1000
+
+
+def bump_data_version(model) -> None:
+    '''Marks every cached response built from a model as stale'''
+    key = _version_key(model)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # the counter expired or was never set: start from a new, unseen value
+        cache.set(key, _new_version(), settings.DATA_VERSION_TIMEOUT)
+
+
+def get_data_versions(models) -> str:
+    '''Returns the combined data version of a list of models'''
+    keys = [_version_key(model) for model in models]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, _new_version(), settings.DATA_VERSION_TIMEOUT)
+            versions[key] = cache.get(key)
+    return '.'.join(str(versions[key]) for key in keys)
+
+
+def response_cache_key(endpoint: str, scope: str, params, models) -> str:
+    '''Builds the cache key of a response: endpoint, user scope, query params and data versions'''
+    query = '&'.join(f"{name}={value}" for name, value in sorted(params.items())) if params else ''
+    raw = f"{endpoint}|{scope}|{query}|{get_data_versions(models)}"
+    return f"response:{endpoint}:{hashlib.md5(raw.encode()).hexdigest()}"
+
+
+def single_flight(key: str, compute, timeout: int = None):
+    '''
+    Returns the cached value of a key, computing it when missing.
+    Only one caller computes a missing value; concurrent callers wait for it
+    (up to RESPONSE_CACHE_LOCK_WAIT seconds) instead of hitting the database.
+    '''
+    timeout = timeout or settings.RESPONSE_CACHE_TIMEOUT
+    value = cache.get(key, _MISSING)
+    if value is not _MISSING:
+        return value
+
+    lock = f"{key}:lock"
+    if cache.add(lock, 1, settings.RESPONSE_CACHE_LOCK_WAIT):
+        try:
+            value = compute()
+            cache.set(key, value, timeout)
+        finally:
+            cache.delete(lock)
+        return value
+
+    deadline = time.monotonic() + settings.RESPONSE_CACHE_LOCK_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(0.05)
+        value = cache.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+    # the first caller is taking too long (or failed): compute it ourselves
+    return compute()
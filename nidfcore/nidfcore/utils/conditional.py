@@ -0,0 +1,36 @@
+import hashlib
+
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+
+def make_etag(request, validator) -> str:
+    '''Builds the ETag of a response from its validator and what shapes the representation (params, user, Accept)'''
+    params = sorted(request.GET.lists())
+    raw = f"{request.path}|{params}|{request.user.pk}|{request.META.get('HTTP_ACCEPT', '')}|{validator}"
+    return quote_etag(hashlib.md5(raw.encode()).hexdigest())
+
+
+def queryset_validator(queryset, field: str = 'updated_at') -> tuple:
+    '''Returns the row count and last modification time of a queryset (1 aggregate query)'''
+    figures = queryset.aggregate(count=Count('pk'), last_modified=Max(field))
+    return figures['count'], figures['last_modified']
+
+
+def conditional_response(request, build, validator, last_modified=None):
+    '''
+    Answers If-None-Match / If-Modified-Since with a 304 when the validator did not change,
+    otherwise builds the response with `build()` and stamps it with ETag and Last-Modified.
+    '''
+    etag = make_etag(request, validator)
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+    if response is None:
+        response = build()
+    if response.status_code in (200, 304):
+        response['ETag'] = etag
+        if timestamp:
+            response['Last-Modified'] = http_date(timestamp)
+    patch_vary_headers(response, ['Accept', 'Authorization'])
+    return response
@@ -50,6 +50,22 @@ class Target(Enum):
     DISTRICT = 'DISTRICT'
     REGION = 'REGION'
     ALL = 'ALL'
+    SELECTION = 'SELECTION' # the selected regions, districts and churches
+
+class SmsStatus(Enum):
+    '''Defines the delivery statuses of queued SMS messages'''
+    PENDING = 'PENDING'
+    SENDING = 'SENDING'
+    SENT = 'SENT'
+    DEAD = 'DEAD'
+
+class DeliveryStatus(Enum):
+    '''Defines the delivery statuses of an SMS to one recipient'''
+    SENT = 'SENT' # accepted by the gateway
+    DELIVERED = 'DELIVERED'
+    FAILED = 'FAILED'
+    RETRIED = 'RETRIED' # failed, then queued again
+
 
 class ChurchType(Enum):
     '''Defines the types of churches in the system'''
@@ -95,3 +111,11 @@ class ConstLists:
         (nt.value, nt.value) for nt in Target
     ]
 
+    sms_statuses = [
+        (sms.value, sms.value) for sms in SmsStatus
+    ]
+
+    delivery_statuses = [
+        (delivery.value, delivery.value) for delivery in DeliveryStatus
+    ]
+
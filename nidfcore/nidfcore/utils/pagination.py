@@ -0,0 +1,156 @@
+import base64
+import json
+
+from django.conf import settings
+from django.db.models import Q
+from rest_framework import status
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from nidfcore.utils.cache import get_data_versions
+from nidfcore.utils.conditional import conditional_response, queryset_validator
+
+TRUE_VALUES = ('1', 'true', 'yes')
+
+
+class KeysetPagination:
+    '''
+    Cursor pagination over a unique ordering such as ('-created_at', '-id').
+    Each page is fetched with a WHERE clause on the last row of the previous one
+    (no OFFSET), so deep pages cost the same as the first one.
+    '''
+    cursor_param = 'cursor'
+    page_size_param = 'page_size'
+    paginate_param = 'paginate'
+
+    def __init__(self, ordering: tuple):
+        self.ordering = ordering
+        self.fields = [name.lstrip('-') for name in ordering]
+        self.page_size = settings.LIST_PAGE_SIZE
+        self.max_page_size = settings.LIST_MAX_PAGE_SIZE
+
+    def is_requested(self, request) -> bool:
+        '''Checks if a request opted in (or out, with ?paginate=false) of pagination'''
+        params = request.query_params
+        if self.paginate_param in params:
+            return params[self.paginate_param].lower() in TRUE_VALUES
+        return settings.PAGINATE_LISTS or self.cursor_param in params or self.page_size_param in params
+
+    def get_page_size(self, request) -> int:
+        '''Returns the requested page size, capped at LIST_MAX_PAGE_SIZE'''
+        try:
+            page_size = int(request.query_params.get(self.page_size_param, self.page_size))
+        except ValueError:
+            raise ValidationError({"message": "page_size must be a number"})
+        return min(max(page_size, 1), self.max_page_size)
+
+    def encode_cursor(self, instance) -> str:
+        '''Encodes the ordering values of a row (an instance or a .values() dict) into an opaque cursor'''
+        if isinstance(instance, dict):
+            values = [instance[field] for field in self.fields]
+        else:
+            values = [getattr(instance, field) for field in self.fields]
+        raw = json.dumps([value.isoformat() if hasattr(value, 'isoformat') else value for value in values])
+        return base64.urlsafe_b64encode(raw.encode()).decode()
+
+    def decode_cursor(self, queryset, cursor: str) -> list:
+        '''Decodes a cursor back into typed ordering values'''
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            if len(values) != len(self.fields):
+                raise ValueError
+            return [queryset.model._meta.get_field(field).to_python(value) for field, value in zip(self.fields, values)]
+        except Exception:
+            raise ValidationError({"message": "Invalid cursor"})
+
+    def seek(self, values: list) -> Q:
+        '''Builds the condition selecting the rows after the given ordering values'''
+        condition = Q()
+        equal = Q()
+        for name, field, value in zip(self.ordering, self.fields, values):
+            lookup = 'lt' if name.startswith('-') else 'gt'
+            condition |= equal & Q(**{f'{field}__{lookup}': value})
+            equal &= Q(**{field: value})
+        return condition
+
+    def paginate_queryset(self, queryset, request) -> list:
+        '''Returns the rows of the requested page'''
+        self.request = request
+        page_size = self.get_page_size(request)
+        queryset = queryset.order_by(*self.ordering)
+        cursor = request.query_params.get(self.cursor_param)
+        if cursor:
+            queryset = queryset.filter(self.seek(self.decode_cursor(queryset, cursor)))
+        rows = list(queryset[:page_size + 1])
+        self.next_cursor = self.encode_cursor(rows[page_size - 1]) if len(rows) > page_size else None
+        return rows[:page_size]
+
+    def get_next_link(self):
+        '''Returns the url of the next page, None on the last page'''
+        if self.next_cursor is None:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_param, self.next_cursor)
+
+    def get_paginated_data(self, data) -> dict:
+        '''Wraps a serialized page with the link to the next one'''
+        return {
+            "next": self.get_next_link(),
+            "cursor": self.next_cursor,
+            "results": data,
+        }
+
+
+def list_response(request, queryset, serializer_class, ordering: tuple, filterset_class=None) -> Response:
+    '''
+    Serializes a list endpoint, one keyset page at a time when pagination is requested.
+    The queryset goes through the serializer's `eager_load` (if any) so nested
+    relations are fetched in a fixed number of queries. Serializers that support
+    ?fields= and ?expand= (`from_request`) also restrict the loaded columns and joins,
+    and can side-load the church hierarchy once in an `included` section (?shape=normalized).
+    Unchanged polls are answered with a 304 after a single aggregate query (see conditional_response).
+    Serializers with a projection (see apis.projections) render the default shape from
+    .values() rows, without a model or serializer instance per row.
+    The query params of `filterset_class` filter the rows, and the total number of matching
+    rows (from the same aggregate query) is sent in the X-Total-Count header.
+    '''
+    if filterset_class is not None:
+        filterset = filterset_class(request.query_params, queryset=queryset, request=request)
+        if not filterset.is_valid():
+            return Response(filterset.errors, status=status.HTTP_400_BAD_REQUEST)
+        queryset = filterset.qs
+    paginator = KeysetPagination(ordering)
+    serializer = None
+    projection = None
+    related_models = []
+    if hasattr(serializer_class, 'from_request'):
+        serializer = serializer_class.from_request(request)
+        related_models = serializer.related_models()
+        projection = serializer.projection()
+    # rows: count + last update; nested objects: their data versions
+    count, last_modified = queryset_validator(queryset)
+    validator = (count, last_modified, get_data_versions(related_models) if related_models else '')
+
+    def build() -> Response:
+        rows = queryset
+        if projection is not None:
+            rows = projection.values(rows)
+        elif serializer is not None:
+            rows = serializer.optimize(rows, keep=paginator.fields)
+        elif hasattr(serializer_class, 'eager_load'):
+            rows = serializer_class.eager_load(rows)
+        paginated = paginator.is_requested(request)
+        if paginated:
+            rows = paginator.paginate_queryset(rows, request)
+        if projection is not None:
+            data = projection.render(rows)
+        elif serializer is not None:
+            data = serializer_class.from_request(request, rows, many=True).data
+        else:
+            data = serializer_class(rows, many=True).data
+        body = {"count": count, **paginator.get_paginated_data(data)} if paginated else data
+        if serializer is not None and serializer.normalized:
+            body = {**body, "included": serializer.included(rows)} if paginated else {"results": data, "included": serializer.included(rows)}
+        return Response(body, status=status.HTTP_200_OK, headers={'X-Total-Count': count})
+
+    return conditional_response(request, build, validator, last_modified=last_modified)
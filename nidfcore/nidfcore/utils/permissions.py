@@ -20,3 +20,15 @@ class IsCentralAndSuperUser(BasePermission):
         is_finance_officer = user.user_type == UserType.FINANCE_OFFICER.value
         is_admin_user = user.user_type == UserType.ADMIN.value
         return user.is_authenticated and (is_superuser or is_finance_officer or is_admin_user)
+
+
+class IsDivisionAndCentralUser(BasePermission):
+    """
+    Allows access only to superusers, central management and division users.
+    """
+    def has_permission(self, request, view):
+        user = request.user
+        if not user.is_authenticated:
+            return False
+        allowed_types = [UserType.ADMIN.value, UserType.FINANCE_OFFICER.value, UserType.DIVISION_USER.value]
+        return user.is_superuser or user.user_type in allowed_types
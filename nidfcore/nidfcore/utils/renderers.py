@@ -0,0 +1,43 @@
+import orjson
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import msgpack
+except ImportError:  # MessagePack responses are optional
+    msgpack = None
+
+# DRF's own fallbacks (Decimal -> float, dates -> ISO 8601, querysets -> lists, lazy strings...)
+# so every renderer encodes the types orjson does not handle natively exactly like JSONRenderer
+encode_default = JSONEncoder().default
+
+
+class ORJSONRenderer(JSONRenderer):
+    '''
+    Drop-in replacement of DRF's JSONRenderer backed by orjson.
+    Dicts, lists, strings, numbers and UUIDs are encoded natively; datetimes and
+    Decimals go through DRF's encoder so the output matches JSONRenderer's.
+    '''
+    options = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        options = self.options
+        if self.get_indent(accepted_media_type or '', renderer_context or {}):
+            options |= orjson.OPT_INDENT_2
+        return orjson.dumps(data, default=encode_default, option=options)
+
+
+class MessagePackRenderer(BaseRenderer):
+    '''Renders responses as MessagePack for clients sending `Accept: application/msgpack`'''
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=encode_default, use_bin_type=True)
+
@@ -1,25 +1,202 @@
 import array
+import re
+import threading
+import time
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 from nidfcore import settings
 
 
+def normalize_phone(phone: str, country_code: str = '233') -> str:
+    '''
+    Returns a phone number in international format without the + (e.g. 0244123456 -> 233244123456),
+    None when it cannot be a phone number (e.g. an email stored as phone).
+    '''
+    digits = re.sub(r'\D', '', phone or '')
+    if digits.startswith('00'):
+        digits = digits[2:]
+    elif digits.startswith('0') and len(digits) == 10:
+        digits = country_code + digits[1:]
+    elif len(digits) == 9:
+        digits = country_code + digits
+    return digits if 10 <= len(digits) <= 15 else None
+
+
+class SmsDeliveryError(Exception):
+    '''
+    Raised when the SMS gateway did not accept a message (`permanent`: retrying will not help,
+    `short_circuited`: the circuit was open, the gateway was not called)
+    '''
+
+    def __init__(self, message: str, permanent: bool = False, response: dict = None, short_circuited: bool = False):
+        super().__init__(message)
+        self.permanent = permanent
+        self.response = response
+        self.short_circuited = short_circuited
+
+
+class CircuitBreaker:
+    '''
+    Fails fast while the gateway is down: opens after `threshold` consecutive failures,
+    then lets a single trial call through every `reset_timeout` seconds until one succeeds.
+    '''
+
+    def __init__(self, threshold: int, reset_timeout: float):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        '''closed (calls go through), open (calls fail fast) or half-open (a trial call is allowed)'''
+        with self.lock:
+            if self.opened_at is None:
+                return 'closed'
+            if self.trial or time.monotonic() - self.opened_at < self.reset_timeout:
+                return 'open'
+            return 'half-open'
+
+    def allow(self) -> bool:
+        '''Checks if a call may go through (taking the trial call when half-open)'''
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if self.trial or time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            self.trial = True
+            return True
+
+    def success(self) -> None:
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial = False
+
+    def failure(self) -> None:
+        with self.lock:
+            self.failures += 1
+            self.trial = False
+            if self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+
+
+class GatewayMetrics:
+    '''Thread-safe latency, error and throughput counters of a gateway client'''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.sent = self.rejected = self.failed = self.short_circuited = 0
+        self.latency_total = self.latency_max = 0.0
+
+    def record(self, outcome: str, latency: float = 0.0) -> None:
+        '''Counts a call: sent, rejected (permanent failure), failed (transient) or short_circuited'''
+        with self.lock:
+            setattr(self, outcome, getattr(self, outcome) + 1)
+            self.latency_total += latency
+            self.latency_max = max(self.latency_max, latency)
+
+    def snapshot(self) -> dict:
+        '''Returns the counters and the derived rates'''
+        with self.lock:
+            calls = self.sent + self.rejected + self.failed
+            uptime = max(time.time() - self.started, 1e-9)
+            return {
+                "sent": self.sent,
+                "rejected": self.rejected,
+                "failed": self.failed,
+                "short_circuited": self.short_circuited,
+                "error_rate": round((self.rejected + self.failed) / calls, 4) if calls else 0,
+                "latency_avg_ms": round(self.latency_total / calls * 1000, 1) if calls else 0,
+                "latency_max_ms": round(self.latency_max * 1000, 1),
+                "sent_per_minute": round(self.sent / uptime * 60, 2),
+                "since": self.started,
+            }
+
+
+class SmsGateway:
+    '''
+    Client of the Arkesel SMS API. Connections are pooled and kept alive, every call is
+    bounded by connect/read timeouts, connection failures (nothing was sent yet) are
+    retried a few times, and a circuit breaker fails fast while the gateway is down.
+    '''
+    send_path = '/api/v2/sms/send'
+
+    def __init__(self, base_url: str = None, api_key: str = None, pool_size: int = None):
+        self.base_url = (base_url or settings.SMS_GATEWAY_URL).rstrip('/')
+        self.timeout = (settings.SMS_CONNECT_TIMEOUT, settings.SMS_READ_TIMEOUT)
+        self.breaker = CircuitBreaker(settings.SMS_BREAKER_THRESHOLD, settings.SMS_BREAKER_RESET)
+        self.metrics = GatewayMetrics()
+        # a POST is not idempotent: only retry when the connection could not be made
+        retries = Retry(total=None, connect=settings.SMS_CONNECT_RETRIES, read=0, status=0, other=0, redirect=0, backoff_factor=0.2)
+        pool_size = pool_size or settings.SMS_WORKERS
+        self.session = requests.Session()
+        self.session.mount(self.base_url, HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retries))
+        self.session.headers.update({
+            "api-key": api_key or settings.ARKESEL_API_KEY or '',
+            'Content-Type': 'application/json',
+            'Accept': 'application/json',
+        })
+
+    def send(self, message: str, recipients: list, sender: str = None) -> dict:
+        '''Sends an SMS and returns the gateway response; raises SmsDeliveryError when it was not accepted'''
+        if not self.breaker.allow():
+            self.metrics.record('short_circuited')
+            raise SmsDeliveryError("Gateway circuit open, not sending", short_circuited=True)
+        payload = {
+            "sender": sender or settings.SENDER_ID,
+            "message": message,
+            "recipients": list(recipients),
+        }
+        start = time.monotonic()
+        try:
+            response = self.session.post(f"{self.base_url}{self.send_path}", json=payload, timeout=self.timeout)
+        except requests.RequestException as e:
+            self.breaker.failure()
+            self.metrics.record('failed', time.monotonic() - start)
+            raise SmsDeliveryError(f"Gateway unreachable: {e}")
+        latency = time.monotonic() - start
+        try:
+            body = response.json()
+        except ValueError:
+            body = {"body": response.text[:500]}
+        if response.status_code == 429 or response.status_code >= 500:
+            self.breaker.failure()
+            self.metrics.record('failed', latency)
+            raise SmsDeliveryError(f"Gateway error {response.status_code}", response=body)
+        # the gateway answered: it is up, even when it rejects the message
+        self.breaker.success()
+        if response.status_code >= 400:
+            # rejected (bad key, sender id or recipients): the same request would be rejected again
+            self.metrics.record('rejected', latency)
+            raise SmsDeliveryError(f"Rejected by the gateway ({response.status_code})", permanent=True, response=body)
+        self.metrics.record('sent', latency)
+        return body
+
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+
+def get_gateway() -> SmsGateway:
+    '''Returns the gateway client of this process, created on first use'''
+    global _gateway
+    with _gateway_lock:
+        if _gateway is None:
+            _gateway = SmsGateway()
+        return _gateway
+
+
 def send_sms(message: str, recipients: array.array, sender: str = settings.SENDER_ID):
-    '''Sends an SMS to the specified recipients'''
-    header = {"api-key": settings.ARKESEL_API_KEY, 'Content-Type': 'application/json',
-              'Accept': 'application/json'}
-    SEND_SMS_URL = "https://sms.arkesel.com/api/v2/sms/send"
-    payload = {
-        "sender": sender,
-        "message": message,
-        "recipients": recipients
-    } 
-    try:
-        response = requests.post(SEND_SMS_URL, headers=header, json=payload)
-    except Exception as e:
-        print(f"Error: {e}")
-        return False
-    else:
-        print(response.json())
-        return response.json()
\ No newline at end of file
+    '''
+    Sends an SMS to the specified recipients right away and returns the gateway response.
+    Request handlers should queue messages with SmsOutbox.queue instead, the
+    outbox worker (`manage.py run_sms_worker`) delivers them with this function.
+    '''
+    return get_gateway().send(message, recipients, sender)